@@ -1,13 +1,90 @@
-from django.contrib import admin
-from .models import Category, Announcement, Reservation, Transaction
+import os
+
+from django.conf import settings
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.db import DEFAULT_DB_ALIAS
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
+from django.urls import path, reverse
+from django.utils import timezone
+from django.utils.html import format_html
+from .cache import invalidate_categories
+from .models import Category, Announcement, ArchivedAnnouncement, \
+    Reservation, Transaction, Job, RequestProfile, STATUS
+from .pagination import EstimatedCountPaginator
+from .sharding import is_sharded, on_shard, related, shard_for_id
+
+
+class ShardListFilter(admin.SimpleListFilter):
+    """
+    Choose shard which rows are listed, default database if none.
+    """
+    title = 'baza danych'
+    parameter_name = 'shard'
+
+    def lookups(self, request, model_admin):
+        return [(alias, alias) for alias in settings.DATABASE_SHARDS]
+
+    def choices(self, changelist):
+        # Rows of all shards can not be listed together.
+        current = self.value() or DEFAULT_DB_ALIAS
+        for alias, title in self.lookup_choices:
+            yield {
+                'selected': current == alias,
+                'query_string': changelist.get_query_string(
+                    {self.parameter_name: alias}),
+                'display': title,
+            }
+
+    def queryset(self, request, queryset):
+        # Shard is picked by ShardedModelAdmin.get_queryset.
+        return queryset
+
+
+class ShardedModelAdmin(admin.ModelAdmin):
+    """
+    Admin of model stored on shards (see craigslist.sharding). Changelist
+    and its actions work on one shard chosen by filter, single rows are
+    read from shard of their id and saved there.
+    """
+    def get_shard(self, request):
+        match = request.resolver_match
+        if match is not None and 'object_id' in match.kwargs:
+            return shard_for_id(match.kwargs['object_id'])
+        alias = request.GET.get(ShardListFilter.parameter_name)
+        if alias in settings.DATABASE_SHARDS:
+            return alias
+        return DEFAULT_DB_ALIAS
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        alias = self.get_shard(request)
+        if alias == DEFAULT_DB_ALIAS:
+            return queryset
+        # Users live on default database, they are prefetched instead.
+        return related(on_shard(queryset, alias),
+                       *self.list_select_related or ())
+
+    def get_list_select_related(self, request):
+        if self.get_shard(request) == DEFAULT_DB_ALIAS:
+            return super().get_list_select_related(request)
+        return ()
+
+    def get_list_filter(self, request):
+        list_filter = super().get_list_filter(request)
+        if is_sharded():
+            return (ShardListFilter, *list_filter)
+        return list_filter
+
 
 admin.site.register(Category)
-admin.site.register(Reservation)
-admin.site.register(Transaction)
+admin.site.register(Reservation, ShardedModelAdmin)
+admin.site.register(Transaction, ShardedModelAdmin)
 
 
 @admin.register(Announcement)
-class AnnouncementAdmin(admin.ModelAdmin):
+class AnnouncementAdmin(ShardedModelAdmin):
     """
     Configure Announcement Admin view, add fields to
     display and field to filter by.
@@ -15,3 +92,109 @@ class AnnouncementAdmin(admin.ModelAdmin):
     list_display = ('title', 'user_who_added',
                     'status', 'created_at', 'updated_at',)
     list_filter = ('status',)
+    list_select_related = ('user_who_added',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    actions = ('accept', 'reject', 'archive',)
+
+    def change_status(self, request, queryset, from_statuses, to_status):
+        """
+        Change status of selected announcements with single UPDATE,
+        skip announcements which can not be moved to to_status.
+        """
+        updated = queryset.filter(status__in=from_statuses).update(
+            status=to_status, updated_at=timezone.now()
+        )
+        invalidate_categories()
+        self.message_user(
+            request,
+            'Zmieniono status {} ogłoszeń na "{}"'.format(
+                updated, dict(STATUS)[to_status]),
+            messages.SUCCESS,
+        )
+
+    @admin.action(description='Zaakceptuj zaznaczone ogłoszenia')
+    def accept(self, request, queryset):
+        self.change_status(request, queryset, (1, 3), 2)
+
+    @admin.action(description='Odrzuć zaznaczone ogłoszenia')
+    def reject(self, request, queryset):
+        self.change_status(request, queryset, (1, 2), 3)
+
+    @admin.action(description='Zarchiwizuj zaznaczone ogłoszenia')
+    def archive(self, request, queryset):
+        self.change_status(request, queryset, (2, 3, 5), 6)
+
+
+@admin.register(ArchivedAnnouncement)
+class ArchivedAnnouncementAdmin(ShardedModelAdmin):
+    """
+    Configure ArchivedAnnouncement Admin view to look up announcements
+    moved out of announcements table.
+    """
+    list_display = ('id', 'title', 'user_who_added', 'status',
+                    'created_at', 'archived_at',)
+    list_filter = ('status',)
+    list_select_related = ('user_who_added',)
+    search_fields = ('=id', 'title',)
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """
+    Configure Job Admin view to inspect background jobs queue.
+    """
+    list_display = ('task', 'status', 'attempts', 'run_after',
+                    'locked_until', 'created_at',)
+    list_filter = ('status', 'task',)
+    readonly_fields = ('last_error',)
+
+
+@admin.register(RequestProfile)
+class RequestProfileAdmin(admin.ModelAdmin):
+    """
+    Configure RequestProfile Admin view to browse and download
+    profiles of requests.
+    """
+    list_display = ('created_at', 'method', 'path', 'view_name', 'mode',
+                    'duration_ms', 'user', 'download_link',)
+    list_filter = ('mode', 'view_name',)
+    list_select_related = ('user',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def get_urls(self):
+        return [
+            path('<int:pk>/download/',
+                 self.admin_site.admin_view(self.download),
+                 name='craigslist_requestprofile_download'),
+        ] + super().get_urls()
+
+    @admin.display(description='Plik')
+    def download_link(self, profile):
+        return format_html(
+            '<a href="{}">{}</a>',
+            reverse('admin:craigslist_requestprofile_download',
+                    args=(profile.pk,)),
+            os.path.basename(profile.file.name),
+        )
+
+    def download(self, request, pk):
+        """
+        Return profile file as attachment.
+        """
+        if not self.has_view_permission(request):
+            raise PermissionDenied
+        profile = get_object_or_404(RequestProfile, pk=pk)
+        try:
+            file = profile.file.open('rb')
+        except FileNotFoundError:
+            raise Http404('Plik profilu nie istnieje')
+        return FileResponse(file, as_attachment=True,
+                            filename=os.path.basename(profile.file.name))
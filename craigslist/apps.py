@@ -7,3 +7,9 @@ class CraigslistConfig(AppConfig):
     """
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'craigslist'
+
+    def ready(self):
+        """
+        Connect signal receivers and register checks
+        """
+        from . import checks, signals  # noqa: F401
@@ -0,0 +1,58 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .models import Announcement, ArchivedAnnouncement, \
+    ArchivedReservation, Reservation
+
+# Rejected, sold and archived announcements never come back to feeds.
+ARCHIVED_STATUSES = (3, 5, 6)
+
+
+def archive_cutoff(days=None):
+    """
+    Return time before which announcements had to change last to be
+    archived, ARCHIVE_AFTER_DAYS ago by default.
+    """
+    if days is None:
+        days = settings.ARCHIVE_AFTER_DAYS
+    return timezone.now() - timedelta(days=days)
+
+
+def archive_batch(older_than, batch_size, using=DEFAULT_DB_ALIAS):
+    """
+    Move up to batch_size announcements in ARCHIVED_STATUSES, not changed
+    since older_than, with their reservations to archive tables of the
+    same shard in one transaction. Rows locked by other transactions are
+    skipped. Return number of moved announcements.
+    """
+    with transaction.atomic(using=using):
+        ids = list(
+            Announcement.objects.using(using)
+            .select_for_update(skip_locked=True)
+            .filter(status__in=ARCHIVED_STATUSES, updated_at__lt=older_than)
+            .order_by('updated_at', 'id')
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return 0
+        ArchivedAnnouncement.objects.using(using).bulk_create([
+            ArchivedAnnouncement.from_announcement(announcement)
+            for announcement in Announcement.objects.using(using).filter(
+                pk__in=ids)
+        ])
+        reservations = Reservation.objects.using(using).filter(
+            announcement_id__in=ids)
+        ArchivedReservation.objects.using(using).bulk_create([
+            ArchivedReservation(
+                id=reservation.id,
+                announcement_id=reservation.announcement_id,
+                reserved_by_user_id=reservation.reserved_by_user_id,
+            )
+            for reservation in reservations
+        ])
+        reservations.delete()
+        Announcement.objects.using(using).filter(pk__in=ids).delete()
+    return len(ids)
@@ -0,0 +1,107 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.template.response import TemplateResponse
+
+from .views import AnnouncementListView, CategoryAnnouncementView, \
+    AnnouncementDetailView, UserReservationsView
+
+
+class AsyncViewMixin:
+    """
+    Mark class based view as coroutine, so async handler awaits it
+    in the event loop (Django 4.0 supports only async function views).
+    """
+    @classmethod
+    def as_view(cls, **initkwargs):
+        view = super().as_view(**initkwargs)
+        view._is_coroutine = asyncio.coroutines._is_coroutine
+        return view
+
+    async def http_method_not_allowed(self, request, *args, **kwargs):
+        return super().http_method_not_allowed(request, *args, **kwargs)
+
+    async def options(self, request, *args, **kwargs):
+        return super().options(request, *args, **kwargs)
+
+
+class AsyncLoginRequiredMixin(LoginRequiredMixin):
+    """
+    Verify that the current user is authenticated without blocking
+    event loop on session and user queries.
+    """
+    async def dispatch(self, request, *args, **kwargs):
+        is_authenticated = await sync_to_async(
+            lambda: request.user.is_authenticated
+        )()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super(LoginRequiredMixin, self).dispatch(
+            request, *args, **kwargs
+        )
+
+
+class AsyncAnnouncementListView(AsyncViewMixin, AnnouncementListView):
+    """
+    Display list all announcements with status = 2 ('zaakceptowane')
+    when served by ASGI.
+    """
+    async def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests: to display announcements list.
+        """
+        not_modified = await sync_to_async(self.conditional_get)()
+        if not_modified is not None:
+            return not_modified
+        self.object_list = self.get_queryset()
+        context = await sync_to_async(self.get_context_data)()
+        return self.add_validators(self.render_to_response(context))
+
+
+class AsyncCategoryAnnouncementView(AsyncViewMixin,
+                                    CategoryAnnouncementView):
+    """
+    Display list all announcements filter by category when served by ASGI.
+    """
+    async def get(self, request, category_id):
+        """
+        Handle GET requests: to display category announcements list.
+        """
+        not_modified = await sync_to_async(self.conditional_get)()
+        if not_modified is not None:
+            return not_modified
+        context = await sync_to_async(self.get_context)(category_id)
+        return self.add_validators(
+            TemplateResponse(request, self.template_name, context)
+        )
+
+
+class AsyncAnnouncementDetailView(AsyncViewMixin, AnnouncementDetailView):
+    """
+    Display view single announcement when served by ASGI.
+    """
+    async def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests: to display announcement.
+        """
+        not_modified = await sync_to_async(self.conditional_get)()
+        if not_modified is not None:
+            return not_modified
+        self.object = await sync_to_async(self.get_object)()
+        context = self.get_context_data(object=self.object)
+        return self.add_validators(self.render_to_response(context))
+
+
+class AsyncUserReservationsView(AsyncViewMixin, AsyncLoginRequiredMixin,
+                                UserReservationsView):
+    """
+    Display list all announcements filter by reserved_by_user
+    when served by ASGI.
+    """
+    async def get(self, request):
+        """
+        Handle GET requests: to display user reservations list.
+        """
+        context = self.get_context(request.user)
+        return TemplateResponse(request, self.template_name, context)
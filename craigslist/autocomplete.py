@@ -0,0 +1,154 @@
+import hashlib
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import OperationalError, connections
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .cache import get_categories
+from .metrics import cache_lookup
+from .models import Announcement
+from .pool import statement_timeout
+from .search import WORD, search, search_document, strip_diacritics
+from .sharding import scatter
+
+logger = logging.getLogger(__name__)
+
+AUTOCOMPLETE_KEY = 'craigslist:autocomplete:{}:{}'
+
+# Shorter prefixes match too much to be useful.
+MIN_PREFIX_LENGTH = 2
+
+# Share of prefix trigrams which must occur in suggestion, as
+# pg_trgm.word_similarity_threshold.
+SIMILARITY_THRESHOLD = 0.6
+
+
+def normalize(text):
+    """
+    Return lower case words of text without diacritics, single space
+    separated.
+    """
+    return ' '.join(strip_diacritics(word)
+                    for word in WORD.findall(text.lower()))
+
+
+def trigrams(text):
+    """
+    Return set of trigrams of words in text, padded like in pg_trgm:
+    two spaces before and one after every word.
+    """
+    grams = set()
+    for word in normalize(text).split():
+        padded = '  {} '.format(word)
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def word_similarity(prefix, text):
+    """
+    Return share of trigrams of prefix found in text, from 0 to 1.
+    Last word of prefix is not finished yet, so its closing trigram
+    is not required.
+    """
+    wanted = trigrams(prefix)
+    words = normalize(prefix).split()
+    if words:
+        wanted.discard('{} '.format(words[-1][-2:]))
+    if not wanted:
+        return 0.0
+    return len(wanted & trigrams(text)) / len(wanted)
+
+
+def suggest(prefix, limit):
+    """
+    Return dict with up to limit titles of accepted announcements and
+    categories similar to typed prefix, best first.
+
+    Results are cached for AUTOCOMPLETE_CACHE_TIMEOUT seconds, so
+    prefixes typed by many users at once are looked up once.
+    """
+    prefix = normalize(prefix)
+    if len(prefix) < MIN_PREFIX_LENGTH:
+        return {'titles': [], 'categories': []}
+    key = AUTOCOMPLETE_KEY.format(
+        limit, hashlib.md5(prefix.encode()).hexdigest()
+    )
+    suggestions = cache.get(key)
+    cache_lookup('autocomplete', suggestions is not None)
+    if suggestions is None:
+        suggestions = {
+            'titles': suggest_titles(prefix, limit),
+            'categories': suggest_categories(prefix, limit),
+        }
+        cache.set(key, suggestions, settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+    return suggestions
+
+
+def suggest_titles(prefix, limit):
+    """
+    Return list of distinct titles of accepted announcements similar
+    to prefix.
+
+    PostgreSQL finds titles with pg_trgm word similarity of stems, so
+    typos are tolerated, using GIN trigram index of search_title of
+    accepted announcements. Other databases find titles by full-text
+    search of stems of prefix, ordered by trigram similarity. Candidates
+    of all shards are ranked together.
+    """
+    titles = []
+    for accepted in scatter(Announcement.objects.filter(status=2)):
+        # Suggestions which are late are useless, shards which do not
+        # answer in AUTOCOMPLETE_STATEMENT_TIMEOUT_MS are skipped.
+        accepted = accepted.using(accepted.db)
+        try:
+            with statement_timeout(settings.AUTOCOMPLETE_STATEMENT_TIMEOUT_MS,
+                                   using=accepted.db):
+                titles.extend(candidate_titles(accepted, prefix, limit))
+        except OperationalError:
+            logger.warning('Autocomplete of %r on %s timed out', prefix,
+                           accepted.db, exc_info=True)
+    # Several announcements can have the same title.
+    titles = sorted(dict.fromkeys(titles),
+                    key=lambda title: -word_similarity(prefix, title))
+    return titles[:limit]
+
+
+def candidate_titles(accepted, prefix, limit):
+    """
+    Return titles of accepted announcements of single shard similar to
+    prefix, best first.
+    """
+    if connections[accepted.db].vendor == 'postgresql':
+        # Stems are compared, so inflection and diacritics do not matter.
+        stems = search_document(prefix)
+        table = '"{}"'.format(Announcement._meta.db_table)
+        candidates = accepted.filter(RawSQL(
+            '%s <%% {}."search_title"'.format(table), [stems],
+            output_field=BooleanField(),
+        )).annotate(similarity=RawSQL(
+            'word_similarity(%s, {}."search_title")'.format(table), [stems],
+            output_field=FloatField(),
+        )).order_by('-similarity', '-id')
+    else:
+        candidates = search(accepted, prefix, title_only=True).order_by(
+            '-rank', '-id')
+    return candidates.values_list('title', flat=True)[:limit * 3]
+
+
+def suggest_categories(prefix, limit):
+    """
+    Return list of (id, name) of categories similar to prefix, from
+    categories cached in process memory.
+    """
+    scored = [
+        (word_similarity(prefix, category.category_name), category)
+        for category in get_categories()
+    ]
+    scored = [(score, category) for score, category in scored
+              if score >= SIMILARITY_THRESHOLD]
+    scored.sort(key=lambda item: (-item[0], item[1].id))
+    return [(category.id, category.category_name)
+            for _, category in scored[:limit]]
@@ -0,0 +1,139 @@
+import functools
+import time
+
+import psycopg2.extensions
+import psycopg2.extras
+from django.db.backends.postgresql import base, creation
+from django.utils.asyncio import async_unsafe
+
+from craigslist.pool import ConnectionPool, PoolTimeout, close_pools, \
+    get_pool
+
+Database = base.Database
+
+IDLE = psycopg2.extensions.TRANSACTION_STATUS_IDLE
+
+
+def connect(conn_params, options):
+    """
+    Open new connection like Django backend does.
+    """
+    connection = Database.connect(**conn_params)
+    isolation_level = options.get('isolation_level')
+    if isolation_level is not None and \
+            isolation_level != connection.isolation_level:
+        connection.set_session(isolation_level=isolation_level)
+    psycopg2.extras.register_default_jsonb(conn_or_curs=connection,
+                                           loads=lambda x: x)
+    return connection
+
+
+def is_healthy(connection):
+    """
+    Return True if connection answers simple query.
+    """
+    if connection.closed:
+        return False
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+        if connection.get_transaction_status() != IDLE:
+            connection.rollback()
+    except Database.Error:
+        return False
+    return True
+
+
+class DatabaseCreation(creation.DatabaseCreation):
+    def _destroy_test_db(self, test_database_name, verbosity):
+        # Database with idle pooled connections can not be dropped.
+        close_pools(self.connection.alias)
+        super()._destroy_test_db(test_database_name, verbosity)
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL backend with optional settings of database:
+
+    POOL: {'MAX_SIZE': n, 'TIMEOUT': seconds} takes connections from
+        process-wide pool of up to n connections (see craigslist.pool)
+        and returns them there instead of closing, waits up to TIMEOUT
+        seconds when all are in use. Use with CONN_MAX_AGE = 0.
+    HEALTH_CHECK_INTERVAL: connections unused for so many seconds are
+        checked before use, broken ones are replaced.
+    STATEMENT_TIMEOUT: statements running longer than so many
+        milliseconds are cancelled, 0 disables the limit.
+    """
+    creation_class = DatabaseCreation
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._pool = None
+        self._checked_at = None
+
+    def get_connection_params(self):
+        conn_params = super().get_connection_params()
+        timeout = self.settings_dict.get('STATEMENT_TIMEOUT')
+        if timeout:
+            conn_params['options'] = ' '.join(filter(None, [
+                conn_params.get('options'),
+                '-c statement_timeout={}'.format(int(timeout)),
+            ]))
+        return conn_params
+
+    @async_unsafe
+    def get_new_connection(self, conn_params):
+        self._checked_at = time.monotonic()
+        pool_settings = self.settings_dict.get('POOL') or {}
+        if not pool_settings.get('MAX_SIZE'):
+            self._pool = None
+            return super().get_new_connection(conn_params)
+        options = self.settings_dict['OPTIONS']
+        pool = get_pool(self.alias, conn_params, functools.partial(
+            ConnectionPool,
+            self.alias,
+            functools.partial(connect, conn_params, options),
+            is_healthy,
+            max_size=pool_settings['MAX_SIZE'],
+            timeout=pool_settings.get('TIMEOUT', 30),
+            health_check_interval=self.settings_dict.get(
+                'HEALTH_CHECK_INTERVAL', 0),
+        ))
+        try:
+            connection = pool.checkout()
+        except PoolTimeout as exc:
+            raise Database.OperationalError(str(exc)) from exc
+        self.isolation_level = options.get('isolation_level',
+                                           connection.isolation_level)
+        self._pool = pool
+        return connection
+
+    @async_unsafe
+    def _close(self):
+        if self._pool is None:
+            return super()._close()
+        pool, self._pool = self._pool, None
+        connection, reusable = self.connection, False
+        # Connection goes back clean, changes of unfinished transaction
+        # are dropped as they would be by closing it.
+        try:
+            if not connection.closed:
+                if connection.get_transaction_status() != IDLE:
+                    connection.rollback()
+                reusable = connection.get_transaction_status() == IDLE
+        except Database.Error:
+            pass
+        pool.checkin(connection, reusable=reusable)
+
+    def close_if_unusable_or_obsolete(self):
+        super().close_if_unusable_or_obsolete()
+        # Pooled connections are checked by pool when taken out.
+        interval = self.settings_dict.get('HEALTH_CHECK_INTERVAL')
+        if self.connection is None or self._pool is not None or \
+                interval is None or self.in_atomic_block:
+            return
+        now = time.monotonic()
+        if now - self._checked_at >= interval:
+            self._checked_at = now
+            if not self.is_usable():
+                self.close()
@@ -0,0 +1,152 @@
+import uuid
+from decimal import Decimal
+
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import transaction
+from django.db.models import Case, Count, IntegerField, Q, Value, When
+
+from .metrics import cache_lookup
+from .models import Announcement, Category
+from .routers import use_primary
+from .sharding import is_sharded, scatter
+
+CATEGORIES_VERSION_KEY = 'craigslist:categories:version'
+CATEGORIES_KEY = 'craigslist:categories:{}'
+PRICE_FACETS_KEY = 'craigslist:price-facets:{}'
+
+# Lower bounds of price ranges counted on category pages, the last
+# range has no upper bound.
+PRICE_BUCKETS = tuple(Decimal(bound) for bound in
+                      (0, 50, 200, 1000, 5000, 20000))
+
+_process_categories = {'version': None, 'categories': None}
+
+
+def get_categories():
+    """
+    Return list of categories annotated with accepted_count.
+
+    List is kept in the process memory and in the shared cache under
+    the current version, so rendering navbar does not query database
+    until categories or accepted announcements change.
+    """
+    version = get_categories_version()
+    snapshot = _process_categories
+    cache_lookup('categories_process', snapshot['version'] == version)
+    if snapshot['version'] == version:
+        return snapshot['categories']
+
+    key = CATEGORIES_KEY.format(version)
+    categories = cache.get(key)
+    cache_lookup('categories_shared', categories is not None)
+    if categories is None:
+        # Replica could still miss changes which bumped the version.
+        with use_primary():
+            categories = _load_categories()
+        cache.set(key, categories, settings.CATEGORIES_CACHE_TIMEOUT)
+    _process_categories.update(version=version, categories=categories)
+    return categories
+
+
+def _load_categories():
+    """
+    Return categories with accepted_count, counted on every shard if
+    announcements are sharded.
+    """
+    if not is_sharded():
+        return list(Category.objects.annotate(
+            accepted_count=Count(
+                'announcement', filter=Q(announcement__status=2)
+            )
+        ).order_by('id'))
+    counts = {}
+    for rows in scatter(Announcement.objects.filter(status=2).values_list(
+            'category_id').annotate(count=Count('id')).order_by()):
+        for category_id, count in rows:
+            counts[category_id] = counts.get(category_id, 0) + count
+    categories = list(Category.objects.order_by('id'))
+    for category in categories:
+        category.accepted_count = counts.get(category.id, 0)
+    return categories
+
+
+def get_price_facets():
+    """
+    Return dict mapping category id to list of accepted announcements
+    counts in every PRICE_BUCKETS range.
+
+    All counts come from single grouped query per shard, cached under
+    the current categories version, so they are computed again only
+    after accepted announcements change.
+    """
+    key = PRICE_FACETS_KEY.format(get_categories_version())
+    facets = cache.get(key)
+    cache_lookup('price_facets', facets is not None)
+    if facets is None:
+        bucket = Case(
+            *[When(price__lt=upper, then=Value(index))
+              for index, upper in enumerate(PRICE_BUCKETS[1:])],
+            default=Value(len(PRICE_BUCKETS) - 1),
+            output_field=IntegerField(),
+        )
+        rows = Announcement.objects.filter(status=2).annotate(
+            bucket=bucket
+        ).values_list('category_id', 'bucket').annotate(
+            count=Count('id')
+        ).order_by()
+        facets = {}
+        # Rows are fetched here, from primary like categories.
+        with use_primary():
+            for shard_rows in scatter(rows):
+                for category_id, index, count in shard_rows:
+                    counts = facets.setdefault(category_id,
+                                               [0] * len(PRICE_BUCKETS))
+                    counts[index] += count
+        cache.set(key, facets, settings.CATEGORIES_CACHE_TIMEOUT)
+    return facets
+
+
+def get_categories_version():
+    """
+    Return version of cached categories, it changes with every
+    invalidation.
+    """
+    return cache.get_or_set(CATEGORIES_VERSION_KEY, _new_version,
+                            timeout=_version_timeout())
+
+
+def invalidate_categories(using=None):
+    """
+    Drop cached categories and price facets now and once more after
+    transaction on database (shard) using commits, so other processes
+    can not cache rows which are not committed yet.
+    """
+    _bump_version()
+    transaction.on_commit(_bump_version, using=using)
+
+
+def _bump_version():
+    cache.set(CATEGORIES_VERSION_KEY, _new_version(),
+              timeout=_version_timeout())
+
+
+def is_process_local(alias=DEFAULT_CACHE_ALIAS):
+    """
+    Check if cache is kept in memory of single process.
+    """
+    return isinstance(caches[alias], (LocMemCache, DummyCache))
+
+
+def _version_timeout():
+    # Bump in one process does not reach others without shared cache,
+    # their versions expire instead.
+    if is_process_local():
+        return settings.CATEGORIES_LOCAL_VERSION_TIMEOUT
+    return None
+
+
+def _new_version():
+    return uuid.uuid4().hex
@@ -0,0 +1,19 @@
+from django.core.checks import Tags, Warning, register
+
+from .cache import is_process_local
+
+
+@register(Tags.caches, deploy=True)
+def shared_cache_check(app_configs, **kwargs):
+    """
+    Warn when production processes do not share cache.
+    """
+    if not is_process_local():
+        return []
+    return [Warning(
+        'Default cache is kept in memory of every process.',
+        hint='Set CACHE_URL, otherwise navbar categories, ETags and price '
+             'facets lag up to CATEGORIES_LOCAL_VERSION_TIMEOUT seconds '
+             'behind changes made by other workers.',
+        id='craigslist.W001',
+    )]
@@ -1,4 +1,4 @@
-from .models import Category
+from .cache import get_categories
 
 
 def static_categories(request):
@@ -6,5 +6,5 @@ def static_categories(request):
     :param request:
     Return all categories objects
     """
-    return {'static_categories': Category.objects.all(),
+    return {'static_categories': get_categories(),
             'request': request}
@@ -104,3 +104,24 @@ class ProfileForm(forms.ModelForm):
             'zip_code': forms.TextInput(attrs={'class': "form-control"}),
             'phone': forms.EmailInput(attrs={'class': "form-control"}),
         }
+
+
+class CategoryFilterForm(forms.Form):
+    """Form to filter and sort category announcements"""
+    SORT_CHOICES = (
+        ('newest', 'Najnowsze'),
+        ('price', 'Cena rosnąco'),
+        ('-price', 'Cena malejąco'),
+    )
+
+    price_min = forms.DecimalField(
+        label="Cena od", required=False, min_value=0,
+        max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': "form-control"}))
+    price_max = forms.DecimalField(
+        label="Cena do", required=False, min_value=0,
+        max_digits=10, decimal_places=2,
+        widget=forms.NumberInput(attrs={'class': "form-control"}))
+    sort = forms.ChoiceField(
+        label="Sortuj", required=False, choices=SORT_CHOICES,
+        widget=forms.Select(attrs={'class': "form-select"}))
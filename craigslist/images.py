@@ -0,0 +1,100 @@
+import io
+import logging
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Longest side in pixels of each resized announcement image.
+VARIANTS = {
+    'card': 400,
+    'detail': 1200,
+}
+
+FORMATS = {
+    'jpg': {'format': 'JPEG', 'quality': 80, 'optimize': True,
+            'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 75, 'method': 6},
+}
+
+
+def variant_name(image_name, variant, extension):
+    """
+    Return storage name of resized image stored next to the original,
+    e.g. ``2022/06/04/photo.jpg`` -> ``2022/06/04/photo__card.webp``.
+    """
+    root, _ = posixpath.splitext(image_name)
+    return '{}__{}.{}'.format(root, variant, extension)
+
+
+def variant_url(image, variant, extension):
+    """
+    Return URL of resized image.
+    """
+    return image.storage.url(variant_name(image.name, variant, extension))
+
+
+def delete_image(storage, image_name):
+    """
+    Delete image and its resized variants from storage.
+    """
+    names = [variant_name(image_name, variant, extension)
+             for variant in VARIANTS for extension in FORMATS]
+    for name in [image_name] + names:
+        storage.delete(name)
+
+
+def render_variants(source):
+    """
+    Return dict {(variant, extension): bytes} with every resized and
+    recompressed variant of source image file and dict of widths of
+    variants.
+    """
+    with Image.open(source) as original:
+        original = ImageOps.exif_transpose(original).convert('RGB')
+        rendered, widths = {}, {}
+        for variant, size in VARIANTS.items():
+            resized = original.copy()
+            resized.thumbnail((size, size), Image.LANCZOS)
+            widths[variant] = resized.width
+            for extension, options in FORMATS.items():
+                buffer = io.BytesIO()
+                resized.save(buffer, **options)
+                rendered[(variant, extension)] = buffer.getvalue()
+        return rendered, widths
+
+
+def generate_variants(announcement):
+    """
+    Store resized variants of announcement image and mark announcement
+    to render them. Return True if variants were generated.
+    """
+    image = announcement.image
+    if not image:
+        return False
+    try:
+        with image.storage.open(image.name, 'rb') as source:
+            rendered, widths = render_variants(source)
+    except (OSError, Image.DecompressionBombError):
+        logger.exception('Can not resize image %s of announcement %s',
+                         image.name, announcement.pk)
+        return False
+
+    for (variant, extension), content in rendered.items():
+        name = variant_name(image.name, variant, extension)
+        # Storage would pick another name for existing file.
+        if image.storage.exists(name):
+            image.storage.delete(name)
+        image.storage.save(name, ContentFile(content))
+
+    announcement.image_variants = True
+    announcement.image_widths = widths
+    type(announcement).objects.using(announcement._state.db).filter(
+        pk=announcement.pk
+    ).update(
+        image_variants=True, image_widths=widths, updated_at=timezone.now()
+    )
+    return True
@@ -0,0 +1,136 @@
+import functools
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.template.backends.django import DjangoTemplates as \
+    BaseDjangoTemplates
+from django.template.backends.django import Template
+
+# Methods of storage which talk to storage service (e.g. S3).
+STORAGE_METHODS = ('_open', '_save', 'delete', 'exists', 'listdir', 'size',
+                   'url', 'get_accessed_time', 'get_created_time',
+                   'get_modified_time')
+
+_timings = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """
+    Time spent by request in database, templates and storage.
+    Durations are in seconds.
+    """
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.durations = {'db': 0.0, 'template': 0.0, 'storage': 0.0}
+        self._depth = {kind: 0 for kind in self.durations}
+
+    @property
+    def total(self):
+        return time.perf_counter() - self.start
+
+
+def start_request():
+    """
+    Start collecting timings of current request (or task), return
+    token to pass to :func:`finish_request` and collected timings.
+    """
+    timings = RequestTimings()
+    return _timings.set(timings), timings
+
+
+def finish_request(token):
+    _timings.reset(token)
+
+
+@contextmanager
+def measure(kind):
+    """
+    Add time spent in block to current request timings. Nested blocks of
+    the same kind (e.g. included template) are counted once.
+    """
+    timings = _timings.get()
+    if timings is None:
+        yield
+        return
+    timings._depth[kind] += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings._depth[kind] -= 1
+        if not timings._depth[kind]:
+            timings.durations[kind] += time.perf_counter() - start
+
+
+def measure_queries(execute, sql, params, many, context):
+    """
+    Database execute wrapper counting queries and their time.
+    """
+    timings = _timings.get()
+    if timings is not None:
+        timings.queries += 1
+    with measure('db'):
+        return execute(sql, params, many, context)
+
+
+def install_query_wrapper(sender, connection, **kwargs):
+    """
+    Add execute wrapper to every new database connection, it measures
+    queries of request even if they run in other thread (async views).
+    """
+    if measure_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.append(measure_queries)
+
+
+def instrument_storage(storage):
+    """
+    Measure time of calls to storage service made by storage instance.
+    """
+    if getattr(storage, '_instrumented', False):
+        return
+    for name in STORAGE_METHODS:
+        method = getattr(storage, name, None)
+        if method is not None:
+            setattr(storage, name, _measured('storage', method))
+    storage._instrumented = True
+
+
+def _measured(kind, func):
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        with measure(kind):
+            return func(*args, **kwargs)
+    return wrapper
+
+
+def install(storage):
+    """
+    Measure queries of all connections and calls to storage.
+    """
+    connection_created.connect(install_query_wrapper,
+                               dispatch_uid='craigslist_measure_queries')
+    for connection in connections.all():
+        install_query_wrapper(None, connection)
+    instrument_storage(storage)
+
+
+class MeasuredTemplate(Template):
+    def render(self, context=None, request=None):
+        with measure('template'):
+            return super().render(context, request)
+
+
+class DjangoTemplates(BaseDjangoTemplates):
+    """
+    Django templates backend measuring render time of templates.
+    """
+    def from_string(self, template_code):
+        return MeasuredTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return MeasuredTemplate(template.template, self)
@@ -0,0 +1,169 @@
+import functools
+import logging
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# Seconds a claimed job stays invisible to other workers. Job of worker
+# which died is picked up again once this time passes.
+VISIBILITY_TIMEOUT = 300
+
+# last_error of job whose worker died during its last attempt.
+ABANDONED_ERROR = 'Worker did not finish the last attempt of job'
+
+_tasks = {}
+_failure_handlers = {}
+
+
+def task(func=None, on_failure=None):
+    """
+    Register function as task runnable by worker, the function receives
+    claimed :model:`craigslist.Job`. on_failure(job, error) is called
+    when the last attempt of job fails.
+    """
+    if func is None:
+        return functools.partial(task, on_failure=on_failure)
+    _tasks[func.__name__] = func
+    if on_failure is not None:
+        _failure_handlers[func.__name__] = on_failure
+    return func
+
+
+def enqueue(task_name, payload=None, data=None, max_attempts=5):
+    """
+    Add job to the queue, it runs after current transaction commits.
+    """
+    return Job.objects.create(
+        task=task_name,
+        payload=payload or {},
+        data=data,
+        max_attempts=max_attempts,
+    )
+
+
+def claim(visibility_timeout=VISIBILITY_TIMEOUT):
+    """
+    Lock the oldest job ready to run and hide it from other workers.
+    Return claimed job or None if queue is empty.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        job = Job.objects.select_for_update(skip_locked=True).filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+            status=1,
+            run_after__lte=now,
+            attempts__lt=F('max_attempts'),
+        ).order_by('run_after', 'id').first()
+        if job is None:
+            return None
+        job.attempts += 1
+        job.locked_until = now + timedelta(seconds=visibility_timeout)
+        Job.objects.filter(pk=job.pk).update(
+            attempts=job.attempts, locked_until=job.locked_until
+        )
+    return job
+
+
+def run(job):
+    """
+    Execute claimed job, schedule retry with exponential backoff
+    if it fails. Return True if job succeeded.
+    """
+    try:
+        func = _tasks[job.task]
+        func(job)
+    except Exception:
+        error = traceback.format_exc()
+        logger.exception('Job %s failed (attempt %d of %d)',
+                         job, job.attempts, job.max_attempts)
+        if job.attempts >= job.max_attempts:
+            Job.objects.filter(pk=job.pk).update(
+                status=3, locked_until=None, last_error=error
+            )
+            handle_failure(job, error)
+        else:
+            delay = timedelta(seconds=2 ** job.attempts)
+            Job.objects.filter(pk=job.pk).update(
+                run_after=timezone.now() + delay, locked_until=None,
+                last_error=error
+            )
+        return False
+    Job.objects.filter(pk=job.pk).update(
+        status=2, locked_until=None, data=None
+    )
+    return True
+
+
+def handle_failure(job, error):
+    """
+    Call failure handler of task of job which will not be retried.
+    """
+    handler = _failure_handlers.get(job.task)
+    if handler is None:
+        return
+    try:
+        handler(job, error)
+    except Exception:
+        logger.exception('Failure handler of job %s failed', job)
+
+
+def run_pending(limit=None, visibility_timeout=VISIBILITY_TIMEOUT):
+    """
+    Run jobs until queue is empty or limit is reached.
+    Return number of processed jobs.
+    """
+    processed = 0
+    while limit is None or processed < limit:
+        job = claim(visibility_timeout)
+        if job is None:
+            break
+        run(job)
+        processed += 1
+    return processed
+
+
+def fail_abandoned(batch_size=100):
+    """
+    Mark failed jobs whose lock expired after the last attempt, i.e.
+    worker died running it, and call their failure handlers.
+    Return number of failed jobs.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        abandoned = list(
+            Job.objects.select_for_update(skip_locked=True).filter(
+                Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+                status=1,
+                attempts__gte=F('max_attempts'),
+            ).order_by('id')[:batch_size]
+        )
+        Job.objects.filter(pk__in=[job.pk for job in abandoned]).update(
+            status=3, locked_until=None, last_error=ABANDONED_ERROR
+        )
+    for job in abandoned:
+        logger.error('Job %s abandoned after %d attempts',
+                     job, job.attempts)
+        handle_failure(job, ABANDONED_ERROR)
+    return len(abandoned)
+
+
+def prune(keep_days=None):
+    """
+    Delete done and failed jobs older than keep_days, JOBS_KEEP_DAYS
+    by default. Return number of deleted jobs.
+    """
+    if keep_days is None:
+        keep_days = settings.JOBS_KEEP_DAYS
+    cutoff = timezone.now() - timedelta(days=keep_days)
+    deleted, _ = Job.objects.filter(
+        status__in=(2, 3), created_at__lt=cutoff
+    ).delete()
+    return deleted
@@ -0,0 +1,207 @@
+import itertools
+import threading
+import time
+from contextlib import ExitStack, contextmanager
+from wsgiref.simple_server import WSGIRequestHandler
+
+import requests
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import connections
+
+# Response header with number of queries, set by QueryCountingApplication.
+QUERIES_HEADER = 'X-Benchmark-Queries'
+
+
+class LoadResult:
+    """
+    Latencies and errors collected by :func:`run_load`.
+    """
+    def __init__(self, concurrency):
+        self.concurrency = concurrency
+        self.latencies = []
+        self.errors = 0
+        self.elapsed = 0.0
+
+    @property
+    def requests(self):
+        return len(self.latencies) + self.errors
+
+    @property
+    def throughput(self):
+        """
+        Return successful requests per second.
+        """
+        if not self.elapsed:
+            return 0.0
+        return len(self.latencies) / self.elapsed
+
+    def percentile(self, percent):
+        """
+        Return latency percentile in milliseconds (nearest rank).
+        """
+        if not self.latencies:
+            return 0.0
+        ordered = sorted(self.latencies)
+        rank = max(0, int(round(percent / 100 * len(ordered))) - 1)
+        return ordered[rank] * 1000
+
+    def as_dict(self):
+        return {
+            'concurrency': self.concurrency,
+            'requests': self.requests,
+            'errors': self.errors,
+            'throughput': round(self.throughput, 2),
+            'p50_ms': round(self.percentile(50), 2),
+            'p90_ms': round(self.percentile(90), 2),
+            'p99_ms': round(self.percentile(99), 2),
+        }
+
+
+class QueryCountingApplication:
+    """
+    WSGI application wrapper adding number of database queries issued
+    while handling request to response headers.
+    """
+    def __init__(self, application):
+        self.application = application
+
+    def __call__(self, environ, start_response):
+        queries = [0]
+
+        def count(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        def counting_start_response(status, headers, exc_info=None):
+            headers = list(headers) + [(QUERIES_HEADER, str(queries[0]))]
+            return start_response(status, headers, exc_info)
+
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(count))
+            return self.application(environ, counting_start_response)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    """
+    Request handler which does not log every request to stderr.
+    """
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(application, host='127.0.0.1'):
+    """
+    Serve WSGI application by threaded server on free port until
+    context exits, yield base URL of server.
+    """
+    server = ThreadedWSGIServer((host, 0), QuietRequestHandler)
+    server.set_app(application)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://{}:{}'.format(host, server.server_port)
+    finally:
+        server.shutdown()
+        server.server_close()
+        thread.join()
+
+
+def login(session, base_url, username, password):
+    """
+    Log in session through login form, like a browser does.
+    """
+    url = base_url.rstrip('/') + '/login/'
+    session.get(url)
+    response = session.post(url, data={
+        'username': username,
+        'password': password,
+        'csrfmiddlewaretoken': session.cookies.get('csrftoken', ''),
+    }, headers={'Referer': url}, allow_redirects=False)
+    if response.status_code != 302:
+        raise ValueError('Can not log in as {}'.format(username))
+    return session
+
+
+def run_load(base_url, requests_factory, concurrency, total,
+             session_factory=requests.Session, on_response=None):
+    """
+    Send total requests from concurrency threads, each with own session.
+
+    requests_factory(number) returns (method, path, data) of request
+    with given sequence number. on_response(response) is called for
+    every successful response, e.g. to collect extra metrics.
+    """
+    result = LoadResult(concurrency)
+    counter = itertools.count()
+    lock = threading.Lock()
+    base_url = base_url.rstrip('/')
+
+    def worker():
+        session = session_factory()
+        while True:
+            number = next(counter)
+            if number >= total:
+                return
+            method, path, data = requests_factory(number)
+            if method == 'POST':
+                data = dict(data or {},
+                            csrfmiddlewaretoken=session.cookies.get(
+                                'csrftoken', ''))
+            start = time.perf_counter()
+            try:
+                response = session.request(
+                    method, base_url + path, data=data,
+                    headers={'Referer': base_url + path},
+                    allow_redirects=False,
+                )
+                failed = response.status_code >= 400
+            except requests.RequestException:
+                response, failed = None, True
+            latency = time.perf_counter() - start
+            with lock:
+                if failed:
+                    result.errors += 1
+                else:
+                    result.latencies.append(latency)
+            if response is not None and not failed and on_response:
+                on_response(response)
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+def compare_results(baseline, current, threshold):
+    """
+    Return list of regressions of current benchmark results against
+    baseline: throughput or p99 latency worse by more than threshold
+    (e.g. 0.2 for 20%) or more queries per request.
+
+    Both results map dataset name to scenario name to result dict.
+    """
+    regressions = []
+    for dataset, scenarios in current.items():
+        for scenario, result in scenarios.items():
+            base = baseline.get(dataset, {}).get(scenario)
+            if base is None:
+                continue
+            name = '{} {}'.format(dataset, scenario)
+            if result['throughput'] < base['throughput'] * (1 - threshold):
+                regressions.append('{}: throughput {} < {} req/s'.format(
+                    name, result['throughput'], base['throughput']))
+            if result['p99_ms'] > base['p99_ms'] * (1 + threshold):
+                regressions.append('{}: p99 {} > {} ms'.format(
+                    name, result['p99_ms'], base['p99_ms']))
+            if (result.get('queries') is not None
+                    and base.get('queries') is not None
+                    and result['queries'] > base['queries']):
+                regressions.append('{}: {} > {} queries'.format(
+                    name, result['queries'], base['queries']))
+    return regressions
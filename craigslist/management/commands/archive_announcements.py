@@ -0,0 +1,62 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from craigslist.archive import archive_batch, archive_cutoff
+from craigslist.jobs import enqueue
+
+
+class Command(BaseCommand):
+    """
+    Move rejected, sold and archived announcements which did not change
+    for ARCHIVE_AFTER_DAYS out of announcements table in batches, shard
+    after shard.
+    """
+    help = 'Move old rejected and sold announcements to archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_AFTER_DAYS,
+            help='Archive announcements not changed for this many days')
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Announcements moved in one transaction')
+        parser.add_argument(
+            '--max-batches', type=int, default=0,
+            help='Stop after this many batches, 0 means no limit')
+        parser.add_argument(
+            '--pause', type=float, default=0.0,
+            help='Seconds to wait between batches to spread the load')
+        parser.add_argument(
+            '--background', action='store_true',
+            help='Let run_jobs worker move batches instead')
+
+    def handle(self, *args, **options):
+        if options['background']:
+            for shard in settings.DATABASE_SHARDS:
+                enqueue('archive_announcements', payload={
+                    'days': options['days'],
+                    'batch_size': options['batch_size'],
+                    'shard': shard,
+                })
+            self.stdout.write('Archiving queued')
+            return
+        older_than = archive_cutoff(options['days'])
+        total = 0
+        for shard in settings.DATABASE_SHARDS:
+            batches = 0
+            while True:
+                moved = archive_batch(older_than, options['batch_size'],
+                                      using=shard)
+                total += moved
+                batches += 1
+                if moved < options['batch_size']:
+                    break
+                if options['max_batches'] and \
+                        batches >= options['max_batches']:
+                    break
+                time.sleep(options['pause'])
+        self.stdout.write(self.style.SUCCESS(
+            'Archived {} announcements'.format(total)
+        ))
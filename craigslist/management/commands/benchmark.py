@@ -0,0 +1,321 @@
+import functools
+import json
+import os
+import statistics
+from contextlib import nullcontext
+
+import requests
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import urlencode
+
+from craigslist.loadtest import QUERIES_HEADER, QueryCountingApplication, \
+    compare_results, login, run_load, serve
+from craigslist.models import Announcement
+
+User = get_user_model()
+
+MODERATOR_USERNAME = 'benchmark-moderator'
+MODERATOR_PASSWORD_ENV = 'BENCHMARK_MODERATOR_PASSWORD'
+
+
+class Command(BaseCommand):
+    """
+    Benchmark every route of the application, for anonymous and logged
+    in users, including reservation and purchase confirmation POSTs.
+
+    By default application is served by threaded server started in this
+    process, which also reports number of queries of every request.
+    Running server given by --base-url has its own sessions, users log
+    in to it through login form with --password.
+    Reservation scenarios reserve and buy accepted announcements, so
+    run the command against a benchmark database only.
+    Moderation scenarios log in as staff user allowed only to change
+    announcements, created with --moderator-password for the run and
+    deleted after it.
+
+    Name of every scenario starts with name of URL (or URL namespace)
+    it requests, every route of the application has a scenario.
+    """
+    help = 'Measure throughput, latency and queries of every route'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--base-url',
+            help='Benchmark already running server instead of starting '
+                 'one, queries are not counted then')
+        parser.add_argument(
+            '--password', default='password',
+            help='Password of benchmark users (as set by generate_data), '
+                 'used to log in with --base-url')
+        parser.add_argument(
+            '--moderator-password',
+            default=os.environ.get(MODERATOR_PASSWORD_ENV),
+            help='Password of moderator user created for the run, '
+                 'defaults to {} environment variable'.format(
+                     MODERATOR_PASSWORD_ENV))
+        parser.add_argument(
+            '--sizes', default='',
+            help='Comma separated numbers of announcements, database is '
+                 'filled by generate_data up to every size in turn')
+        parser.add_argument(
+            '--processes', type=int, default=1,
+            help='Worker processes used by generate_data')
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Number of concurrent clients')
+        parser.add_argument(
+            '--requests', type=int, default=200,
+            help='Number of requests sent to every route')
+        parser.add_argument(
+            '--warmup', type=int, default=10,
+            help='Number of requests sent before measuring GET routes')
+        parser.add_argument(
+            '--output', default='benchmark-results.json',
+            help='File results are written to')
+        parser.add_argument(
+            '--compare',
+            help='Results file of baseline run to compare with')
+        parser.add_argument(
+            '--threshold', type=float, default=0.2,
+            help='Allowed throughput and p99 latency change, 0.2 is 20%%')
+
+    def handle(self, *args, **options):
+        if not options['moderator_password']:
+            raise CommandError(
+                'Set moderator password by --moderator-password or {} '
+                'environment variable'.format(MODERATOR_PASSWORD_ENV))
+        sizes = [int(size) for size in options['sizes'].split(',') if size]
+        baseline = None
+        if options['compare']:
+            with open(options['compare']) as baseline_file:
+                baseline = json.load(baseline_file)['results']
+
+        if options['base_url']:
+            server = nullcontext(options['base_url'])
+        else:
+            server = serve(QueryCountingApplication(get_wsgi_application()))
+
+        results = {}
+        moderator = self.create_moderator(options['moderator_password'])
+        try:
+            with server as base_url:
+                for size in sizes or [None]:
+                    if size:
+                        self.grow(size, options['processes'])
+                    dataset = str(size) if size else 'current'
+                    self.stdout.write(self.style.MIGRATE_HEADING(
+                        'Dataset {} ({} announcements)'.format(
+                            dataset, Announcement.objects.count())))
+                    results[dataset] = self.run_scenarios(
+                        base_url, moderator, options)
+        finally:
+            self.delete_moderator(moderator)
+
+        with open(options['output'], 'w') as output:
+            json.dump({
+                'created_at': timezone.now().isoformat(),
+                'release': settings.RELEASE_VERSION,
+                'concurrency': options['concurrency'],
+                'results': results,
+            }, output, indent=2)
+        self.stdout.write('Results written to {}'.format(options['output']))
+
+        if baseline is not None:
+            regressions = compare_results(baseline, results,
+                                          options['threshold'])
+            for regression in regressions:
+                self.stdout.write(self.style.ERROR(regression))
+            if regressions:
+                raise CommandError(
+                    '{} regressions against {}'.format(
+                        len(regressions), options['compare']))
+            self.stdout.write(self.style.SUCCESS('No regressions'))
+
+    def grow(self, size, processes):
+        """
+        Add announcements (and users) until there are size of them.
+        """
+        missing = size - Announcement.objects.count()
+        if missing > 0:
+            # Seed differs for every size, so usernames do not collide.
+            call_command('generate_data', announcements=missing,
+                         users=max(missing // 20, 1), seed=size,
+                         processes=processes, stdout=self.stdout)
+
+    @staticmethod
+    def create_moderator(password):
+        """
+        Create staff user allowed only to change announcements, which is
+        enough for moderation queue and announcements admin.
+        """
+        User.objects.filter(username=MODERATOR_USERNAME).delete()
+        moderator = User.objects.create_user(
+            username=MODERATOR_USERNAME, password=password, is_staff=True
+        )
+        moderator.user_permissions.add(Permission.objects.get(
+            content_type__app_label='craigslist',
+            codename='change_announcement',
+        ))
+        return moderator
+
+    @staticmethod
+    def delete_moderator(moderator):
+        """
+        Release announcements leased by moderator on every shard and
+        delete the moderator.
+        """
+        for using in settings.DATABASE_SHARDS:
+            Announcement.objects.using(using).filter(
+                moderator=moderator
+            ).update(moderator=None, moderation_lease_until=None)
+        moderator.delete()
+
+    def run_scenarios(self, base_url, moderator, options):
+        """
+        Run every scenario, return results by scenario name.
+        """
+        results = {}
+        for name, user, method, path, data in self.scenarios(
+                options['requests'], moderator):
+            queries = []
+            on_response = None
+            if not options['base_url']:
+                on_response = functools.partial(self.count_queries, queries)
+
+            password = options['password']
+            if user == moderator:
+                password = options['moderator_password']
+            session_factory = functools.partial(
+                self.session, base_url, user,
+                password if options['base_url'] else None)
+            total = options['requests'] if data is None else len(data)
+
+            def request(number, method=method, path=path, data=data):
+                return method, path, None if data is None else data[number]
+
+            if method == 'GET' and options['warmup']:
+                run_load(base_url, request, options['concurrency'],
+                         options['warmup'], session_factory=session_factory)
+            result = run_load(base_url, request, options['concurrency'],
+                              total, session_factory=session_factory,
+                              on_response=on_response)
+            results[name] = dict(
+                result.as_dict(),
+                queries=(round(statistics.mean(queries), 2)
+                         if queries else None),
+            )
+            self.stdout.write(
+                '{:32} {:8.1f} req/s  p50 {:7.1f} ms  p99 {:7.1f} ms  '
+                'queries {}  errors {}'.format(
+                    name, result.throughput, result.percentile(50),
+                    result.percentile(99), results[name]['queries'],
+                    result.errors)
+            )
+        return results
+
+    @staticmethod
+    def count_queries(queries, response):
+        """
+        Collect number of queries reported by in-process server.
+        """
+        queries.append(int(response.headers[QUERIES_HEADER]))
+
+    @staticmethod
+    def scenarios(limit, moderator):
+        """
+        Return (name, user, method, path, data) of every scenario. Data
+        is list of POST data, one for every request.
+        """
+        announcement = Announcement.objects.filter(status=2).\
+            select_related('user_who_added').order_by('-created_at').first()
+        if announcement is None:
+            raise CommandError('No accepted announcements, use --sizes')
+        seller = announcement.user_who_added
+        buyer = User.objects.exclude(pk=seller.pk).\
+            exclude(pk=moderator.pk).order_by('id').first()
+        if buyer is None:
+            raise CommandError('Benchmark needs at least two users')
+
+        index = reverse('index')
+        category = reverse('category-announcement',
+                           args=(announcement.category_id,))
+        detail = reverse('announcement', args=(announcement.id,))
+        available = list(
+            Announcement.objects.filter(status=2).exclude(
+                user_who_added=buyer).order_by('id').
+            values_list('id', flat=True)[:limit]
+        )
+        purchases = [{'announcement_id': pk} for pk in available]
+        return [
+            ('index (anonymous)', None, 'GET', index, None),
+            ('index (logged in)', buyer, 'GET', index, None),
+            ('category-announcement (anonymous)', None, 'GET', category,
+             None),
+            ('category-announcement (logged in)', buyer, 'GET', category,
+             None),
+            ('announcement (anonymous)', None, 'GET', detail, None),
+            ('announcement (logged in)', buyer, 'GET', detail, None),
+            ('region-announcement', None, 'GET',
+             reverse('region-announcement', args=(announcement.region,)),
+             None),
+            ('search', None, 'GET', '{}?{}'.format(
+                reverse('search'), urlencode({'q': announcement.title})),
+             None),
+            ('autocomplete', None, 'GET', '{}?{}'.format(
+                reverse('autocomplete'),
+                urlencode({'q': announcement.title[:3]})), None),
+            ('login', None, 'GET', reverse('login'), None),
+            ('register', None, 'GET', reverse('register'), None),
+            ('logout', None, 'GET', reverse('logout'), None),
+            ('add-announcement', seller, 'GET',
+             reverse('add-announcement'), None),
+            ('edit-announcement', seller, 'GET',
+             reverse('edit-announcement', args=(announcement.id,)), None),
+            ('delete-announcement', seller, 'GET',
+             reverse('delete-announcement', args=(announcement.id,)), None),
+            ('my-announcements', seller, 'GET',
+             reverse('my-announcements'), None),
+            ('my-profile', seller, 'GET', reverse('my-profile'), None),
+            ('my-reservations', buyer, 'GET',
+             reverse('my-reservations'), None),
+            ('moderation-queue', moderator, 'GET',
+             reverse('moderation-queue'), None),
+            ('admin (announcements)', moderator, 'GET',
+             reverse('admin:craigslist_announcement_changelist'), None),
+            ('metrics', None, 'GET', reverse('metrics'), None),
+            ('book-announcement', buyer, 'POST',
+             reverse('book-announcement'), purchases),
+            ('confirm', buyer, 'POST', reverse('confirm'), purchases),
+        ]
+
+    @staticmethod
+    def session(base_url, user, password=None):
+        """
+        Return HTTP session with CSRF cookie, logged in as user if given:
+        through login form with password, otherwise with session created
+        in this process.
+        """
+        session = requests.Session()
+        if settings.METRICS_TOKEN:
+            # Server may not allow metrics to address of benchmark.
+            session.headers['Authorization'] = 'Bearer {}'.format(
+                settings.METRICS_TOKEN)
+        if user is not None and password is not None:
+            return login(session, base_url, user.username, password)
+        session.get(base_url.rstrip('/') + reverse('login'))
+        if user is not None:
+            client = Client()
+            client.force_login(user)
+            session.cookies.set(
+                settings.SESSION_COOKIE_NAME,
+                client.cookies[settings.SESSION_COOKIE_NAME].value,
+            )
+        return session
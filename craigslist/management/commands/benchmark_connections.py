@@ -0,0 +1,100 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.urls import reverse
+
+from craigslist.loadtest import run_load, serve
+from craigslist.pool import close_pools
+
+POOLED_ENGINE = 'craigslist.backends.postgresql'
+
+
+class Command(BaseCommand):
+    """
+    Compare latency of announcements list served by threaded server
+    in this process when every request opens new database connection,
+    when connections are kept open by threads (CONN_MAX_AGE) and when
+    they are taken from connection pool.
+
+    Server thread serves single keep-alive client and closes its
+    connections when client disconnects. Pool is measured with
+    PostgreSQL only.
+    """
+    help = 'Compare index latency with new, persistent and pooled ' \
+           'database connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency', type=int, default=8,
+            help='Number of concurrent clients')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Number of requests sent in every mode')
+        parser.add_argument(
+            '--pool-size', type=int, default=8,
+            help='Maximum number of pooled connections')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[DEFAULT_DB_ALIAS].settings_dict
+        original = {key: settings_dict.get(key)
+                    for key in ('CONN_MAX_AGE', 'POOL')}
+        modes = [
+            ('new', {'CONN_MAX_AGE': 0, 'POOL': None}),
+            ('persistent', {'CONN_MAX_AGE': None, 'POOL': None}),
+        ]
+        if settings_dict['ENGINE'] == POOLED_ENGINE:
+            modes.append(('pooled', {
+                'CONN_MAX_AGE': 0,
+                'POOL': {'MAX_SIZE': options['pool_size'], 'TIMEOUT': 30},
+            }))
+        else:
+            self.stderr.write('Database engine is not {}, pooled mode is '
+                              'skipped'.format(POOLED_ENGINE))
+
+        path = reverse('index')
+        results = {}
+        try:
+            with serve(get_wsgi_application()) as base_url:
+                for mode, mode_settings in modes:
+                    self.reset_connections()
+                    # Threads of server create connections from this dict.
+                    settings_dict.update(mode_settings)
+                    # Warm up caches and pool.
+                    self.load(base_url, path, options['concurrency'],
+                              2 * options['concurrency'])
+                    result = results[mode] = self.load(
+                        base_url, path, options['concurrency'],
+                        options['requests'])
+                    self.stdout.write(
+                        '{:10} {:8.1f} req/s  p50 {:7.1f} ms  '
+                        'p99 {:7.1f} ms  errors {}'.format(
+                            mode, result.throughput, result.percentile(50),
+                            result.percentile(99), result.errors)
+                    )
+        finally:
+            self.reset_connections()
+            settings_dict.update(original)
+
+        if any(result.errors for result in results.values()):
+            raise CommandError('Some requests failed')
+        new = results['new']
+        self.stdout.write(self.style.MIGRATE_HEADING('Compared to new'))
+        for mode, result in results.items():
+            if mode != 'new':
+                self.stdout.write('{:10} p50 x{:.2f}  p99 x{:.2f}'.format(
+                    mode,
+                    result.percentile(50) / (new.percentile(50) or 1),
+                    result.percentile(99) / (new.percentile(99) or 1),
+                ))
+
+    @staticmethod
+    def reset_connections():
+        connections.close_all()
+        close_pools(DEFAULT_DB_ALIAS)
+
+    @staticmethod
+    def load(base_url, path, concurrency, total):
+        def request(number):
+            return 'GET', path, None
+
+        return run_load(base_url, request, concurrency, total)
@@ -0,0 +1,98 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+
+from craigslist.models import Announcement
+from craigslist.search import WORD, search
+from craigslist.views import KeysetPaginationMixin
+
+
+class Command(BaseCommand):
+    """
+    Compare full-text search with scanning titles and descriptions
+    with ``icontains``.
+    """
+    help = 'Time full-text search against icontains scan of announcements'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'queries', nargs='*',
+            help='Searched phrases, by default words of random titles')
+        parser.add_argument(
+            '--queries', type=int, default=10, dest='sample',
+            help='Number of phrases sampled when none are given')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='How many times each query is executed to time it')
+
+    def handle(self, *args, **options):
+        queries = options['queries'] or self.sample_queries(options['sample'])
+        if not queries:
+            raise CommandError('No accepted announcements, '
+                               'use generate_data command')
+        per_page = KeysetPaginationMixin.per_page
+        accepted = Announcement.objects.filter(status=2)
+        totals = {'search': [], 'icontains': []}
+        for query in queries:
+            self.stdout.write(self.style.MIGRATE_HEADING(query))
+            querysets = (
+                ('search', search(accepted, query).order_by('-rank', '-id')),
+                ('icontains', self.icontains(accepted, query)
+                 .order_by('-created_at', '-id')),
+            )
+            for name, queryset in querysets:
+                found = queryset.count()
+                timings = self.time_query(queryset[:per_page + 1],
+                                          options['repeat'])
+                totals[name].append(statistics.median(timings))
+                self.stdout.write(
+                    '  {:<10} {:>7} found, min {:.2f} ms, '
+                    'median {:.2f} ms'.format(
+                        name, found, min(timings), statistics.median(timings))
+                )
+        self.stdout.write(self.style.SUCCESS(
+            'Median of medians: search {:.2f} ms, icontains {:.2f} ms'.format(
+                statistics.median(totals['search']),
+                statistics.median(totals['icontains']))
+        ))
+
+    @staticmethod
+    def icontains(queryset, query):
+        """
+        Filter announcements containing every word of query in title
+        or description, as naive search would do.
+        """
+        for word in WORD.findall(query):
+            queryset = queryset.filter(Q(title__icontains=word)
+                                       | Q(description__icontains=word))
+        return queryset
+
+    @staticmethod
+    def sample_queries(count):
+        """
+        Return list of one and two word phrases from titles of random
+        accepted announcements.
+        """
+        titles = list(Announcement.objects.filter(status=2)
+                      .order_by('?').values_list('title', flat=True)[:count])
+        queries = []
+        for title in titles:
+            words = [word for word in WORD.findall(title) if len(word) > 3]
+            if words:
+                queries.append(' '.join(words[:random.randint(1, 2)]))
+        return queries
+
+    @staticmethod
+    def time_query(queryset, repeat):
+        """
+        Return list of query execution times in milliseconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
@@ -0,0 +1,111 @@
+import functools
+
+import requests
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from craigslist.loadtest import login, run_load
+from craigslist.models import Announcement
+
+
+class Command(BaseCommand):
+    """
+    Compare throughput and latency of read-heavy pages served by WSGI
+    and ASGI servers started beforehand, e.g.:
+
+    gunicorn craigslist_app.wsgi -w 4 -b :8001
+    gunicorn craigslist_app.asgi -w 4 -b :8002 \
+        -k uvicorn.workers.UvicornWorker
+    """
+    help = 'Compare requests/second and p99 latency of WSGI and ASGI modes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8002')
+        parser.add_argument(
+            '--concurrency', default='1,8,32,64',
+            help='Comma separated numbers of concurrent clients')
+        parser.add_argument(
+            '--requests', type=int, default=500,
+            help='Number of requests sent at every concurrency level')
+        parser.add_argument(
+            '--username', help='User to log in to load reservations list')
+        parser.add_argument('--password')
+
+    def handle(self, *args, **options):
+        paths = self.read_paths(options['username'])
+        concurrency_levels = [
+            int(level) for level in options['concurrency'].split(',')
+        ]
+        session_factory = None
+        if options['username']:
+            session_factory = functools.partial(
+                self.logged_session, options['username'],
+                options['password'])
+
+        results = {}
+        for mode in ('wsgi', 'asgi'):
+            base_url = options['{}_url'.format(mode)]
+            factory = None
+            if session_factory:
+                factory = functools.partial(session_factory, base_url)
+            # Warm up connections and caches of every worker.
+            self.load(base_url, paths, 4, 4 * len(paths), factory)
+            for level in concurrency_levels:
+                result = self.load(base_url, paths, level,
+                                   options['requests'], factory)
+                results[mode, level] = result
+                self.stdout.write(
+                    '{:5} c={:<4} {:8.1f} req/s  p50 {:7.1f} ms  '
+                    'p99 {:7.1f} ms  errors {}'.format(
+                        mode, level, result.throughput,
+                        result.percentile(50), result.percentile(99),
+                        result.errors)
+                )
+
+        self.stdout.write(self.style.MIGRATE_HEADING('ASGI / WSGI'))
+        for level in concurrency_levels:
+            wsgi, asgi = results['wsgi', level], results['asgi', level]
+            self.stdout.write('c={:<4} throughput x{:.2f}  p99 x{:.2f}'.format(
+                level,
+                asgi.throughput / (wsgi.throughput or 1),
+                asgi.percentile(99) / (wsgi.percentile(99) or 1),
+            ))
+
+    @staticmethod
+    def read_paths(username):
+        """
+        Return paths of index, category, detail and reservations pages.
+        """
+        announcement = Announcement.objects.filter(status=2).first()
+        if announcement is None:
+            raise CommandError('No accepted announcements to benchmark')
+        paths = [
+            reverse('index'),
+            reverse('category-announcement',
+                    args=(announcement.category_id,)),
+            reverse('announcement', args=(announcement.id,)),
+        ]
+        if username:
+            paths.append(reverse('my-reservations'))
+        return paths
+
+    @staticmethod
+    def logged_session(username, password, base_url):
+        """
+        Return session logged in to server at base_url.
+        """
+        return login(requests.Session(), base_url, username, password)
+
+    @staticmethod
+    def load(base_url, paths, concurrency, total, session_factory):
+        """
+        Send GET requests to paths in turn.
+        """
+        def request(number):
+            return 'GET', paths[number % len(paths)], None
+
+        kwargs = {}
+        if session_factory:
+            kwargs['session_factory'] = session_factory
+        return run_load(base_url, request, concurrency, total, **kwargs)
@@ -0,0 +1,172 @@
+import json
+import random
+import statistics
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from craigslist.models import Announcement, Category, STATUS
+from craigslist.pagination import KeysetPaginator
+from craigslist.views import KeysetPaginationMixin
+
+User = get_user_model()
+
+BENCHMARK_USERNAME = 'explain-feeds'
+
+
+class Command(BaseCommand):
+    """
+    Print query plans and timings of announcement feeds queries.
+    """
+    help = 'Print EXPLAIN plans and timings for announcement feed queries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Insert given number of announcements before explaining')
+        parser.add_argument(
+            '--categories', type=int, default=20,
+            help='Number of categories used by seeded announcements')
+        parser.add_argument(
+            '--repeat', type=int, default=20,
+            help='How many times each query is executed to time it')
+        parser.add_argument(
+            '--require-index', action='store_true',
+            help='Fail if any query scans announcement table sequentially '
+                 'or filters deep page cursor out of scanned rows')
+
+    def handle(self, *args, **options):
+        if options['seed']:
+            self.seed(options['seed'], options['categories'])
+
+        announcement = Announcement.objects.filter(status=2).first()
+        if announcement is None:
+            raise CommandError('No accepted announcements, use --seed')
+
+        sequential, filtered = [], []
+        for name, queryset, cursor_column in self.feed_queries(announcement):
+            plan = queryset.explain()
+            timings = self.time_query(queryset, options['repeat'])
+            self.stdout.write(self.style.MIGRATE_HEADING(name))
+            self.stdout.write(plan)
+            self.stdout.write(
+                'min {:.2f} ms, median {:.2f} ms\n'.format(
+                    min(timings), statistics.median(timings))
+            )
+            if self.is_sequential_scan(plan):
+                sequential.append(name)
+            elif cursor_column and not any(
+                    cursor_column in condition
+                    for condition in self.index_conditions(queryset)):
+                filtered.append(name)
+
+        if options['require_index'] and (sequential or filtered):
+            raise CommandError('Sequential scan in: {}; cursor not in '
+                               'index condition in: {}'.format(
+                                   ', '.join(sequential) or '-',
+                                   ', '.join(filtered) or '-'))
+
+    def feed_queries(self, announcement):
+        """
+        Return (name, queryset, cursor column) of first and deep page
+        queries issued by index, category and user announcements views,
+        cursor column is None for first pages.
+        """
+        per_page = KeysetPaginationMixin.per_page
+        ordering = KeysetPaginationMixin.keyset_ordering
+        feeds = (
+            ('index', Announcement.objects.filter(status=2)),
+            ('category', Announcement.objects.filter(
+                category_id=announcement.category_id, status=2)),
+            ('user', Announcement.objects.filter(
+                user_who_added_id=announcement.user_who_added_id)),
+        )
+        for name, queryset in feeds:
+            paginator = KeysetPaginator(queryset, per_page, ordering=ordering)
+            yield name, paginator.get_queryset()[:per_page + 1], None
+            middle = queryset.order_by(*ordering)[
+                queryset.count() // 2:][:1].get()
+            cursor = paginator.encode_cursor(middle)
+            yield ('{} (deep page)'.format(name),
+                   paginator.get_queryset(after=cursor)[:per_page + 1],
+                   paginator.fields[0])
+
+    @staticmethod
+    def time_query(queryset, repeat):
+        """
+        Return list of query execution times in milliseconds.
+        """
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            list(queryset.all())
+            timings.append((time.perf_counter() - start) * 1000)
+        return timings
+
+    @staticmethod
+    def is_sequential_scan(plan):
+        """
+        Check if plan reads announcement table without index.
+        """
+        table = Announcement._meta.db_table
+        for line in plan.splitlines():
+            if 'Seq Scan on {}'.format(table) in line:
+                return True
+            if 'SCAN {}'.format(table) in line and 'INDEX' not in line:
+                return True
+        return False
+
+    @staticmethod
+    def index_conditions(queryset):
+        """
+        Return conditions searched in indexes by plan of queryset,
+        index scan with cursor missing in them reads the feed from its
+        top and filters rows, as OFFSET does.
+        """
+        if connection.vendor == 'postgresql':
+            nodes = [json.loads(queryset.explain(format='json'))[0]['Plan']]
+            conditions = []
+            while nodes:
+                node = nodes.pop()
+                if 'Index Cond' in node:
+                    conditions.append(node['Index Cond'])
+                nodes.extend(node.get('Plans', []))
+            return conditions
+        return [line[line.index('('):]
+                for line in queryset.explain().splitlines()
+                if 'USING' in line and 'INDEX' in line and '(' in line]
+
+    def seed(self, count, categories_count):
+        """
+        Insert announcements in all statuses spread over categories.
+        """
+        user, _ = User.objects.get_or_create(username=BENCHMARK_USERNAME)
+        categories = [
+            Category.objects.get_or_create(
+                category_name='Benchmark {}'.format(number))[0]
+            for number in range(categories_count)
+        ]
+        statuses = [status for status, _ in STATUS]
+        batch = []
+        for number in range(count):
+            batch.append(Announcement(
+                title='Announcement {}'.format(number),
+                description='Seeded by explain_feeds',
+                price=random.randint(1, 10000),
+                category=random.choice(categories),
+                user_who_added=user,
+                status=random.choice(statuses),
+                image='staticfiles/seed.jpg',
+            ))
+            if len(batch) == 5000:
+                Announcement.objects.bulk_create(batch)
+                batch = []
+        Announcement.objects.bulk_create(batch)
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    'ANALYZE {}'.format(Announcement._meta.db_table)
+                )
+        self.stdout.write('Seeded {} announcements'.format(count))
@@ -0,0 +1,47 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from craigslist.sessions import flush_dirty
+
+
+class Command(BaseCommand):
+    """
+    Write sessions changed in cache to database, see
+    :class:`craigslist.sessions.SessionStore`.
+    """
+    help = 'Write sessions changed in cache to the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Write changed sessions and exit instead of polling')
+        parser.add_argument(
+            '--interval', type=float, default=5.0,
+            help='Seconds between writes')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of logged changes written in one transaction')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while True:
+            close_old_connections()
+            written = flush_dirty(options['batch_size'])
+            if written:
+                self.stdout.write('Wrote {} sessions'.format(written))
+            # Changes made before stop are written by the last pass.
+            if options['once'] or not self.running:
+                break
+            time.sleep(options['interval'])
+
+    def stop(self, signum, frame):
+        """
+        Write remaining changes and exit.
+        """
+        self.running = False
@@ -0,0 +1,322 @@
+import multiprocessing
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections, transaction
+from django.utils import timezone
+from faker import Faker
+
+from craigslist.cache import invalidate_categories
+from craigslist.models import Announcement, Category, Profile, \
+    Reservation, Transaction
+from craigslist.search import search_document
+from craigslist.sharding import region_for_zip, shard_for_region
+
+User = get_user_model()
+
+CATEGORY_NAMES = (
+    'Elektronika', 'Motoryzacja', 'Dom i ogród', 'Moda', 'Nieruchomości',
+    'Praca', 'Zwierzęta', 'Dla dzieci', 'Sport i hobby', 'Muzyka',
+    'Książki', 'Zdrowie i uroda', 'Rolnictwo', 'Usługi', 'Antyki',
+    'Gry i konsole',
+)
+
+# Share of announcements in every status, roughly as in production:
+# most are accepted or sold, few wait for moderation.
+STATUS_WEIGHTS = {1: 5, 2: 60, 3: 5, 4: 5, 5: 20, 6: 5}
+
+# Ids of generated users and categories and regions of users, set before
+# workers are forked so every chunk picks related rows without querying
+# them again.
+_user_ids = []
+_user_regions = {}
+_category_ids = []
+
+
+def chunk_random(seed, kind, chunk):
+    """
+    Return random generator and Faker seeded for chunk, so generated
+    data does not depend on number of processes.
+    """
+    key = '{}-{}-{}'.format(seed, kind, chunk)
+    fake = Faker('pl_PL')
+    fake.seed_instance(key)
+    return random.Random(key), fake
+
+
+@contextmanager
+def explicit_timestamps():
+    """
+    Allow bulk_create to keep created_at and updated_at set on
+    announcements instead of overwriting them with current time.
+    """
+    fields = [Announcement._meta.get_field(name)
+              for name in ('created_at', 'updated_at')]
+    saved = [(field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, (auto_now, auto_now_add) in zip(fields, saved):
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def build_users(seed, chunk, start, stop, password):
+    """
+    Return unsaved users and their profiles numbered from start to stop.
+    """
+    _, fake = chunk_random(seed, 'users', chunk)
+    users, profiles = [], []
+    for number in range(start, stop):
+        user = User(
+            username='{}.{}.{}'.format(fake.user_name(), seed, number),
+            first_name=fake.first_name(),
+            last_name=fake.last_name(),
+            email=fake.email(),
+            password=password,
+        )
+        users.append(user)
+        profiles.append(Profile(
+            user=user,
+            city=fake.city()[:30],
+            street=fake.street_name()[:30],
+            zip_code=fake.postcode()[:6],
+            phone='+48{}'.format(
+                500000000 + (seed * 10000000 + number) % 400000000),
+        ))
+    return users, profiles
+
+
+def build_announcements(seed, chunk, start, stop, days, image, now):
+    """
+    Return unsaved announcements numbered from start to stop, created
+    during days before now, with ids of users who reserved reserved
+    and sold ones.
+    """
+    rng, fake = chunk_random(seed, 'announcements', chunk)
+    statuses = list(STATUS_WEIGHTS)
+    weights = list(STATUS_WEIGHTS.values())
+    # Few categories hold most of announcements.
+    category_weights = [1 / (rank + 1) for rank in range(len(_category_ids))]
+    announcements, buyers = [], []
+    for _ in range(start, stop):
+        status = rng.choices(statuses, weights)[0]
+        seller_id = rng.choice(_user_ids)
+        created_at = now - timedelta(seconds=rng.uniform(0, days * 86400))
+        title = fake.sentence(nb_words=4)[:128]
+        description = fake.paragraph(nb_sentences=5)
+        # bulk_create does not call save(), search columns are set here.
+        announcements.append(Announcement(
+            title=title,
+            description=description,
+            search_title=search_document(title),
+            search_description=search_document(description),
+            price=Decimal(rng.randint(100, 1000000)) / 100,
+            category_id=rng.choices(_category_ids, category_weights)[0],
+            user_who_added_id=seller_id,
+            region=_user_regions.get(seller_id, 0),
+            status=status,
+            image=image,
+            created_at=created_at,
+            updated_at=created_at + timedelta(
+                seconds=rng.uniform(0, (now - created_at).total_seconds())),
+        ))
+        buyer_id = None
+        if status in (4, 5) and len(_user_ids) > 1:
+            while buyer_id in (None, seller_id):
+                buyer_id = rng.choice(_user_ids)
+        buyers.append(buyer_id)
+    return announcements, buyers
+
+
+def create_users(seed, chunk, start, stop, password):
+    """
+    Insert chunk of users with profiles, return their ids.
+    """
+    users, profiles = build_users(seed, chunk, start, stop, password)
+    with transaction.atomic():
+        User.objects.bulk_create(users)
+        for profile in profiles:
+            profile.user_id = profile.user.pk
+        Profile.objects.bulk_create(profiles)
+    return [user.pk for user in users]
+
+
+def create_announcements(seed, chunk, start, stop, days, image, now):
+    """
+    Insert chunk of announcements with reservations of reserved and
+    sold ones and transactions of sold ones, on shards of regions of
+    sellers. Return number of rows.
+    """
+    announcements, buyers = build_announcements(
+        seed, chunk, start, stop, days, image, now
+    )
+    shards = {}
+    for announcement, buyer_id in zip(announcements, buyers):
+        shards.setdefault(shard_for_region(announcement.region), []).append(
+            (announcement, buyer_id))
+    rows = 0
+    for shard, placed in shards.items():
+        reservations, transactions = [], []
+        with transaction.atomic(using=shard), explicit_timestamps():
+            # Primary keys are set by bulk_create on PostgreSQL and SQLite.
+            Announcement.objects.using(shard).bulk_create(
+                [announcement for announcement, _ in placed])
+            for announcement, buyer_id in placed:
+                if buyer_id is None:
+                    continue
+                reservations.append(Reservation(
+                    announcement_id=announcement.pk,
+                    reserved_by_user_id=buyer_id,
+                ))
+                if announcement.status == 5:
+                    transactions.append(Transaction(
+                        seller_id=announcement.user_who_added_id,
+                        buyer_id=buyer_id,
+                    ))
+            Reservation.objects.using(shard).bulk_create(reservations)
+            Transaction.objects.using(shard).bulk_create(transactions)
+        rows += len(placed) + len(reservations) + len(transactions)
+    return rows
+
+
+def run_chunk(args):
+    """
+    Run single chunk in worker process.
+    """
+    func, *arguments = args
+    return func(*arguments)
+
+
+class Command(BaseCommand):
+    """
+    Fill database with synthetic users, categories, announcements,
+    reservations and transactions for performance measurements.
+    """
+    help = 'Generate synthetic data at configurable scale'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--users', type=int, default=1000,
+            help='Number of users (with profiles) to create')
+        parser.add_argument(
+            '--announcements', type=int, default=10000,
+            help='Number of announcements to create')
+        parser.add_argument(
+            '--categories', type=int, default=len(CATEGORY_NAMES),
+            help='Number of categories announcements are spread over')
+        parser.add_argument(
+            '--days', type=int, default=365,
+            help='Announcements are created during given number of days')
+        parser.add_argument(
+            '--batch-size', type=int, default=5000,
+            help='Number of rows inserted by single bulk_create')
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Number of worker processes, defaults to number of cores')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Seed of generated data, same seed gives same data')
+        parser.add_argument(
+            '--password', default='password',
+            help='Password of every generated user')
+        parser.add_argument(
+            '--image', default='staticfiles/seed.jpg',
+            help='Image path stored in every announcement')
+
+    def handle(self, *args, **options):
+        global _user_ids, _user_regions, _category_ids
+
+        if options['batch_size'] < 1 or options['processes'] < 1:
+            raise CommandError('Batch size and processes must be positive')
+        if options['announcements'] and not options['categories']:
+            raise CommandError('Announcements need at least one category')
+        seed = options['seed']
+        started = time.perf_counter()
+
+        _category_ids = self.create_categories(options['categories'])
+        # Hashing is slow on purpose, all users share single hash.
+        password = make_password(options['password'])
+        _user_ids = []
+        for ids in self.run_chunks(
+                create_users, options['users'], options,
+                seed, password):
+            _user_ids.extend(ids)
+        if not _user_ids:
+            _user_ids = list(User.objects.values_list('id', flat=True))
+        if options['announcements'] and not _user_ids:
+            raise CommandError('Announcements need at least one user')
+        _user_regions = {
+            user_id: region_for_zip(zip_code) for user_id, zip_code
+            in Profile.objects.values_list('user_id', 'zip_code')
+        }
+        self.stdout.write('Created {} users'.format(options['users']))
+
+        rows = sum(self.run_chunks(
+            create_announcements, options['announcements'], options,
+            seed, options['days'], options['image'], timezone.now()))
+        self.stdout.write(
+            'Created {} announcements with reservations and '
+            'transactions, {} rows'.format(options['announcements'], rows)
+        )
+
+        invalidate_categories()
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            'Done in {:.1f} s'.format(time.perf_counter() - started)
+        ))
+
+    @staticmethod
+    def create_categories(count):
+        """
+        Return ids of count categories, missing ones are created.
+        """
+        names = [
+            CATEGORY_NAMES[number] if number < len(CATEGORY_NAMES)
+            else '{} {}'.format(
+                CATEGORY_NAMES[number % len(CATEGORY_NAMES)],
+                number // len(CATEGORY_NAMES) + 1)
+            for number in range(count)
+        ]
+        Category.objects.bulk_create(
+            [Category(category_name=name) for name in names],
+            ignore_conflicts=True,
+        )
+        ids = dict(Category.objects.filter(category_name__in=names).
+                   values_list('category_name', 'id'))
+        return [ids[name] for name in names]
+
+    def run_chunks(self, func, total, options, seed, *arguments):
+        """
+        Split total rows into chunks of batch size and run func for
+        every chunk, in worker processes if more than one is requested.
+        Yield results of chunks in order.
+        """
+        size = options['batch_size']
+        chunks = [
+            (func, seed, chunk, start, min(start + size, total)) + arguments
+            for chunk, start in enumerate(range(0, total, size))
+        ]
+        if options['processes'] == 1 or len(chunks) < 2:
+            for chunk in chunks:
+                yield run_chunk(chunk)
+            return
+
+        # Workers are forked, they must not share parent connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        with ProcessPoolExecutor(max_workers=options['processes'],
+                                 mp_context=context,
+                                 initializer=connections.close_all) as pool:
+            yield from pool.map(run_chunk, chunks)
@@ -0,0 +1,65 @@
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import connections
+
+from craigslist.images import generate_variants
+from craigslist.models import Announcement
+from craigslist.sharding import shard_for_id
+
+
+def process_announcement(announcement_id):
+    """
+    Generate variants of single announcement image in worker process.
+    """
+    announcement = Announcement.objects.using(
+        shard_for_id(announcement_id)
+    ).filter(pk=announcement_id).first()
+    if announcement is None:
+        return False
+    return generate_variants(announcement)
+
+
+class Command(BaseCommand):
+    """
+    Generate resized variants of already uploaded announcement images.
+    """
+    help = 'Generate resized variants of announcement images in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=os.cpu_count(),
+            help='Number of worker processes, defaults to number of cores')
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Regenerate variants of images which already have them')
+
+    def handle(self, *args, **options):
+        announcements = Announcement.objects.exclude(image='')
+        if not options['all']:
+            announcements = announcements.filter(image_variants=False)
+        ids = []
+        for shard in settings.DATABASE_SHARDS:
+            ids.extend(announcements.using(shard).order_by('id').
+                       values_list('id', flat=True))
+        self.stdout.write('Processing {} images'.format(len(ids)))
+
+        # Workers are forked, they must not share parent connections.
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        done = failed = 0
+        with ProcessPoolExecutor(max_workers=options['processes'],
+                                 mp_context=context,
+                                 initializer=connections.close_all) as pool:
+            for generated in pool.map(process_announcement, ids,
+                                      chunksize=16):
+                if generated:
+                    done += 1
+                else:
+                    failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            'Generated variants for {} images, {} failed'.format(done, failed)
+        ))
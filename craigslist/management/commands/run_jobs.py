@@ -0,0 +1,70 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from craigslist import jobs, tasks  # noqa: F401
+
+
+class Command(BaseCommand):
+    """
+    Run background jobs stored in database.
+    """
+    help = 'Run background jobs from the database queue'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once', action='store_true',
+            help='Run all ready jobs and exit instead of polling')
+        parser.add_argument(
+            '--sleep', type=float, default=1.0,
+            help='Seconds to wait when queue is empty')
+        parser.add_argument(
+            '--visibility-timeout', type=int,
+            default=jobs.VISIBILITY_TIMEOUT,
+            help='Seconds after which job of crashed worker is retried')
+        parser.add_argument(
+            '--sweep-interval', type=float, default=60.0,
+            help='Seconds between failing abandoned jobs and deleting '
+                 'old finished ones')
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        last_sweep = None
+        while self.running:
+            close_old_connections()
+            if last_sweep is None or \
+                    time.monotonic() - last_sweep >= options['sweep_interval']:
+                self.sweep()
+                last_sweep = time.monotonic()
+            processed = jobs.run_pending(
+                limit=100,
+                visibility_timeout=options['visibility_timeout'],
+            )
+            if processed:
+                self.stdout.write('Processed {} jobs'.format(processed))
+            if options['once'] and not processed:
+                break
+            if not processed:
+                time.sleep(options['sleep'])
+
+    def sweep(self):
+        """
+        Fail jobs abandoned by crashed workers, delete old finished jobs.
+        """
+        failed = jobs.fail_abandoned()
+        if failed:
+            self.stdout.write('Failed {} abandoned jobs'.format(failed))
+        deleted = jobs.prune()
+        if deleted:
+            self.stdout.write('Deleted {} finished jobs'.format(deleted))
+
+    def stop(self, signum, frame):
+        """
+        Finish current job and exit.
+        """
+        self.running = False
@@ -0,0 +1,117 @@
+import hmac
+import os
+
+from django.conf import settings
+from prometheus_client import CONTENT_TYPE_LATEST, CollectorRegistry, \
+    Counter, Gauge, Histogram, REGISTRY, generate_latest, multiprocess
+
+# Methods used as label, others are counted as 'other'.
+HTTP_METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+
+# Metrics of all gunicorn workers are aggregated from files written to
+# PROMETHEUS_MULTIPROC_DIR, set in gunicorn.conf.py before workers start.
+
+REQUESTS = Counter(
+    'craigslist_http_requests_total',
+    'HTTP requests by view, method and status code',
+    ['view', 'method', 'status'],
+)
+REQUEST_LATENCY = Histogram(
+    'craigslist_http_request_duration_seconds',
+    'Time of handling HTTP request',
+    ['view', 'method'],
+    buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    'craigslist_http_request_queries',
+    'Database queries issued by HTTP request',
+    ['view'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55),
+)
+CACHE_LOOKUPS = Counter(
+    'craigslist_cache_lookups_total',
+    'Cache lookups by cache and result (hit or miss)',
+    ['cache', 'result'],
+)
+ANNOUNCEMENTS_CREATED = Counter(
+    'craigslist_announcements_created_total',
+    'Announcements added by users',
+)
+RESERVATIONS_CREATED = Counter(
+    'craigslist_reservations_created_total',
+    'Announcements reserved by buyers',
+)
+TRANSACTIONS_CREATED = Counter(
+    'craigslist_transactions_created_total',
+    'Purchases confirmed by buyers',
+)
+
+DB_POOL_WAIT = Histogram(
+    'craigslist_db_pool_wait_seconds',
+    'Time waited for database connection from pool',
+    ['database'],
+    buckets=(.0001, .0005, .001, .005, .01, .05, .1, .5, 1, 5),
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'craigslist_db_pool_checked_out_connections',
+    'Database connections taken from pool and not returned yet',
+    ['database'],
+    multiprocess_mode='livesum',
+)
+DB_POOL_CONNECTIONS_OPENED = Counter(
+    'craigslist_db_pool_connections_opened_total',
+    'Database connections opened by pool',
+    ['database'],
+)
+DB_POOL_HEALTH_CHECK_FAILURES = Counter(
+    'craigslist_db_pool_health_check_failures_total',
+    'Idle pooled connections found broken and replaced',
+    ['database'],
+)
+DB_POOL_TIMEOUTS = Counter(
+    'craigslist_db_pool_timeouts_total',
+    'Requests for connection which waited for pool too long',
+    ['database'],
+)
+
+
+def observe_request(view, method, status, duration, queries):
+    """
+    Record handled request, duration is in seconds.
+    """
+    view = view or '<unmatched>'
+    if method not in HTTP_METHODS:
+        method = 'other'
+    REQUESTS.labels(view, method, status).inc()
+    REQUEST_LATENCY.labels(view, method).observe(duration)
+    REQUEST_QUERIES.labels(view).observe(queries)
+
+
+def cache_lookup(cache, hit):
+    CACHE_LOOKUPS.labels(cache, 'hit' if hit else 'miss').inc()
+
+
+def is_allowed(request):
+    """
+    Check if request may read metrics: it comes from METRICS_ALLOWED_IPS
+    or has ``Authorization: Bearer <METRICS_TOKEN>`` header.
+    """
+    if request.META.get('REMOTE_ADDR') in settings.METRICS_ALLOWED_IPS:
+        return True
+    token = settings.METRICS_TOKEN
+    authorization = request.headers.get('Authorization', '')
+    return bool(token) and hmac.compare_digest(
+        authorization.encode(), 'Bearer {}'.format(token).encode()
+    )
+
+
+def export():
+    """
+    Return (content, content type) of metrics in Prometheus text format,
+    aggregated over all worker processes in multiprocess mode.
+    """
+    registry = REGISTRY
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return generate_latest(registry), CONTENT_TYPE_LATEST
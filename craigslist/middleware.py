@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.files.storage import default_storage
+
+from . import instrumentation, metrics, profiling, routers
+
+logger = logging.getLogger('craigslist.performance')
+
+
+class PerformanceMiddleware:
+    """
+    Measure number of queries, time spent in database, templates,
+    storage and total time of request. Report them in request metrics,
+    log requests slower than SLOW_REQUEST_THRESHOLD_MS. Server-Timing
+    header with them is added in DEBUG, for staff members or for
+    everyone with SERVER_TIMING setting, it tells clients how much work
+    request did.
+
+    Should be the first middleware, so total time covers the others.
+    Template time is measured by ``craigslist.instrumentation``
+    templates backend.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrumentation.install(default_storage)
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token, timings = instrumentation.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+        return self.process_timings(request, response, timings)
+
+    async def __acall__(self, request):
+        token, timings = instrumentation.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+        return self.process_timings(request, response, timings)
+
+    def process_timings(self, request, response, timings):
+        """
+        Add Server-Timing header to response if allowed, log slow
+        request and record request metrics.
+        """
+        duration = timings.total
+        total = duration * 1000
+        match = request.resolver_match
+        metrics.observe_request(match.view_name if match else None,
+                                request.method, response.status_code,
+                                duration, timings.queries)
+        durations = {kind: duration * 1000
+                     for kind, duration in timings.durations.items()}
+        if self.server_timing_allowed(request):
+            response['Server-Timing'] = ', '.join([
+                'db;desc="{} queries";dur={:.1f}'.format(
+                    timings.queries, durations['db']),
+                'tpl;dur={:.1f}'.format(durations['template']),
+                'storage;dur={:.1f}'.format(durations['storage']),
+                'total;dur={:.1f}'.format(total),
+            ])
+        if total >= settings.SLOW_REQUEST_THRESHOLD_MS:
+            logger.warning('Slow request %s', json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'queries': timings.queries,
+                'db_ms': round(durations['db'], 1),
+                'template_ms': round(durations['template'], 1),
+                'storage_ms': round(durations['storage'], 1),
+                'total_ms': round(total, 1),
+            }))
+        return response
+
+    @staticmethod
+    def server_timing_allowed(request):
+        """
+        Return True if response of request can show Server-Timing.
+        """
+        if settings.SERVER_TIMING or settings.DEBUG:
+            return True
+        user = getattr(request, 'user', None)
+        return user is not None and user.is_staff
+
+
+class ProfilingMiddleware:
+    """
+    Profile request of staff member who asked for it with
+    ``?profile=sampling`` (or ``cprofile``) query parameter or
+    ``X-Profile`` header. Profile is stored as
+    :model:`craigslist.RequestProfile` and its id is returned in
+    X-Profile-Id header.
+
+    Must be placed after AuthenticationMiddleware. Async views are
+    profiled in event loop thread, so other requests handled at the
+    same time can show up in their profiles.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profiler_class = profiling.requested_profiler(request)
+        if profiler_class is None or not request.user.is_staff:
+            return self.get_response(request)
+        start = time.perf_counter()
+        with profiler_class() as profiler:
+            response = self.get_response(request)
+        profile = profiling.store(request, profiler,
+                                  time.perf_counter() - start)
+        response['X-Profile-Id'] = profile.pk
+        return response
+
+    async def __acall__(self, request):
+        profiler_class = profiling.requested_profiler(request)
+        if profiler_class is None or not await sync_to_async(
+                lambda: request.user.is_staff)():
+            return await self.get_response(request)
+        start = time.perf_counter()
+        with profiler_class() as profiler:
+            response = await self.get_response(request)
+        profile = await sync_to_async(profiling.store)(
+            request, profiler, time.perf_counter() - start
+        )
+        response['X-Profile-Id'] = profile.pk
+        return response
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Let GET and HEAD requests to views with ``read_from_replica``
+    attribute read from replicas (see ``craigslist.routers``). After
+    any other request the browser reads from primary for
+    REPLICA_PIN_SECONDS, so it sees its own changes despite replication
+    lag.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(self.get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        token = routers.start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.pin_primary(request, response)
+
+    async def __acall__(self, request):
+        token = routers.start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            routers.finish_request(token)
+        return self.pin_primary(request, response)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        view_class = getattr(view_func, 'view_class', None)
+        if request.method in ('GET', 'HEAD') and \
+                getattr(view_class, 'read_from_replica', False) and \
+                routers.PIN_COOKIE not in request.COOKIES:
+            routers.allow_replica_reads()
+
+    def pin_primary(self, request, response):
+        """
+        Set cookie pinning reads to primary after request which could
+        write.
+        """
+        if settings.DATABASE_REPLICAS and \
+                request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            response.set_cookie(routers.PIN_COOKIE, '1',
+                                max_age=settings.REPLICA_PIN_SECONDS,
+                                httponly=True, samesite='Lax')
+        return response
@@ -0,0 +1,54 @@
+# Generated by Django 4.0.5 on 2026-10-18 07:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist',
+         '0008_alter_transaction_buyer_alter_transaction_seller'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='announcement',
+            name='status',
+            field=models.IntegerField(
+                choices=[(1, 'nowe'), (2, 'zaakceptowane'),
+                         (3, 'odrzucone'), (4, 'zarezerwowane'),
+                         (5, 'sprzedane')
+                         ],
+                default=1
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                fields=['status', '-created_at', '-id'],
+                name='announcement_status_created'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                fields=['category', 'status', '-created_at', '-id'],
+                name='announcement_category_created'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                fields=['user_who_added', '-created_at', '-id'],
+                name='announcement_user_created'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                condition=models.Q(('status', 2)),
+                fields=['-created_at', '-id'],
+                name='announcement_accepted_created'
+            ),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.0.5 on 2026-10-18 07:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0009_announcement_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='image_variants',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+    ]
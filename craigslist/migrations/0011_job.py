@@ -0,0 +1,54 @@
+# Generated by Django 4.0.5 on 2026-10-18 07:53
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0010_announcement_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(
+                    auto_created=True, primary_key=True,
+                    serialize=False, verbose_name='ID'
+                )),
+                ('task', models.CharField(max_length=128)),
+                ('payload', models.JSONField(default=dict)),
+                ('data', models.BinaryField(null=True)),
+                ('status', models.IntegerField(
+                    choices=[(1, 'oczekuje'), (2, 'wykonane'),
+                             (3, 'nieudane')],
+                    default=1
+                )),
+                ('attempts', models.PositiveIntegerField(default=0)),
+                ('max_attempts', models.PositiveIntegerField(default=5)),
+                ('run_after', models.DateTimeField(
+                    default=django.utils.timezone.now
+                )),
+                ('locked_until', models.DateTimeField(
+                    blank=True, null=True
+                )),
+                ('last_error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='image_processing',
+            field=models.BooleanField(default=False, editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(
+                condition=models.Q(('status', 1)),
+                fields=['run_after'],
+                name='job_pending_run_after'
+            ),
+        ),
+    ]
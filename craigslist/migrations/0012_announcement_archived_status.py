@@ -0,0 +1,24 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0011_job'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='announcement',
+            name='status',
+            field=models.IntegerField(
+                choices=[(1, 'nowe'), (2, 'zaakceptowane'),
+                         (3, 'odrzucone'), (4, 'zarezerwowane'),
+                         (5, 'sprzedane'), (6, 'zarchiwizowane')
+                         ],
+                default=1
+            ),
+        ),
+    ]
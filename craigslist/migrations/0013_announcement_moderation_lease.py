@@ -0,0 +1,39 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:04
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('craigslist', '0012_announcement_archived_status'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='moderation_lease_until',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='moderator',
+            field=models.ForeignKey(
+                blank=True, editable=False, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='moderated_announcements',
+                to=settings.AUTH_USER_MODEL
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                condition=models.Q(('status', 1)),
+                fields=['created_at', 'id'],
+                name='announcement_new_created'
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:16
+
+import craigslist.models
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('craigslist', '0013_announcement_moderation_lease'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RequestProfile',
+            fields=[
+                ('id', models.BigAutoField(
+                    auto_created=True, primary_key=True,
+                    serialize=False, verbose_name='ID'
+                )),
+                ('mode', models.CharField(
+                    choices=[('sampling', 'próbkowanie'),
+                             ('cprofile', 'cProfile')],
+                    max_length=16
+                )),
+                ('method', models.CharField(max_length=8)),
+                ('path', models.CharField(max_length=2048)),
+                ('view_name', models.CharField(blank=True, max_length=200)),
+                ('duration_ms', models.FloatField()),
+                ('file', models.FileField(
+                    storage=craigslist.models.ProfileStorage(), upload_to=''
+                )),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(
+                    null=True,
+                    on_delete=django.db.models.deletion.SET_NULL,
+                    to=settings.AUTH_USER_MODEL
+                )),
+            ],
+        ),
+    ]
@@ -0,0 +1,178 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:22
+
+import craigslist.search
+from django.db import migrations, models
+import django.db.models.deletion
+
+from craigslist.search import search_document
+
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE craigslist_announcement ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION craigslist_announcement_search_vector()
+    RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('simple', NEW.search_title), 'A') ||
+            setweight(to_tsvector('simple', NEW.search_description), 'B');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER craigslist_announcement_search_vector
+    BEFORE INSERT OR UPDATE OF search_title, search_description
+    ON craigslist_announcement
+    FOR EACH ROW EXECUTE PROCEDURE craigslist_announcement_search_vector()
+    """,
+    """
+    UPDATE craigslist_announcement SET search_vector =
+        setweight(to_tsvector('simple', search_title), 'A') ||
+        setweight(to_tsvector('simple', search_description), 'B')
+    """,
+    'CREATE INDEX craigslist_announcement_search_vector '
+    'ON craigslist_announcement USING GIN (search_vector)',
+]
+
+POSTGRESQL_BACKWARD = [
+    'DROP TRIGGER craigslist_announcement_search_vector '
+    'ON craigslist_announcement',
+    'DROP FUNCTION craigslist_announcement_search_vector()',
+    'ALTER TABLE craigslist_announcement DROP COLUMN search_vector',
+]
+
+# External content FTS5 table, triggers keep it in sync with
+# announcements table.
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE craigslist_announcement_fts USING fts5(
+        search_title, search_description,
+        content='craigslist_announcement', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER craigslist_announcement_fts_insert
+    AFTER INSERT ON craigslist_announcement BEGIN
+        INSERT INTO craigslist_announcement_fts(
+            rowid, search_title, search_description
+        ) VALUES (new.id, new.search_title, new.search_description);
+    END
+    """,
+    """
+    CREATE TRIGGER craigslist_announcement_fts_delete
+    AFTER DELETE ON craigslist_announcement BEGIN
+        INSERT INTO craigslist_announcement_fts(
+            craigslist_announcement_fts, rowid, search_title,
+            search_description
+        ) VALUES (
+            'delete', old.id, old.search_title, old.search_description
+        );
+    END
+    """,
+    """
+    CREATE TRIGGER craigslist_announcement_fts_update
+    AFTER UPDATE OF search_title, search_description
+    ON craigslist_announcement BEGIN
+        INSERT INTO craigslist_announcement_fts(
+            craigslist_announcement_fts, rowid, search_title,
+            search_description
+        ) VALUES (
+            'delete', old.id, old.search_title, old.search_description
+        );
+        INSERT INTO craigslist_announcement_fts(
+            rowid, search_title, search_description
+        ) VALUES (new.id, new.search_title, new.search_description);
+    END
+    """,
+    # Rank is bm25 with title weighted 10 times more than description.
+    "INSERT INTO craigslist_announcement_fts(craigslist_announcement_fts, "
+    "rank) VALUES ('rank', 'bm25(10.0, 1.0)')",
+    "INSERT INTO craigslist_announcement_fts(craigslist_announcement_fts) "
+    "VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    'DROP TRIGGER craigslist_announcement_fts_insert',
+    'DROP TRIGGER craigslist_announcement_fts_delete',
+    'DROP TRIGGER craigslist_announcement_fts_update',
+    'DROP TABLE craigslist_announcement_fts',
+]
+
+
+def fill_search_columns(apps, schema_editor):
+    """
+    Store stemmed title and description of existing announcements.
+    """
+    Announcement = apps.get_model('craigslist', 'Announcement')
+    announcements = Announcement.objects.using(schema_editor.connection.alias)
+    batch = []
+    for announcement in announcements.only('title', 'description'). \
+            iterator(chunk_size=2000):
+        announcement.search_title = search_document(announcement.title)
+        announcement.search_description = search_document(
+            announcement.description
+        )
+        batch.append(announcement)
+        if len(batch) == 2000:
+            announcements.bulk_update(
+                batch, ['search_title', 'search_description']
+            )
+            batch = []
+    announcements.bulk_update(batch, ['search_title', 'search_description'])
+
+
+def run_vendor_sql(statements):
+    """
+    Return migration function executing statements for database vendor,
+    databases without full-text search are skipped.
+    """
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0014_requestprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='announcement',
+            name='search_description',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.AddField(
+            model_name='announcement',
+            name='search_title',
+            field=models.TextField(default='', editable=False),
+        ),
+        migrations.CreateModel(
+            name='AnnouncementSearchIndex',
+            fields=[
+                ('announcement', models.OneToOneField(
+                    db_column='rowid',
+                    on_delete=django.db.models.deletion.DO_NOTHING,
+                    primary_key=True, related_name='search_index',
+                    serialize=False, to='craigslist.announcement')),
+                ('document', craigslist.search.MatchDocumentField(
+                    db_column='craigslist_announcement_fts')),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'craigslist_announcement_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(fill_search_columns,
+                             migrations.RunPython.noop),
+        migrations.RunPython(
+            run_vendor_sql({'postgresql': POSTGRESQL_FORWARD,
+                            'sqlite': SQLITE_FORWARD}),
+            run_vendor_sql({'postgresql': POSTGRESQL_BACKWARD,
+                            'sqlite': SQLITE_BACKWARD}),
+        ),
+    ]
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+# Autocomplete looks up stemmed titles of accepted announcements by
+# trigram word similarity, other databases use full-text search table.
+FORWARD = [
+    'CREATE EXTENSION IF NOT EXISTS pg_trgm',
+    'CREATE INDEX announcement_accepted_title_trgm '
+    'ON craigslist_announcement USING GIN (search_title gin_trgm_ops) '
+    'WHERE status = 2',
+]
+
+BACKWARD = [
+    'DROP INDEX announcement_accepted_title_trgm',
+]
+
+
+def run_postgresql(statements):
+    """
+    Return migration function executing statements on PostgreSQL only.
+    """
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor != 'postgresql':
+            return
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0015_announcement_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(run_postgresql(FORWARD),
+                             run_postgresql(BACKWARD)),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0016_announcement_title_trigram'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                condition=models.Q(('status', 2)),
+                fields=['category', 'price', 'id'],
+                name='announcement_accepted_price'
+            ),
+        ),
+    ]
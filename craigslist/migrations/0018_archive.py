@@ -0,0 +1,75 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('craigslist', '0017_announcement_accepted_price'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedAnnouncement',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True,
+                                              serialize=False)),
+                ('title', models.CharField(max_length=128)),
+                ('description', models.TextField()),
+                ('price', models.DecimalField(decimal_places=2,
+                                              max_digits=10)),
+                ('status', models.IntegerField(choices=[
+                    (1, 'nowe'), (2, 'zaakceptowane'), (3, 'odrzucone'),
+                    (4, 'zarezerwowane'), (5, 'sprzedane'),
+                    (6, 'zarchiwizowane')
+                ])),
+                ('image', models.ImageField(
+                    upload_to='staticfiles/%Y/%m/%d')),
+                ('image_variants', models.BooleanField(default=False)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='archived_announcements',
+                    to='craigslist.category')),
+                ('user_who_added', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='archived_announcements',
+                    to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ArchivedReservation',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True,
+                                              serialize=False)),
+                ('announcement', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    to='craigslist.archivedannouncement')),
+                ('reserved_by_user', models.ForeignKey(
+                    on_delete=django.db.models.deletion.CASCADE,
+                    related_name='archived_reservations',
+                    to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                condition=models.Q(('status__in', (3, 5, 6))),
+                fields=['updated_at', 'id'],
+                name='announcement_archivable'
+            ),
+        ),
+        migrations.AddIndex(
+            model_name='archivedannouncement',
+            index=models.Index(
+                fields=['user_who_added', '-created_at', '-id'],
+                name='archived_user_created'
+            ),
+        ),
+    ]
@@ -0,0 +1,183 @@
+# Generated by Django 4.0.5 on 2026-10-18 08:48
+
+import importlib
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+from craigslist.sharding import SHARD_ID_RANGE
+
+# Ids of these tables are allocated from range of shard.
+SHARDED_TABLES = ('craigslist_announcement', 'craigslist_reservation',
+                  'craigslist_transaction')
+
+# SQLite rebuilds announcements table to drop constraints, which drops
+# triggers syncing full-text search table too.
+SQLITE_SEARCH_TRIGGERS = [
+    statement for statement in importlib.import_module(
+        'craigslist.migrations.0015_announcement_search'
+    ).SQLITE_FORWARD
+    if statement.strip().startswith('CREATE TRIGGER')
+]
+
+
+def fill_region(apps, schema_editor):
+    """
+    Store postal district of seller in existing announcements.
+    """
+    alias = schema_editor.connection.alias
+    for name in ('Announcement', 'ArchivedAnnouncement'):
+        announcements = apps.get_model('craigslist', name).objects.using(alias)
+        for region in range(1, 10):
+            announcements.filter(
+                user_who_added__profile__zip_code__startswith=str(region)
+            ).update(region=region)
+
+
+def reserve_id_range(apps, schema_editor):
+    """
+    Start ids of sharded tables at range of shard being migrated.
+    """
+    connection = schema_editor.connection
+    if connection.alias not in settings.DATABASE_SHARDS:
+        return
+    start = settings.DATABASE_SHARDS.index(connection.alias) * SHARD_ID_RANGE
+    if not start:
+        return
+    with connection.cursor() as cursor:
+        for table in SHARDED_TABLES:
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    "SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                    "GREATEST(%s, (SELECT COALESCE(MAX(id), 0) + 1 "
+                    "FROM {})), false)".format(table), [table, start]
+                )
+            elif connection.vendor == 'sqlite':
+                cursor.execute('DELETE FROM sqlite_sequence WHERE name = %s',
+                               [table])
+                cursor.execute(
+                    'INSERT INTO sqlite_sequence (name, seq) '
+                    'SELECT %s, MAX(%s, COALESCE(MAX(id), 0)) '
+                    'FROM {}'.format(table), [table, start - 1]
+                )
+
+
+def create_search_triggers(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    for statement in SQLITE_SEARCH_TRIGGERS:
+        schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('craigslist', '0018_archive'),
+    ]
+
+    operations = [
+        # Reversed rebuild of announcements table drops triggers too.
+        migrations.RunPython(migrations.RunPython.noop,
+                             create_search_triggers),
+        migrations.AddField(
+            model_name='announcement',
+            name='region',
+            field=models.PositiveSmallIntegerField(default=0,
+                                                   editable=False),
+        ),
+        migrations.AddField(
+            model_name='archivedannouncement',
+            name='region',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='announcement',
+            name='category',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to='craigslist.category'),
+        ),
+        migrations.AlterField(
+            model_name='announcement',
+            name='moderator',
+            field=models.ForeignKey(
+                blank=True, db_constraint=False, editable=False, null=True,
+                on_delete=django.db.models.deletion.SET_NULL,
+                related_name='moderated_announcements',
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='announcement',
+            name='user_who_added',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='archivedannouncement',
+            name='category',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='archived_announcements',
+                to='craigslist.category'),
+        ),
+        migrations.AlterField(
+            model_name='archivedannouncement',
+            name='user_who_added',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='archived_announcements',
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='archivedreservation',
+            name='reserved_by_user',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='archived_reservations',
+                to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='reservation',
+            name='reserved_by_user',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='reservation', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='buyer',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='buyer', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='transaction',
+            name='seller',
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name='seller', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(
+                condition=models.Q(('status', 2)),
+                fields=['region', '-created_at', '-id'],
+                name='announcement_accepted_region'
+            ),
+        ),
+        migrations.RunPython(fill_region, migrations.RunPython.noop),
+        migrations.RunPython(reserve_id_range, migrations.RunPython.noop),
+        migrations.RunPython(create_search_triggers,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.0.5 on 2026-10-18 09:24
+
+import importlib
+
+from django.db import migrations, models
+
+sharding = importlib.import_module(
+    'craigslist.migrations.0019_announcement_sharding'
+)
+
+
+def restore_rebuilt_table(apps, schema_editor):
+    """
+    SQLite rebuilds announcements table to add the column, which drops
+    triggers syncing full-text search table and id range of shard too.
+    """
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    sharding.create_search_triggers(apps, schema_editor)
+    sharding.reserve_id_range(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0019_announcement_sharding'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop,
+                             restore_rebuilt_table),
+        migrations.AddField(
+            model_name='announcement',
+            name='image_widths',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='archivedannouncement',
+            name='image_widths',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.RunPython(restore_rebuilt_table,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.0.5 on 2026-10-18 11:02
+
+import importlib
+
+from django.db import migrations, models
+
+# SQLite rebuilds announcements table to add the column, search triggers
+# and id range of shard are restored as by 0020.
+restore_rebuilt_table = importlib.import_module(
+    'craigslist.migrations.0020_announcement_image_widths'
+).restore_rebuilt_table
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0020_announcement_image_widths'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop,
+                             restore_rebuilt_table),
+        migrations.AddField(
+            model_name='announcement',
+            name='image_error',
+            field=models.CharField(blank=True, editable=False,
+                                   max_length=200),
+        ),
+        migrations.RunPython(restore_rebuilt_table,
+                             migrations.RunPython.noop),
+    ]
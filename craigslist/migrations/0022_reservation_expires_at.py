@@ -0,0 +1,38 @@
+# Generated by Django 4.0.5 on 2026-10-18 14:40
+
+import importlib
+
+import craigslist.models
+from django.db import migrations, models
+
+# SQLite rebuilds reservations table to add the column, id range of shard
+# is reserved again as by 0019.
+reserve_id_range = importlib.import_module(
+    'craigslist.migrations.0019_announcement_sharding'
+).reserve_id_range
+
+
+def restore_rebuilt_table(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        reserve_id_range(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('craigslist', '0021_announcement_image_error'),
+    ]
+
+    operations = [
+        migrations.RunPython(migrations.RunPython.noop,
+                             restore_rebuilt_table),
+        migrations.AddField(
+            model_name='reservation',
+            name='expires_at',
+            field=models.DateTimeField(
+                default=craigslist.models.reservation_expiry
+            ),
+        ),
+        migrations.RunPython(restore_rebuilt_table,
+                             migrations.RunPython.noop),
+    ]
@@ -1,9 +1,18 @@
-from django.db import models
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db import models, transaction
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from phonenumber_field.modelfields import PhoneNumberField
 from django.db.models.signals import post_save
 from django.dispatch import receiver
 
+from .search import FTS_TABLE, MatchDocumentField, search_document
+from .sharding import shard_for_id
+
 User = get_user_model()
 
 STATUS = (
@@ -11,7 +20,19 @@ STATUS = (
     (2, 'zaakceptowane'),
     (3, 'odrzucone'),
     (4, 'zarezerwowane'),
-    (5, 'sprzedane')
+    (5, 'sprzedane'),
+    (6, 'zarchiwizowane'),
+)
+
+JOB_STATUS = (
+    (1, 'oczekuje'),
+    (2, 'wykonane'),
+    (3, 'nieudane'),
+)
+
+PROFILE_MODES = (
+    ('sampling', 'próbkowanie'),
+    ('cprofile', 'cProfile'),
 )
 
 
@@ -32,6 +53,147 @@ class Category(models.Model):
         return self.category
 
 
+class AnnouncementQuerySet(models.QuerySet):
+    """
+    Status transitions executed as single conditional UPDATE, so
+    concurrent requests can not both move announcement to the same status.
+    """
+    def shard_of(self, announcement_id):
+        """
+        Return database of announcement, shard picked by its id unless
+        queryset has database set.
+        """
+        return self._db or shard_for_id(announcement_id)
+
+    def transition(self, announcement_id, from_status, to_status):
+        """
+        Change status of announcement if it still has from_status.
+        Touch only status and updated_at columns.
+        Return True if announcement was changed.
+        """
+        from .cache import invalidate_categories
+
+        using = self.shard_of(announcement_id)
+        updated = self.using(using).filter(
+            pk=announcement_id, status=from_status
+        ).update(status=to_status, updated_at=timezone.now())
+        if updated and 2 in (from_status, to_status):
+            invalidate_categories(using=using)
+        return bool(updated)
+
+    def reserve(self, announcement_id, user):
+        """
+        Reserve accepted announcement (status 2 -> 4) for user, or
+        reserved one whose reservation expired. Return created
+        reservation or None if announcement is not available any more
+        or user added it.
+        """
+        using = self.shard_of(announcement_id)
+        with transaction.atomic(using=using):
+            reserved = self.using(using).exclude(
+                user_who_added=user
+            ).transition(announcement_id, 2, 4)
+            if not reserved:
+                locked = self.locked_reservation(announcement_id, using)
+                if locked is None:
+                    return None
+                seller_id, current = locked
+                if seller_id == user.pk or not current.is_expired:
+                    return None
+            return Reservation.objects.using(using).create(
+                announcement_id=announcement_id,
+                reserved_by_user=user,
+            )
+
+    def confirm_purchase(self, announcement_id, user):
+        """
+        Confirm receipt of announcement (status 4 -> 5) reserved by user.
+        Only current reservation which did not expire can be confirmed.
+        Return created transaction or None if user can not confirm it.
+        """
+        using = self.shard_of(announcement_id)
+        with transaction.atomic(using=using):
+            locked = self.locked_reservation(announcement_id, using)
+            if locked is None:
+                return None
+            seller_id, current = locked
+            if current.reserved_by_user_id != user.pk or current.is_expired:
+                return None
+            # Reservation can not change while announcement row is
+            # locked, so only status has to be checked again by UPDATE.
+            if not self.using(using).transition(announcement_id, 4, 5):
+                return None
+            return Transaction.objects.using(using).create(
+                seller_id=seller_id,
+                buyer=user,
+            )
+
+    def locked_reservation(self, announcement_id, using):
+        """
+        Lock reserved announcement (status 4) until end of transaction,
+        return pair of its seller id and current reservation or None if
+        it is not reserved.
+        """
+        seller_id = self.using(using).select_for_update().filter(
+            pk=announcement_id, status=4,
+        ).values_list('user_who_added_id', flat=True).first()
+        if seller_id is None:
+            return None
+        # Read after the lock, so reservation added meanwhile is seen.
+        reservation = Reservation.objects.using(using).filter(
+            announcement_id=announcement_id,
+        ).order_by('-id').first()
+        if reservation is None:
+            return None
+        return seller_id, reservation
+
+    def claim_for_moderation(self, user, batch_size, lease_seconds):
+        """
+        Lease up to batch_size new announcements to moderator, starting
+        with the ones user already holds. Rows locked by other moderators
+        are skipped instead of waited for, announcements of moderator
+        who left are handed out again once their lease expires.
+        Shards are claimed from one after other until batch is full.
+        Return list of claimed announcement ids.
+        """
+        now = timezone.now()
+        claimed = []
+        for using in [self._db] if self._db else settings.DATABASE_SHARDS:
+            if len(claimed) >= batch_size:
+                break
+            announcements = self.using(using)
+            with transaction.atomic(using=using):
+                ids = list(announcements.select_for_update(
+                    skip_locked=True
+                ).filter(
+                    models.Q(moderation_lease_until__isnull=True)
+                    | models.Q(moderation_lease_until__lt=now)
+                    | models.Q(moderator=user),
+                    status=1,
+                ).order_by(
+                    models.Case(models.When(moderator=user, then=0),
+                                default=1),
+                    'created_at', 'id',
+                ).values_list('pk', flat=True)[:batch_size - len(claimed)])
+                announcements.filter(pk__in=ids).update(
+                    moderator=user,
+                    moderation_lease_until=now + timedelta(
+                        seconds=lease_seconds),
+                )
+            claimed.extend(ids)
+        return claimed
+
+    def moderate(self, announcement_id, user, to_status):
+        """
+        Accept or reject new announcement claimed by user.
+        Return False if announcement was moderated already or
+        its lease was handed to other moderator.
+        """
+        return self.filter(moderator=user).transition(
+            announcement_id, 1, to_status
+        )
+
+
 class Announcement(models.Model):
     """
     Stores a single announcement, related to :model:`craigslist.Category` and
@@ -40,13 +202,134 @@ class Announcement(models.Model):
     title = models.CharField(max_length=128)
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2)
-    category = models.ForeignKey(Category, on_delete=models.CASCADE)
-    user_who_added = models.ForeignKey(User, on_delete=models.CASCADE)
+    # Rows can be stored on shards, relations to default database have
+    # no foreign key constraints.
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 db_constraint=False)
+    user_who_added = models.ForeignKey(User, on_delete=models.CASCADE,
+                                       db_constraint=False)
+    # Postal district of seller when announcement was added, picks
+    # shard of announcement, see craigslist.sharding.
+    region = models.PositiveSmallIntegerField(default=0, editable=False)
     status = models.IntegerField(choices=STATUS, default=1)
     image = models.ImageField(upload_to='staticfiles/%Y/%m/%d')
+    image_variants = models.BooleanField(default=False, editable=False)
+    # Widths in pixels of generated variants by name, portrait images
+    # are narrower than their longest side.
+    image_widths = models.JSONField(default=dict, blank=True,
+                                    editable=False)
+    image_processing = models.BooleanField(default=False, editable=False)
+    # Why the last uploaded image could not be processed.
+    image_error = models.CharField(max_length=200, blank=True,
+                                   editable=False)
+    moderator = models.ForeignKey(User, on_delete=models.SET_NULL,
+                                  null=True, blank=True, editable=False,
+                                  related_name='moderated_announcements',
+                                  db_constraint=False)
+    moderation_lease_until = models.DateTimeField(null=True, blank=True,
+                                                  editable=False)
+    # Stemmed title and description indexed by full-text search, see
+    # craigslist.search.
+    search_title = models.TextField(default='', editable=False)
+    search_description = models.TextField(default='', editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = AnnouncementQuerySet.as_manager()
+
+    def save(self, *args, **kwargs):
+        """
+        Keep search columns in sync with title and description.
+        """
+        self.search_title = search_document(self.title)
+        self.search_description = search_document(self.description)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            update_fields = set(update_fields)
+            if 'title' in update_fields:
+                update_fields.add('search_title')
+            if 'description' in update_fields:
+                update_fields.add('search_description')
+            kwargs['update_fields'] = update_fields
+        super().save(*args, **kwargs)
+
+    # Status and (category_id, price) as read from database, None for
+    # not saved announcement.
+    loaded_status = None
+    loaded_listing = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember status, category and price loaded from database to
+        detect their changes.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_status = instance.__dict__.get('status')
+        instance.loaded_listing = (instance.__dict__.get('category_id'),
+                                   instance.__dict__.get('price'))
+        return instance
+
+    @property
+    def current_reservation(self):
+        """
+        Return the latest reservation, use prefetched reservations
+        if view loaded them.
+        """
+        reservations = getattr(self, 'prefetched_reservations', None)
+        if reservations is not None:
+            return reservations[-1] if reservations else None
+        return self.reservation_set.last()
+
+    class Meta:
+        # Match the feeds paginated by (created_at, id), newest first.
+        indexes = [
+            models.Index(fields=['status', '-created_at', '-id'],
+                         name='announcement_status_created'),
+            models.Index(fields=['category', 'status', '-created_at', '-id'],
+                         name='announcement_category_created'),
+            models.Index(fields=['user_who_added', '-created_at', '-id'],
+                         name='announcement_user_created'),
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(status=2),
+                         name='announcement_accepted_created'),
+            # Moderation queue, new announcements oldest first.
+            models.Index(fields=['created_at', 'id'],
+                         condition=models.Q(status=1),
+                         name='announcement_new_created'),
+            # Category pages sorted by price or filtered by price range,
+            # price facets are counted by index only scan.
+            models.Index(fields=['category', 'price', 'id'],
+                         condition=models.Q(status=2),
+                         name='announcement_accepted_price'),
+            # Region pages.
+            models.Index(fields=['region', '-created_at', '-id'],
+                         condition=models.Q(status=2),
+                         name='announcement_accepted_region'),
+            # Rows waiting to be moved to archive tables.
+            models.Index(fields=['updated_at', 'id'],
+                         condition=models.Q(status__in=(3, 5, 6)),
+                         name='announcement_archivable'),
+        ]
+
+
+class AnnouncementSearchIndex(models.Model):
+    """
+    SQLite FTS5 table indexing search columns of announcements, kept
+    in sync by triggers created in migration. Only joined by
+    ``craigslist.search.search``, does not exist on other databases.
+    """
+    announcement = models.OneToOneField(
+        Announcement, on_delete=models.DO_NOTHING, primary_key=True,
+        db_column='rowid', related_name='search_index',
+    )
+    document = MatchDocumentField(db_column=FTS_TABLE)
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = FTS_TABLE
+
 
 class Profile(models.Model):
     """
@@ -58,31 +341,106 @@ class Profile(models.Model):
     zip_code = models.CharField(max_length=6, blank=True)
     phone = PhoneNumberField(blank=True, null=True, unique=True)
 
+    # Field values as read from database or last saved, None for not
+    # saved profile.
+    loaded_values = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        """
+        Remember loaded field values to save only changed fields.
+        """
+        instance = super().from_db(db, field_names, values)
+        instance.loaded_values = instance.field_values()
+        return instance
+
+    def field_values(self):
+        """
+        Return dict of loaded (not deferred) field values by attname.
+        """
+        return {
+            field.attname: self.__dict__[field.attname]
+            for field in self._meta.concrete_fields
+            if not field.primary_key and field.attname in self.__dict__
+        }
+
+    def changed_fields(self):
+        """
+        Return names of fields changed since profile was loaded or saved.
+        """
+        return [
+            name for name, value in self.field_values().items()
+            if name not in self.loaded_values or
+            self.loaded_values[name] != value
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        Update only changed fields, skip saving unchanged profile.
+        """
+        if self.loaded_values is not None and not self._state.adding and \
+                kwargs.get('update_fields') is None and \
+                not kwargs.get('force_insert'):
+            changed = self.changed_fields()
+            if not changed:
+                return
+            kwargs['update_fields'] = changed
+        super().save(*args, **kwargs)
+        values = self.field_values()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and self.loaded_values is not None:
+            # Fields left out stay changed.
+            names = {self._meta.get_field(name).attname
+                     for name in update_fields}
+            values = dict(self.loaded_values, **{
+                name: value for name, value in values.items()
+                if name in names
+            })
+        self.loaded_values = values
+
+    @classmethod
+    def of(cls, user):
+        """
+        Return profile of user, create it for users created without it,
+        e.g. by bulk_create.
+        """
+        try:
+            return user.profile
+        except cls.DoesNotExist:
+            profile, _ = cls.objects.get_or_create(user=user)
+            user.profile = profile
+            return profile
+
     @receiver(post_save, sender=User)
     def create_user_profile(sender, instance, created, **kwargs):
         """
-        Create user profile after create user
+        Create user profile after create user. Later saves of user,
+        e.g. last_login update on every login, do not touch profile.
         """
         if created:
             Profile.objects.create(user=instance)
 
-    @receiver(post_save, sender=User)
-    def save_user_profile(sender, instance, **kwargs):
-        """
-        Save profile instance
-        """
-        instance.profile.save()
+
+def reservation_expiry():
+    return timezone.now() + timedelta(days=settings.RESERVATION_DAYS)
 
 
 class Reservation(models.Model):
     """
     Stores a single reservation, related to
     :model:`craigslist.Announcement` and
-    :model:`craigslist.User`.
+    :model:`craigslist.User`. Purchase can be confirmed until
+    expires_at, after that other user can reserve the announcement.
     """
     announcement = models.ForeignKey(Announcement, on_delete=models.CASCADE)
     reserved_by_user = models.ForeignKey(User, on_delete=models.CASCADE,
-                                         related_name="reservation")
+                                         related_name="reservation",
+                                         db_constraint=False)
+    expires_at = models.DateTimeField(default=reservation_expiry)
+
+    @property
+    def is_expired(self):
+        return self.expires_at <= timezone.now()
 
 
 class Transaction(models.Model):
@@ -92,6 +450,138 @@ class Transaction(models.Model):
     :model:`auth.User`.
     """
     seller = models.ForeignKey(User, on_delete=models.CASCADE,
-                               related_name="seller")
+                               related_name="seller", db_constraint=False)
     buyer = models.ForeignKey(User, on_delete=models.CASCADE,
-                              related_name="buyer")
+                              related_name="buyer", db_constraint=False)
+
+
+class ArchivedAnnouncement(models.Model):
+    """
+    Stores announcement moved out of :model:`craigslist.Announcement`
+    table after it was rejected, sold or archived, see
+    ``craigslist.archive``. Keeps id of the live announcement.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    title = models.CharField(max_length=128)
+    description = models.TextField()
+    price = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, on_delete=models.CASCADE,
+                                 related_name='archived_announcements',
+                                 db_constraint=False)
+    user_who_added = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='archived_announcements', db_constraint=False,
+    )
+    region = models.PositiveSmallIntegerField(default=0)
+    status = models.IntegerField(choices=STATUS)
+    image = models.ImageField(upload_to='staticfiles/%Y/%m/%d')
+    image_variants = models.BooleanField(default=False)
+    image_widths = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    # Fields copied from live announcement.
+    copied_fields = ('id', 'title', 'description', 'price', 'category_id',
+                     'user_who_added_id', 'region', 'status', 'image',
+                     'image_variants', 'image_widths', 'created_at',
+                     'updated_at')
+
+    @classmethod
+    def from_announcement(cls, announcement):
+        return cls(**{field: getattr(announcement, field)
+                      for field in cls.copied_fields})
+
+    class Meta:
+        # User announcements are listed with live ones, newest first.
+        indexes = [
+            models.Index(fields=['user_who_added', '-created_at', '-id'],
+                         name='archived_user_created'),
+        ]
+
+
+class ArchivedReservation(models.Model):
+    """
+    Stores reservation of :model:`craigslist.ArchivedAnnouncement`,
+    keeps id of the live reservation.
+    """
+    id = models.BigIntegerField(primary_key=True)
+    announcement = models.ForeignKey(ArchivedAnnouncement,
+                                     on_delete=models.CASCADE)
+    reserved_by_user = models.ForeignKey(
+        User, on_delete=models.CASCADE,
+        related_name='archived_reservations', db_constraint=False,
+    )
+
+
+class Job(models.Model):
+    """
+    Stores a single background job run by ``run_jobs`` command.
+    Optional binary data (e.g. uploaded image) is kept with the job,
+    so worker does not need access to web process filesystem.
+    """
+    task = models.CharField(max_length=128)
+    payload = models.JSONField(default=dict)
+    data = models.BinaryField(null=True, editable=False)
+    status = models.IntegerField(choices=JOB_STATUS, default=1)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['run_after'],
+                         condition=models.Q(status=1),
+                         name='job_pending_run_after'),
+        ]
+
+    def __str__(self):
+        return '{} #{}'.format(self.task, self.pk)
+
+
+class ProfileStorage(FileSystemStorage):
+    """
+    Store request profiles on local disk in PROFILE_STORE_DIR.
+    """
+    @property
+    def base_location(self):
+        return settings.PROFILE_STORE_DIR
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+
+class RequestProfileQuerySet(models.QuerySet):
+    def prune(self, keep=None):
+        """
+        Delete all but keep (PROFILE_STORE_MAX_FILES) latest profiles.
+        """
+        if keep is None:
+            keep = settings.PROFILE_STORE_MAX_FILES
+        stale = self.order_by('-created_at', '-id')[keep:]
+        for profile in stale:
+            profile.delete()
+
+
+class RequestProfile(models.Model):
+    """
+    Stores a single profile of request made by staff member,
+    related to :model:`auth.User`.
+    """
+    mode = models.CharField(max_length=16, choices=PROFILE_MODES)
+    method = models.CharField(max_length=8)
+    path = models.CharField(max_length=2048)
+    view_name = models.CharField(max_length=200, blank=True)
+    user = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
+    duration_ms = models.FloatField()
+    file = models.FileField(storage=ProfileStorage())
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    objects = RequestProfileQuerySet.as_manager()
+
+    def __str__(self):
+        return '{} {}'.format(self.method, self.path)
@@ -0,0 +1,236 @@
+import base64
+import binascii
+import datetime
+import functools
+import json
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """
+    Keep full precision of datetime values, DjangoJSONEncoder rounds
+    them to milliseconds which would break seeking on created_at.
+    """
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class InvalidCursor(ValueError):
+    """
+    Raised when a cursor from the query string can not be decoded.
+    """
+
+
+class KeysetPage:
+    """
+    Single page of objects returned by :class:`KeysetPaginator`.
+    """
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    @property
+    def has_other_pages(self):
+        return self.has_next or self.has_previous
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """
+    Paginate queryset by seeking on ordering columns instead of OFFSET.
+
+    Ordering must end with an unique column (e.g. ``id``) so every row has
+    a distinct position. Every page costs a single ``LIMIT per_page + 1``
+    query, no matter how deep it is, and no ``COUNT(*)`` is ever issued.
+    """
+    def __init__(self, queryset, per_page, ordering=('-created_at', '-id')):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.ordering = tuple(ordering)
+
+    @property
+    def fields(self):
+        return [field.lstrip('-') for field in self.ordering]
+
+    def encode_cursor(self, obj):
+        """
+        Return opaque cursor pointing at given object.
+        """
+        values = [getattr(obj, field) for field in self.fields]
+        raw = json.dumps(values, cls=CursorEncoder).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        """
+        Return list of ordering values stored in cursor.
+        """
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        except (binascii.Error, ValueError, TypeError):
+            raise InvalidCursor(cursor)
+        if not isinstance(values, list) or len(values) != len(self.fields):
+            raise InvalidCursor(cursor)
+        return [self._to_python(field, value)
+                for field, value in zip(self.fields, values)]
+
+    def _to_python(self, field_name, value):
+        try:
+            field = self.queryset.model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            # Annotated column (e.g. search rank), value is already plain.
+            return value
+        try:
+            return field.to_python(value)
+        except ValidationError:
+            raise InvalidCursor(value)
+
+    def _seek(self, values, forward):
+        """
+        Return filter selecting rows placed after (or before) values.
+        """
+        condition = Q()
+        for index, field in enumerate(self.ordering):
+            descending = field.startswith('-')
+            name = field.lstrip('-')
+            lookup = 'lt' if descending == forward else 'gt'
+            branch = Q(**{'{}__{}'.format(name, lookup): values[index]})
+            for previous, value in zip(self.fields[:index], values[:index]):
+                branch &= Q(**{previous: value})
+            condition |= branch
+        # Redundant bound on the first column lets database scan index
+        # range starting at cursor, OR alone is applied as row filter.
+        descending = self.ordering[0].startswith('-')
+        lookup = 'lte' if descending == forward else 'gte'
+        return Q(**{'{}__{}'.format(self.fields[0], lookup): values[0]}) \
+            & condition
+
+    @staticmethod
+    def _reverse(ordering):
+        return [field[1:] if field.startswith('-') else '-' + field
+                for field in ordering]
+
+    def get_queryset(self, after=None, before=None):
+        """
+        Return ordered queryset of rows placed after or before cursor.
+        Rows before cursor are returned in reversed order.
+        """
+        if before:
+            queryset = self.queryset.order_by(*self._reverse(self.ordering))
+            return queryset.filter(
+                self._seek(self.decode_cursor(before), forward=False)
+            )
+        queryset = self.queryset.order_by(*self.ordering)
+        if after:
+            queryset = queryset.filter(
+                self._seek(self.decode_cursor(after), forward=True)
+            )
+        return queryset
+
+    def page(self, after=None, before=None):
+        """
+        Return page of objects after or before given cursor.
+        Without cursors first page is returned.
+        """
+        queryset = self.get_queryset(after=after, before=before)
+        return self.make_page(list(queryset[:self.per_page + 1]),
+                              after, before)
+
+    def make_page(self, rows, after=None, before=None):
+        """
+        Return page of up to per_page + 1 rows fetched in query order.
+        """
+        if before:
+            has_previous = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            rows.reverse()
+            has_next = True
+        else:
+            has_next = len(rows) > self.per_page
+            rows = rows[:self.per_page]
+            has_previous = bool(after)
+
+        if not rows:
+            return KeysetPage(rows)
+        return KeysetPage(
+            rows,
+            next_cursor=self.encode_cursor(rows[-1]) if has_next else None,
+            previous_cursor=(self.encode_cursor(rows[0])
+                             if has_previous else None),
+        )
+
+
+class MergedKeysetPaginator(KeysetPaginator):
+    """
+    Paginate several querysets sharing ordering columns as one list,
+    e.g. live and archived announcements. Every page costs one
+    ``LIMIT per_page + 1`` query per queryset. Values of the last
+    ordering column must be unique across querysets.
+    """
+    def __init__(self, querysets, per_page, ordering=('-created_at', '-id')):
+        super().__init__(querysets[0], per_page, ordering)
+        self.querysets = querysets
+
+    def page(self, after=None, before=None):
+        rows = []
+        for queryset in self.querysets:
+            paginator = KeysetPaginator(queryset, self.per_page,
+                                        ordering=self.ordering)
+            rows.extend(paginator.get_queryset(after=after, before=before)
+                        [:self.per_page + 1])
+        ordering = self._reverse(self.ordering) if before else self.ordering
+        rows.sort(key=functools.cmp_to_key(
+            lambda first, second: self._compare(ordering, first, second)
+        ))
+        return self.make_page(rows[:self.per_page + 1], after, before)
+
+    @staticmethod
+    def _compare(ordering, first, second):
+        for field in ordering:
+            name = field.lstrip('-')
+            a, b = getattr(first, name), getattr(second, name)
+            if a != b:
+                result = -1 if a < b else 1
+                return -result if field.startswith('-') else result
+        return 0
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator using PostgreSQL planner estimate of rows number instead
+    of COUNT(*) when the estimate is large. Small results and other
+    databases are counted exactly.
+    """
+    exact_count_threshold = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if connections[queryset.db].vendor == 'postgresql':
+            plan = json.loads(queryset.explain(format='json'))
+            estimate = plan[0]['Plan']['Plan Rows']
+            if estimate > self.exact_count_threshold:
+                return estimate
+        return super().count
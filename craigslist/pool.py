@@ -0,0 +1,194 @@
+import collections
+import contextlib
+import logging
+import os
+import threading
+import time
+
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# (alias, connection parameters) -> ConnectionPool of this process.
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+class PoolTimeout(Exception):
+    """
+    Raised when no connection was returned to full pool in time.
+    """
+
+
+class ConnectionPool:
+    """
+    Open connections of single database shared by all threads of the
+    process, so WSGI threads and threads running sync code of ASGI
+    requests reuse connections instead of opening one per request.
+
+    Connections idle for more than health_check_interval seconds are
+    checked before they are handed out, broken ones are replaced.
+    """
+    def __init__(self, alias, connect, is_healthy, max_size, timeout,
+                 health_check_interval):
+        self.alias = alias
+        self.connect = connect
+        self.is_healthy = is_healthy
+        self.max_size = max_size
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        # (connection, monotonic time of return), the latest last.
+        self._idle = collections.deque()
+        self._size = 0
+        self._condition = threading.Condition()
+
+    @property
+    def size(self):
+        return self._size
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def checkout(self):
+        """
+        Return connection, open new one if all are in use and pool is not
+        full, otherwise wait up to timeout seconds for returned one.
+        """
+        started = time.monotonic()
+        with self._condition:
+            while not self._idle and self._size >= self.max_size:
+                remaining = self.timeout - (time.monotonic() - started)
+                if remaining <= 0:
+                    metrics.DB_POOL_TIMEOUTS.labels(self.alias).inc()
+                    raise PoolTimeout(
+                        'No connection to {} returned to pool in {} s'.format(
+                            self.alias, self.timeout))
+                self._condition.wait(remaining)
+            if self._idle:
+                # The most recently used connection is the least likely
+                # to be dropped by server or network.
+                connection, returned_at = self._idle.pop()
+            else:
+                connection, returned_at = None, None
+                self._size += 1
+        metrics.DB_POOL_WAIT.labels(self.alias).observe(
+            time.monotonic() - started)
+        try:
+            if connection is not None and \
+                    time.monotonic() - returned_at >= \
+                    self.health_check_interval and \
+                    not self.is_healthy(connection):
+                metrics.DB_POOL_HEALTH_CHECK_FAILURES.labels(
+                    self.alias).inc()
+                self._close(connection)
+                connection = None
+            if connection is None:
+                connection = self.connect()
+                metrics.DB_POOL_CONNECTIONS_OPENED.labels(self.alias).inc()
+        except Exception:
+            self._release_slot()
+            raise
+        metrics.DB_POOL_CHECKED_OUT.labels(self.alias).inc()
+        return connection
+
+    def checkin(self, connection, reusable=True):
+        """
+        Return connection to pool, close it if it is not reusable.
+        """
+        metrics.DB_POOL_CHECKED_OUT.labels(self.alias).dec()
+        if not reusable:
+            self._close(connection)
+            self._release_slot()
+            return
+        with self._condition:
+            self._idle.append((connection, time.monotonic()))
+            self._condition.notify()
+
+    def close_idle(self):
+        """
+        Close connections which are not in use.
+        """
+        with self._condition:
+            idle, self._idle = self._idle, collections.deque()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for connection, _ in idle:
+            self._close(connection)
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    def _close(self, connection):
+        try:
+            connection.close()
+        except Exception:
+            logger.warning('Can not close connection to %s', self.alias,
+                           exc_info=True)
+
+
+def get_pool(alias, params, factory):
+    """
+    Return pool of process for database alias connected with params,
+    created by factory on first use.
+    """
+    key = (alias, repr(sorted(params.items())))
+    with _pools_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = _pools[key] = factory()
+        return pool
+
+
+def close_pools(alias=None):
+    """
+    Close idle connections of all pools or pools of database alias.
+    """
+    with _pools_lock:
+        pools = [pool for (pool_alias, _), pool in _pools.items()
+                 if alias in (None, pool_alias)]
+    for pool in pools:
+        pool.close_idle()
+
+
+def _forget_pools():
+    # Forked process must not use sockets of parent, they are closed
+    # by the parent.
+    global _pools_lock
+    _pools.clear()
+    _pools_lock = threading.Lock()
+
+
+os.register_at_fork(after_in_child=_forget_pools)
+
+
+@contextlib.contextmanager
+def statement_timeout(milliseconds, using=DEFAULT_DB_ALIAS):
+    """
+    Cancel PostgreSQL statements running longer than milliseconds
+    inside the block, then restore timeout of the connection (its
+    STATEMENT_TIMEOUT setting). Inside transaction the timeout holds
+    until the transaction ends. Other databases ignore it.
+    """
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    # Aborted transaction could not reset the timeout, SET LOCAL is
+    # reset by its rollback.
+    local = connection.in_atomic_block
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'SET {}statement_timeout = %s'.format('LOCAL ' if local else ''),
+            [int(milliseconds)]
+        )
+    try:
+        yield
+    finally:
+        if not local and connection.connection is not None:
+            with connection.cursor() as cursor:
+                cursor.execute('RESET statement_timeout')
@@ -0,0 +1,126 @@
+import cProfile
+import collections
+import marshal
+import sys
+import threading
+
+from django.core.files.base import ContentFile
+from django.utils import timezone
+
+from .models import RequestProfile
+
+# Seconds between samples of sampling profiler. Thread running
+# Python code holds GIL for up to sys.getswitchinterval() (5 ms),
+# so CPU-bound code is sampled less often.
+SAMPLING_INTERVAL = 0.001
+
+
+class SamplingProfiler:
+    """
+    Sample stack of profiled thread from background thread and count
+    identical stacks. Output is in folded stacks format, read by
+    flamegraph.pl and speedscope.
+    """
+    extension = 'folded'
+
+    def __init__(self, interval=SAMPLING_INTERVAL):
+        self.interval = interval
+        self.stacks = collections.Counter()
+        self._stop = threading.Event()
+
+    def __enter__(self):
+        self.thread_id = threading.get_ident()
+        self._sampler = threading.Thread(target=self.sample, daemon=True)
+        self._sampler.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._sampler.join()
+
+    def sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                self.stacks[self.fold(frame)] += 1
+
+    @staticmethod
+    def fold(frame):
+        """
+        Return stack of frame as root first, semicolon separated
+        module:function names.
+        """
+        names = []
+        while frame is not None:
+            names.append('{}:{}'.format(
+                frame.f_globals.get('__name__', '?'), frame.f_code.co_name
+            ))
+            frame = frame.f_back
+        return ';'.join(reversed(names))
+
+    def dump(self):
+        return ''.join(
+            '{} {}\n'.format(stack, count)
+            for stack, count in self.stacks.most_common()
+        ).encode()
+
+
+class DeterministicProfiler:
+    """
+    Record every function call with cProfile. Output is pstats file,
+    read by snakeviz, flameprof or ``python -m pstats``.
+    """
+    extension = 'prof'
+
+    def __enter__(self):
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.profile.disable()
+
+    def dump(self):
+        self.profile.create_stats()
+        return marshal.dumps(self.profile.stats)
+
+
+PROFILERS = {
+    'sampling': SamplingProfiler,
+    'cprofile': DeterministicProfiler,
+}
+
+
+def requested_profiler(request):
+    """
+    Return profiler class requested by ``profile`` query parameter or
+    ``X-Profile`` header, None if profiling is not requested.
+    """
+    mode = request.GET.get('profile') or request.headers.get('X-Profile')
+    return PROFILERS.get(mode)
+
+
+def store(request, profiler, duration):
+    """
+    Save profile of request, keep only PROFILE_STORE_MAX_FILES latest
+    profiles. Return saved :model:`craigslist.RequestProfile`.
+    """
+    match = request.resolver_match
+    view_name = match.view_name if match else ''
+    mode = next(mode for mode, profiler_class in PROFILERS.items()
+                if isinstance(profiler, profiler_class))
+    profile = RequestProfile(
+        mode=mode,
+        method=request.method,
+        path=request.get_full_path()[:2048],
+        view_name=view_name,
+        user=request.user,
+        duration_ms=duration * 1000,
+    )
+    name = '{:%Y%m%d-%H%M%S}-{}-{}.{}'.format(
+        timezone.now(), view_name or 'unknown', mode, profiler.extension
+    )
+    profile.file.save(name, ContentFile(profiler.dump()), save=False)
+    profile.save()
+    RequestProfile.objects.prune()
+    return profile
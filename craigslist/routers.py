@@ -0,0 +1,186 @@
+import contextlib
+import logging
+import random
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+
+from .sharding import is_sharded_model, shard_for_id, shard_for_region
+
+logger = logging.getLogger(__name__)
+
+# Browser which wrote recently reads from primary while it has this cookie,
+# so it sees its own changes.
+PIN_COOKIE = 'primary_pin'
+
+# Routing state of current request, None outside of requests, so
+# management commands and jobs always read from primary.
+_state = ContextVar('craigslist_db_routing', default=None)
+
+# alias -> (monotonic time of check, lag in seconds or None if down)
+_lags = {}
+
+
+class RoutingState:
+    """
+    Mutable routing state shared by middleware hooks of single request.
+    """
+    replica_reads = False
+
+
+def start_request():
+    """
+    Start routing state of request, reads go to primary until
+    :func:`allow_replica_reads` is called. Return token for
+    :func:`finish_request`.
+    """
+    return _state.set(RoutingState())
+
+
+def finish_request(token):
+    _state.reset(token)
+
+
+def allow_replica_reads():
+    state = _state.get()
+    if state is not None:
+        state.replica_reads = True
+
+
+@contextlib.contextmanager
+def use_primary():
+    """
+    Read from primary inside the block, e.g. to fill shared cache with
+    data which is not lagging behind.
+    """
+    token = _state.set(None)
+    try:
+        yield
+    finally:
+        _state.reset(token)
+
+
+def replica_lag(alias):
+    """
+    Return replication lag of replica in seconds, None if it can not
+    be reached. Checked at most every REPLICA_LAG_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    checked_at, lag = _lags.get(alias, (None, None))
+    if checked_at is not None and \
+            now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return lag
+    connection = connections[alias]
+    try:
+        with connection.cursor() as cursor:
+            if connection.vendor == 'postgresql':
+                # Time since last replayed transaction, it grows also
+                # when primary has nothing to replicate.
+                cursor.execute(
+                    'SELECT CASE WHEN pg_is_in_recovery() THEN '
+                    'COALESCE(EXTRACT(EPOCH FROM now() - '
+                    'pg_last_xact_replay_timestamp()), 0) ELSE 0 END'
+                )
+                lag = float(cursor.fetchone()[0])
+            else:
+                cursor.execute('SELECT 1')
+                lag = 0.0
+    except DatabaseError:
+        logger.warning('Replica %s is not reachable', alias, exc_info=True)
+        connection.close()
+        lag = None
+    _lags[alias] = (now, lag)
+    return lag
+
+
+def healthy_replicas():
+    """
+    Return aliases of replicas lagging at most REPLICA_MAX_LAG_SECONDS.
+    """
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        lag = replica_lag(alias)
+        if lag is not None and lag <= settings.REPLICA_MAX_LAG_SECONDS:
+            healthy.append(alias)
+    return healthy
+
+
+class PrimaryReplicaRouter:
+    """
+    Send reads of requests allowed by ``ReplicaRoutingMiddleware`` to
+    random healthy replica from DATABASE_REPLICAS, everything else to
+    primary (default) database. Reads inside transaction on primary stay
+    on primary.
+    """
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.replica_reads or \
+                connections[DEFAULT_DB_ALIAS].in_atomic_block:
+            return DEFAULT_DB_ALIAS
+        instance = hints.get('instance')
+        if instance is not None and \
+                instance._state.db in settings.DATABASE_REPLICAS:
+            return instance._state.db
+        replicas = healthy_replicas()
+        if not replicas:
+            return DEFAULT_DB_ALIAS
+        return random.choice(replicas)
+
+    def db_for_write(self, model, **hints):
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ShardRouter:
+    """
+    Keep rows of sharded models on shard of their row (see
+    ``craigslist.sharding``): announcements by region of seller,
+    reservations with their announcement. Rows loaded from shard are
+    read and written there, also through related managers. Queries
+    without instance are left to next router, views pick shards with
+    ``using()``.
+    """
+    def db_for_read(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def db_for_write(self, model, **hints):
+        return self._shard(model, hints.get('instance'))
+
+    def _shard(self, model, instance):
+        if not is_sharded_model(model) or instance is None or \
+                not is_sharded_model(instance):
+            return None
+        if instance._state.adding:
+            if hasattr(instance, 'region'):
+                alias = shard_for_region(instance.region)
+            elif hasattr(instance, 'announcement_id'):
+                alias = shard_for_id(instance.announcement_id)
+            else:
+                alias = instance._state.db
+        else:
+            alias = instance._state.db
+        # Default shard and its replicas are left to PrimaryReplicaRouter.
+        if alias == DEFAULT_DB_ALIAS or \
+                alias not in settings.DATABASE_SHARDS:
+            return None
+        return alias
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Rows of shards refer to users and categories of default
+        # database, without foreign key constraints.
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_SHARDS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
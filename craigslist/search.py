@@ -0,0 +1,128 @@
+import re
+import unicodedata
+
+from django.db import connections
+from django.db.models import BooleanField, F, FloatField, Lookup, Q, \
+    TextField, Value
+from django.db.models.expressions import RawSQL
+
+# Inflectional endings of Polish nouns, adjectives and verbs, longest
+# first. Light stemmer removes one of them, so e.g. "rowery", "rowerów"
+# and "rowerami" are all indexed as "rower".
+SUFFIXES = sorted({
+    'ami', 'iami', 'ach', 'ów', 'om', 'owi', 'em', 'ie', 'iu', 'y', 'a',
+    'e', 'i', 'o', 'u', 'ę', 'ą', 'ią', 'ej', 'ego', 'emu', 'ych', 'ymi',
+    'ich', 'imi', 'ym', 'im', 'iej', 'owa', 'owe', 'owy', 'owego', 'owej',
+    'owych', 'owym', 'owymi', 'ować', 'ował', 'ują', 'uje', 'ał', 'ała',
+    'ało', 'ali', 'ły', 'ć',
+}, key=len, reverse=True)
+
+# Stem is never shorter, so short words are kept whole.
+MIN_STEM_LENGTH = 3
+
+FTS_TABLE = 'craigslist_announcement_fts'
+
+WORD = re.compile(r'\w+')
+
+
+class MatchDocumentField(TextField):
+    """
+    Hidden column of SQLite FTS5 table named as the table, used only
+    as left side of ``match`` lookup.
+    """
+
+
+@MatchDocumentField.register_lookup
+class Match(Lookup):
+    lookup_name = 'match'
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return '{} MATCH {}'.format(lhs, rhs), lhs_params + rhs_params
+
+
+def strip_diacritics(word):
+    """
+    Return word without Polish diacritics, so "lodowka" finds "lodówka".
+    """
+    word = word.replace('ł', 'l')
+    return ''.join(char for char in unicodedata.normalize('NFKD', word)
+                   if not unicodedata.combining(char))
+
+
+def stem(word):
+    """
+    Return stem of lower case Polish word without diacritics.
+    """
+    for suffix in SUFFIXES:
+        if (word.endswith(suffix)
+                and len(word) - len(suffix) >= MIN_STEM_LENGTH):
+            word = word[:-len(suffix)]
+            break
+    return strip_diacritics(word)
+
+
+def tokenize(text):
+    """
+    Return list of stems of words in text.
+    """
+    return [stem(word) for word in WORD.findall(text.lower())]
+
+
+def search_document(text):
+    """
+    Return text indexed by full-text search: space separated stems.
+    """
+    return ' '.join(tokenize(text))
+
+
+def search(queryset, query, title_only=False):
+    """
+    Filter announcements matching all words of query (also as prefix of
+    longer words) and annotate them with rank, higher is better.
+    Title matches rank above description matches, with title_only
+    description is not searched.
+
+    PostgreSQL uses search_vector column with GIN index, SQLite FTS5
+    table (AnnouncementSearchIndex model), other databases scan search
+    columns.
+    """
+    terms = tokenize(query)
+    if not terms:
+        return queryset.annotate(
+            rank=Value(0.0, output_field=FloatField())).none()
+    table = '"{}"'.format(queryset.model._meta.db_table)
+    vendor = connections[queryset.db].vendor
+    if vendor == 'postgresql':
+        # Title is stored with weight A.
+        tsquery = ' & '.join('{}:*{}'.format(term, 'A' if title_only else '')
+                             for term in terms)
+        match = RawSQL(
+            "{}.search_vector @@ to_tsquery('simple', %s)".format(table),
+            [tsquery], output_field=BooleanField(),
+        )
+        # ts_rank returns real, cast to double precision so rank of
+        # keyset cursor (Python float) equals rank of its row.
+        rank = RawSQL(
+            "ts_rank({}.search_vector, to_tsquery('simple', %s))"
+            "::double precision".format(table),
+            [tsquery], output_field=FloatField(),
+        )
+    elif vendor == 'sqlite':
+        # Join with FTS5 table, its rank is bm25 with title weighted 10
+        # times more (configured in migration), lower is better.
+        fts_query = ' AND '.join('"{}"*'.format(term) for term in terms)
+        if title_only:
+            fts_query = 'search_title : ({})'.format(fts_query)
+        match = Q(search_index__document__match=fts_query)
+        rank = -F('search_index__rank')
+    else:
+        match = Q()
+        for term in terms:
+            term_match = Q(search_title__contains=term)
+            if not title_only:
+                term_match |= Q(search_description__contains=term)
+            match &= term_match
+        rank = Value(0.0, output_field=FloatField())
+    return queryset.filter(match).annotate(rank=rank)
@@ -0,0 +1,158 @@
+import time
+
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+from django.contrib.sessions.backends.base import CreateError
+from django.contrib.sessions.models import Session
+from django.core.cache import caches
+from django.db import transaction
+
+from .routers import use_primary
+
+# Keys of sessions changed in cache and not written to database yet form
+# a log: DIRTY_KEY.format(n) holds key of n-th change, DIRTY_SEQUENCE_KEY
+# the number of the last change, FLUSHED_KEY the last written one.
+DIRTY_SEQUENCE_KEY = 'craigslist:sessions:dirty'
+DIRTY_KEY = 'craigslist:sessions:dirty:{}'
+FLUSHED_KEY = 'craigslist:sessions:flushed'
+
+# Marks deleted sessions, flush may write them to database once more.
+DELETED_KEY = 'craigslist:sessions:deleted:{}'
+
+
+def session_cache():
+    return caches[settings.SESSION_CACHE_ALIAS]
+
+
+def mark_dirty(session_key, timeout):
+    """
+    Append session key to log of sessions to write to database.
+    """
+    cache = session_cache()
+    cache.add(DIRTY_SEQUENCE_KEY, 0, None)
+    try:
+        number = cache.incr(DIRTY_SEQUENCE_KEY)
+    except ValueError:
+        # Evicted since add, flush_dirty notices the sequence went back.
+        cache.add(DIRTY_SEQUENCE_KEY, 0, None)
+        number = cache.incr(DIRTY_SEQUENCE_KEY)
+    cache.set(DIRTY_KEY.format(number), session_key, timeout)
+
+
+class SessionStore(cached_db.SessionStore):
+    """
+    Sessions read from cache, with database as fallback for sessions
+    missing in cache.
+
+    Session is saved only when its data differ from loaded data, not
+    whenever it was assigned to. With SESSION_WRITE_BEHIND changes are
+    written to cache only and to database later by :func:`flush_dirty`
+    (``flush_sessions`` command), so requests of logged in users do not
+    touch session table. It requires cache shared by all processes.
+    Deleted sessions are deleted from database at once and marked in
+    cache, so old keys of logged out users can not be loaded again.
+    """
+    cache_key_prefix = 'craigslist.sessions'
+
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # Serialized data as it is stored, None if not stored yet.
+        self._stored = None
+
+    def _get_session_from_db(self):
+        if self._cache.get(DELETED_KEY.format(self.session_key)):
+            self._session_key = None
+            return None
+        # Replica may not have session written by the last request.
+        with use_primary():
+            return super()._get_session_from_db()
+
+    def load(self):
+        data = super().load()
+        if self.session_key is not None:
+            self._stored = self.serializer().dumps(data)
+        return data
+
+    def save(self, must_create=False):
+        if self.session_key is None:
+            return self.create()
+        data = self._get_session(no_load=must_create)
+        serialized = self.serializer().dumps(data)
+        if not must_create and serialized == self._stored:
+            return
+        if not settings.SESSION_WRITE_BEHIND:
+            super().save(must_create)
+        else:
+            timeout = self.get_expiry_age()
+            if must_create:
+                # Key is reserved by cache, database gets it on flush.
+                if not self._cache.add(self.cache_key, data, timeout):
+                    raise CreateError
+            else:
+                self._cache.set(self.cache_key, data, timeout)
+            mark_dirty(self.session_key, timeout)
+        self._stored = serialized
+
+    def delete(self, session_key=None):
+        if session_key is None:
+            session_key = self.session_key
+        if session_key is None:
+            return
+        if settings.SESSION_WRITE_BEHIND:
+            self._cache.set(DELETED_KEY.format(session_key), True,
+                            settings.SESSION_COOKIE_AGE)
+        super().delete(session_key)
+
+
+def flush_dirty(batch_size=500):
+    """
+    Write sessions changed in cache since the last call to database,
+    return number of written sessions. Sessions gone from cache are
+    skipped, they expired or were deleted.
+    """
+    cache = session_cache()
+    last = cache.get(DIRTY_SEQUENCE_KEY, 0)
+    flushed = cache.get(FLUSHED_KEY, 0)
+    if flushed > last:
+        # Sequence was evicted and started again.
+        flushed = 0
+    written = 0
+    while flushed < last:
+        numbers = range(flushed + 1, min(flushed + batch_size, last) + 1)
+        dirty_keys = [DIRTY_KEY.format(number) for number in numbers]
+        found = cache.get_many(dirty_keys)
+        if len(found) < len(dirty_keys):
+            # Log entry is written right after its number is taken, other
+            # missing entries expired with their sessions.
+            time.sleep(0.05)
+            found.update(cache.get_many(
+                [key for key in dirty_keys if key not in found]))
+        written += write_sessions(set(found.values()))
+        cache.set(FLUSHED_KEY, numbers[-1], None)
+        cache.delete_many(dirty_keys)
+        flushed = numbers[-1]
+    return written
+
+
+def write_sessions(session_keys):
+    """
+    Write data of sessions from cache to database.
+    """
+    cache = session_cache()
+    prefix = SessionStore.cache_key_prefix
+    deleted = cache.get_many([DELETED_KEY.format(key)
+                              for key in session_keys])
+    cached = cache.get_many([
+        prefix + key for key in session_keys
+        if DELETED_KEY.format(key) not in deleted
+    ])
+    sessions = []
+    for cache_key, data in cached.items():
+        store = SessionStore(cache_key[len(prefix):])
+        store._session_cache = data
+        sessions.append(store.create_model_instance(data))
+    keys = [session.session_key for session in sessions]
+    with transaction.atomic():
+        Session.objects.filter(session_key__in=keys).delete()
+        Session.objects.bulk_create(sessions)
+    return len(sessions)
@@ -0,0 +1,105 @@
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.constants import LOOKUP_SEP
+
+# Rows of sharded tables get ids from range of their shard, ids on shard
+# number n start at n * SHARD_ID_RANGE, so shard is known from id alone.
+SHARD_ID_RANGE = 10 ** 12
+
+# Regions are Polish postal districts, the first digit of zip code.
+REGIONS = range(10)
+
+# Models stored on shard of seller region, other models live on default
+# database only. Default database is shard number 0.
+SHARDED_MODELS = frozenset({
+    'announcement', 'announcementsearchindex', 'reservation', 'transaction',
+    'archivedannouncement', 'archivedreservation',
+})
+
+
+def is_sharded():
+    return len(settings.DATABASE_SHARDS) > 1
+
+
+def is_sharded_model(model):
+    return model._meta.app_label == 'craigslist' and \
+        model._meta.model_name in SHARDED_MODELS
+
+
+def region_for_zip(zip_code):
+    """
+    Return region of zip code, users without valid zip code belong
+    to region 0.
+    """
+    zip_code = (zip_code or '').strip()
+    return int(zip_code[0]) if zip_code[:1].isdigit() else 0
+
+
+def shard_for_region(region):
+    shards = settings.DATABASE_SHARDS
+    return shards[region % len(shards)]
+
+
+def shard_for_id(pk):
+    """
+    Return shard holding row of sharded table with given id, default
+    database for ids out of shard ranges.
+    """
+    try:
+        index = int(pk) // SHARD_ID_RANGE
+    except (TypeError, ValueError):
+        return DEFAULT_DB_ALIAS
+    shards = settings.DATABASE_SHARDS
+    return shards[index] if 0 <= index < len(shards) else DEFAULT_DB_ALIAS
+
+
+def shards_of_ids(ids):
+    """
+    Return dict mapping shard to list of given ids stored on it.
+    """
+    shards = {}
+    for pk in ids:
+        shards.setdefault(shard_for_id(pk), []).append(pk)
+    return shards
+
+
+def on_shard(queryset, alias):
+    """
+    Return queryset reading from shard. Queryset of default shard is
+    left to routers, so it can still read from replicas.
+    """
+    if alias == DEFAULT_DB_ALIAS:
+        return queryset
+    return queryset.using(alias)
+
+
+def scatter(queryset):
+    """
+    Return list of copies of queryset, one for every shard.
+    """
+    return [on_shard(queryset, alias) for alias in settings.DATABASE_SHARDS]
+
+
+def related(queryset, *lookups):
+    """
+    Return queryset loading related objects given by lookups.
+
+    Without shards they are joined by select_related. With shards only
+    relations to rows of the same shard are joined, rows from default
+    database (users, categories) are loaded by prefetch_related.
+    """
+    if not is_sharded():
+        return queryset.select_related(*lookups)
+    for lookup in lookups:
+        names = lookup.split(LOOKUP_SEP)
+        model, joined = queryset.model, []
+        for name in names:
+            model = model._meta.get_field(name).related_model
+            if not is_sharded_model(model):
+                break
+            joined.append(name)
+        if joined:
+            queryset = queryset.select_related(LOOKUP_SEP.join(joined))
+        if len(joined) < len(names):
+            queryset = queryset.prefetch_related(lookup)
+    return queryset
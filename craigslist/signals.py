@@ -0,0 +1,75 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import metrics
+from .cache import invalidate_categories
+from .models import Announcement, Category, RequestProfile, Reservation, \
+    Transaction
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_changed(sender, instance, **kwargs):
+    """
+    Refresh cached categories after category is added, edited or deleted.
+    """
+    invalidate_categories()
+
+
+@receiver(post_save, sender=Announcement)
+def announcement_saved(sender, instance, created, **kwargs):
+    """
+    Refresh cached accepted announcements counts if announcement
+    becomes accepted or stops being accepted or accepted one moves
+    to other category or price, count new announcements.
+    """
+    if created:
+        transaction.on_commit(metrics.ANNOUNCEMENTS_CREATED.inc,
+                              using=kwargs['using'])
+    previous = instance.loaded_status
+    listing = (instance.category_id, instance.price)
+    if created or previous != instance.status:
+        if 2 in (previous, instance.status):
+            invalidate_categories(using=kwargs['using'])
+    elif instance.status == 2 and instance.loaded_listing != listing:
+        invalidate_categories(using=kwargs['using'])
+    instance.loaded_status = instance.status
+    instance.loaded_listing = listing
+
+
+@receiver(post_delete, sender=Announcement)
+def announcement_deleted(sender, instance, **kwargs):
+    """
+    Refresh cached accepted announcements counts after delete.
+    """
+    if instance.status == 2:
+        invalidate_categories(using=kwargs['using'])
+
+
+@receiver(post_delete, sender=RequestProfile)
+def request_profile_deleted(sender, instance, **kwargs):
+    """
+    Remove profile file from disk together with its row.
+    """
+    instance.file.delete(save=False)
+
+
+@receiver(post_save, sender=Reservation)
+def reservation_saved(sender, instance, created, **kwargs):
+    """
+    Count reservations once they are committed.
+    """
+    if created:
+        transaction.on_commit(metrics.RESERVATIONS_CREATED.inc,
+                              using=kwargs['using'])
+
+
+@receiver(post_save, sender=Transaction)
+def transaction_saved(sender, instance, created, **kwargs):
+    """
+    Count confirmed purchases once they are committed.
+    """
+    if created:
+        transaction.on_commit(metrics.TRANSACTIONS_CREATED.inc,
+                              using=kwargs['using'])
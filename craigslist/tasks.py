@@ -0,0 +1,88 @@
+import functools
+import posixpath
+
+from django.core.files.base import ContentFile
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.utils import timezone
+
+from .archive import archive_batch, archive_cutoff
+from .images import delete_image, generate_variants
+from .jobs import enqueue, task
+from .models import Announcement
+from .sharding import shard_for_id
+
+
+def enqueue_image(announcement, upload):
+    """
+    Hand uploaded image of announcement to background worker once
+    announcement is committed. Jobs are stored on default database, so
+    announcement of other shard gets its job after commit of the shard,
+    announcement of default database in its transaction.
+    """
+    enqueue_job = functools.partial(
+        enqueue, 'process_announcement_image', payload={
+            'announcement_id': announcement.pk,
+            'name': posixpath.basename(upload.name),
+        }, data=upload.read()
+    )
+    using = announcement._state.db
+    if using == DEFAULT_DB_ALIAS:
+        enqueue_job()
+    else:
+        transaction.on_commit(enqueue_job, using=using)
+
+
+def image_failed(job, error):
+    """
+    End "processing" state of announcement whose image could not be
+    processed, so its seller is asked to upload it again.
+    """
+    Announcement.objects.using(
+        shard_for_id(job.payload['announcement_id'])
+    ).filter(pk=job.payload['announcement_id']).update(
+        image_processing=False,
+        image_error=error.strip().splitlines()[-1][:200],
+        updated_at=timezone.now(),
+    )
+
+
+@task(on_failure=image_failed)
+def process_announcement_image(job):
+    """
+    Upload image to storage, generate its variants and end announcement
+    "processing" state. Replaced image and its variants are deleted
+    once announcement shows the new one.
+    """
+    announcements = Announcement.objects.using(
+        shard_for_id(job.payload['announcement_id'])
+    )
+    announcement = announcements.filter(
+        pk=job.payload['announcement_id']
+    ).first()
+    if announcement is None:
+        return
+    old_image = announcement.image.name
+    announcement.image.save(job.payload['name'],
+                            ContentFile(bytes(job.data)), save=False)
+    announcements.filter(pk=announcement.pk).update(
+        image=announcement.image.name, image_variants=False,
+        image_widths={}, image_processing=False, image_error='',
+        updated_at=timezone.now(),
+    )
+    generate_variants(announcement)
+    if old_image and old_image != announcement.image.name:
+        delete_image(announcement.image.storage, old_image)
+
+
+@task
+def archive_announcements(job):
+    """
+    Move one batch of old rejected and sold announcements of shard to
+    archive tables, enqueue the next batch until nothing is left.
+    """
+    batch_size = job.payload['batch_size']
+    moved = archive_batch(archive_cutoff(job.payload.get('days')),
+                          batch_size,
+                          using=job.payload.get('shard', DEFAULT_DB_ALIAS))
+    if moved == batch_size:
+        enqueue('archive_announcements', payload=job.payload)
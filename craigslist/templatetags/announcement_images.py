@@ -0,0 +1,45 @@
+from django import template
+
+from craigslist.images import VARIANTS, variant_url
+
+register = template.Library()
+
+SIZES = {
+    'card': '(min-width: 1200px) 25vw, (min-width: 768px) 33vw, 50vw',
+    'detail': '(min-width: 768px) 50vw, 100vw',
+}
+
+
+@register.inclusion_tag('responsive_image.html')
+def responsive_image(announcement, variant='card', css_class='', lazy=True):
+    """
+    Render announcement image with resized variants in srcset.
+    Until variants are generated the original image is rendered.
+    """
+    context = {
+        'announcement': announcement,
+        'css_class': css_class,
+        'lazy': lazy,
+    }
+    image = announcement.image
+    if announcement.image_variants:
+        context.update({
+            'src': variant_url(image, variant, 'jpg'),
+            'srcset': _srcset(announcement, 'jpg'),
+            'webp_srcset': _srcset(announcement, 'webp'),
+            'sizes': SIZES[variant],
+        })
+    elif image:
+        context['src'] = image.url
+    return context
+
+
+def _srcset(announcement, extension):
+    # Variants generated before widths were stored fall back to the
+    # longest side.
+    widths = announcement.image_widths or {}
+    return ', '.join(
+        '{} {}w'.format(variant_url(announcement.image, variant, extension),
+                        widths.get(variant, size))
+        for variant, size in VARIANTS.items()
+    )
@@ -0,0 +1,99 @@
+from django.contrib.auth.models import User as AppUser
+from django.test import TestCase, override_settings
+from django.urls import path, reverse
+
+from craigslist.async_views import AsyncAnnouncementListView, \
+    AsyncCategoryAnnouncementView, AsyncAnnouncementDetailView, \
+    AsyncUserReservationsView
+from craigslist.models import Announcement, Category, Reservation
+from craigslist_app import urls as project_urls
+
+ASYNC_VIEWS = {
+    'index': AsyncAnnouncementListView,
+    'category-announcement': AsyncCategoryAnnouncementView,
+    'announcement': AsyncAnnouncementDetailView,
+    'my-reservations': AsyncUserReservationsView,
+}
+
+# Project URLs with async views, like with ASYNC_VIEWS enabled.
+urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(),
+         name=pattern.name)
+    if getattr(pattern, 'name', None) in ASYNC_VIEWS else pattern
+    for pattern in project_urls.urlpatterns
+]
+
+
+@override_settings(ROOT_URLCONF='craigslist.test_async_views')
+class AsyncViewsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        seller = AppUser.objects.create_user(username='seller',
+                                             password='seller')
+        self.buyer = AppUser.objects.create_user(username='buyer',
+                                                 password='buyer')
+        self.category = Category.objects.create(category_name='Elektronika')
+        self.announcement = Announcement.objects.create(
+            title='TEST',
+            description='Test description',
+            price=30000,
+            category=self.category,
+            user_who_added=seller,
+            status=2,
+            image='staticfiles/2022/06/04/test.jpg'
+        )
+
+    async def test_index(self):
+        """
+        Test async index page lists accepted announcements.
+        """
+        response = await self.async_client.get(reverse('index'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['announcements']), 1)
+        self.assertContains(response, 'Zobacz ogłoszenie')
+        response = await self.async_client.post(reverse('index'))
+        self.assertEqual(response.status_code, 405)
+
+    async def test_category(self):
+        """
+        Test async category page.
+        """
+        response = await self.async_client.get(
+            reverse('category-announcement', args=(self.category.id,))
+        )
+        self.assertContains(response,
+                            'Lista ogłoszeń dla kategorii Elektronika')
+
+    async def test_detail(self):
+        """
+        Test async detail page and 404 for missing announcement.
+        """
+        response = await self.async_client.get(
+            reverse('announcement', args=(self.announcement.id,))
+        )
+        self.assertContains(response, 'Aktualne')
+        response = await self.async_client.get(
+            reverse('announcement', args=(self.announcement.id + 1,))
+        )
+        self.assertEqual(response.status_code, 404)
+
+    async def test_reservations_require_login(self):
+        """
+        Test anonymous user is redirected to log in page.
+        """
+        response = await self.async_client.get(reverse('my-reservations'))
+        self.assertEqual(response.status_code, 302)
+
+    def test_reservations_of_logged_user(self):
+        """
+        Test async reservations list of logged in user.
+        """
+        Reservation.objects.create(announcement=self.announcement,
+                                   reserved_by_user=self.buyer)
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('my-reservations'))
+        self.assertContains(response, 'Dane Sprzedającego')
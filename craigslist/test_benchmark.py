@@ -0,0 +1,180 @@
+import io
+import json
+import os
+import shutil
+import tempfile
+from unittest import mock
+
+from django.contrib.auth.models import User as AppUser
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.core.wsgi import get_wsgi_application
+from django.test import SimpleTestCase, TransactionTestCase, \
+    override_settings
+from django.urls import URLResolver
+
+from craigslist.loadtest import compare_results, serve
+from craigslist.management.commands.benchmark import Command, \
+    MODERATOR_PASSWORD_ENV, MODERATOR_USERNAME
+
+from craigslist.models import Announcement, Category, Reservation
+from craigslist_app.urls import urlpatterns
+
+
+def result(throughput=100, p99_ms=50, queries=3):
+    """
+    Return result of single benchmark scenario.
+    """
+    return {'throughput': throughput, 'p99_ms': p99_ms, 'queries': queries}
+
+
+class CompareResultsTests(SimpleTestCase):
+    def test_regressions_over_threshold_are_reported(self):
+        """
+        Test slower, higher latency or more queries scenarios are
+        reported and small changes are not.
+        """
+        baseline = {'current': {
+            'index': result(),
+            'detail': result(),
+            'confirm': result(),
+            'register': result(),
+        }}
+        current = {'current': {
+            'index': result(throughput=70),
+            'detail': result(p99_ms=70),
+            'confirm': result(queries=4),
+            'register': result(throughput=90, p99_ms=55),
+            'new-route': result(throughput=1),
+        }}
+        regressions = compare_results(baseline, current, 0.2)
+        self.assertEqual(len(regressions), 3)
+        self.assertEqual(
+            [regression.split(':')[0] for regression in regressions],
+            ['current index', 'current detail', 'current confirm'],
+        )
+
+
+# Admin pages need manifest of collected static files otherwise, query
+# counts are of single database.
+@override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.'
+                                       'storage.StaticFilesStorage',
+                   DATABASE_SHARDS=['default'])
+class BenchmarkCommandTests(TransactionTestCase):
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        seller = AppUser.objects.create_user(username='seller',
+                                             password='password')
+        AppUser.objects.create_user(username='buyer', password='password')
+        category = Category.objects.create(category_name='AGD')
+        for _ in range(3):
+            Announcement.objects.create(
+                title='TEST',
+                description='Test description',
+                price=30000,
+                category=category,
+                user_who_added=seller,
+                status=2,
+                image='staticfiles/2022/06/04/test.jpg'
+            )
+        self.directory = tempfile.mkdtemp()
+        self.output = os.path.join(self.directory, 'results.json')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def benchmark(self, **options):
+        """
+        Run benchmark command with few requests, return written results.
+        """
+        options.setdefault('moderator_password', 'moderator')
+        call_command('benchmark', requests=2, concurrency=1, warmup=0,
+                     output=self.output, stdout=io.StringIO(), **options)
+        with open(self.output) as output:
+            return json.load(output)['results']
+
+    def test_every_route_is_benchmarked(self):
+        """
+        Test every scenario is recorded with number of queries and
+        POST scenarios reserve and buy announcements.
+        """
+        results = self.benchmark()['current']
+        # Unnamed media route serves uploads in DEBUG only.
+        routes = {
+            pattern.namespace if isinstance(pattern, URLResolver)
+            else pattern.name
+            for pattern in urlpatterns
+        } - {None}
+        self.assertEqual({name.split(' ')[0] for name in results}, routes)
+        for name, scenario in results.items():
+            self.assertEqual(scenario['errors'], 0, name)
+            self.assertIsNotNone(scenario['queries'], name)
+        self.assertEqual(results['index (anonymous)']['queries'], 2)
+        self.assertEqual(Reservation.objects.count(), 2)
+        self.assertEqual(Announcement.objects.filter(status=5).count(), 2)
+
+    def test_users_log_in_to_running_server(self):
+        """
+        Test users of server given by base URL log in through login form
+        and logged in scenarios pass.
+        """
+        with serve(get_wsgi_application()) as base_url:
+            results = self.benchmark(base_url=base_url)['current']
+        for name, scenario in results.items():
+            self.assertEqual(scenario['errors'], 0, name)
+            self.assertIsNone(scenario['queries'], name)
+
+    def test_compare_fails_on_regression(self):
+        """
+        Test compare mode raises error if baseline used fewer queries.
+        """
+        results = self.benchmark()
+        results['current']['index (anonymous)']['queries'] = 0
+        baseline = os.path.join(self.directory, 'baseline.json')
+        with open(baseline, 'w') as baseline_file:
+            json.dump({'results': results}, baseline_file)
+        with self.assertRaisesMessage(CommandError, 'regressions'):
+            self.benchmark(compare=baseline, threshold=100)
+
+    def test_moderator_password_is_required(self):
+        """
+        Test benchmark refuses to create moderator without password.
+        """
+        with mock.patch.dict(os.environ, clear=True), \
+                self.assertRaisesMessage(CommandError,
+                                         MODERATOR_PASSWORD_ENV):
+            self.benchmark(moderator_password=None)
+        self.assertFalse(
+            AppUser.objects.filter(username=MODERATOR_USERNAME).exists()
+        )
+
+    def test_moderator_is_limited_and_deleted(self):
+        """
+        Test moderator is staff allowed only to change announcements and
+        is deleted after the run.
+        """
+        moderators = []
+        create_moderator = Command.create_moderator
+
+        def record(password):
+            moderator = create_moderator(password)
+            moderators.append((
+                moderator.is_staff, moderator.is_superuser,
+                moderator.get_all_permissions(),
+            ))
+            return moderator
+
+        with mock.patch.object(Command, 'create_moderator',
+                               staticmethod(record)):
+            self.benchmark()
+        self.assertEqual(moderators, [
+            (True, False, {'craigslist.change_announcement'}),
+        ])
+        self.assertFalse(
+            AppUser.objects.filter(username=MODERATOR_USERNAME).exists()
+        )
+        self.assertFalse(
+            Announcement.objects.filter(moderator__isnull=False).exists()
+        )
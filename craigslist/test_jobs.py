@@ -0,0 +1,277 @@
+import io
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User as AppUser
+from django.core.files.storage import FileSystemStorage
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from craigslist import images, jobs
+from craigslist.models import Announcement, Category, Job
+from craigslist.tests import create_test_image
+
+
+class ImageUploadJobTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test, local filesystem stands in for S3.
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        storage = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.'
+                                 'FileSystemStorage',
+            MEDIA_ROOT=media_root,
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        self.user = AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.category = Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.client.login(username='test', password='test')
+
+    def add_announcement(self):
+        """
+        Post add announcement form with image.
+        """
+        return self.client.post(reverse('add-announcement'), {
+            'title': 'TEST',
+            'description': 'Test description',
+            'price': 100,
+            'category': self.category.id,
+            'image': create_test_image(),
+        })
+
+    def test_announcement_created_in_processing_state(self):
+        """
+        Test announcement exists before worker uploads its image.
+        """
+        self.add_announcement()
+        announcement = Announcement.objects.get()
+        self.assertTrue(announcement.image_processing)
+        self.assertFalse(announcement.image)
+        job = Job.objects.get()
+        self.assertEqual(job.payload['announcement_id'], announcement.id)
+
+        response = self.client.get(
+            reverse('announcement', args=(announcement.id,))
+        )
+        self.assertContains(response, 'Zdjęcie jest przetwarzane')
+
+    def test_worker_uploads_image(self):
+        """
+        Test run_jobs command stores image and its variants.
+        """
+        self.add_announcement()
+        call_command('run_jobs', '--once', stdout=io.StringIO())
+        announcement = Announcement.objects.get()
+        self.assertFalse(announcement.image_processing)
+        self.assertTrue(announcement.image_variants)
+        self.assertTrue(
+            announcement.image.storage.exists(announcement.image.name)
+        )
+        job = Job.objects.get()
+        self.assertEqual(job.status, 2)
+        self.assertIsNone(job.data)
+
+    def test_update_keeps_previous_image_until_processed(self):
+        """
+        Test edited announcement shows old image until worker is done.
+        """
+        self.add_announcement()
+        jobs.run_pending()
+        announcement = Announcement.objects.get()
+        old_image = announcement.image.name
+        self.client.post(
+            reverse('edit-announcement', args=(announcement.id,)), {
+                'title': 'TEST',
+                'description': 'Test description',
+                'price': 100,
+                'category': self.category.id,
+                'image': create_test_image('new.jpg'),
+            })
+        announcement.refresh_from_db()
+        self.assertEqual(announcement.image.name, old_image)
+        self.assertTrue(announcement.image_processing)
+        jobs.run_pending()
+        announcement.refresh_from_db()
+        self.assertIn('new', announcement.image.name)
+
+    def test_replaced_image_is_deleted(self):
+        """
+        Test old image and its variants are deleted once edited
+        announcement shows the new image.
+        """
+        self.add_announcement()
+        jobs.run_pending()
+        announcement = Announcement.objects.get()
+        storage = announcement.image.storage
+        old_image = announcement.image.name
+        old_variant = images.variant_name(old_image, 'card', 'webp')
+        self.assertTrue(storage.exists(old_variant))
+        self.client.post(
+            reverse('edit-announcement', args=(announcement.id,)), {
+                'title': 'TEST',
+                'description': 'Test description',
+                'price': 100,
+                'category': self.category.id,
+                'image': create_test_image('new.jpg'),
+            })
+        jobs.run_pending()
+        announcement.refresh_from_db()
+        self.assertFalse(storage.exists(old_image))
+        self.assertFalse(storage.exists(old_variant))
+        self.assertTrue(storage.exists(announcement.image.name))
+        self.assertTrue(storage.exists(
+            images.variant_name(announcement.image.name, 'card', 'webp')
+        ))
+
+    def test_last_failed_attempt_ends_processing(self):
+        """
+        Test announcement whose image can not be stored leaves
+        processing state with error after the last attempt.
+        """
+        self.add_announcement()
+        Job.objects.update(max_attempts=1)
+        with mock.patch.object(FileSystemStorage, 'save',
+                               side_effect=OSError('Storage unavailable')):
+            jobs.run_pending()
+        announcement = Announcement.objects.get()
+        self.assertFalse(announcement.image_processing)
+        self.assertTrue(announcement.image_error)
+        self.assertEqual(Job.objects.get().status, 3)
+
+        response = self.client.get(
+            reverse('announcement', args=(announcement.id,))
+        )
+        self.assertNotContains(response, 'Zdjęcie jest przetwarzane')
+        self.assertContains(response, 'Nie udało się przetworzyć zdjęcia')
+
+
+class JobQueueTests(TestCase):
+    databases = '__all__'
+
+    def test_failed_job_is_retried_later(self):
+        """
+        Test failing job is scheduled again with backoff and marked
+        failed after last attempt.
+        """
+        job = jobs.enqueue('missing_task', max_attempts=2)
+        self.assertEqual(jobs.run_pending(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 1)
+        self.assertGreater(job.run_after, timezone.now())
+        self.assertIn('missing_task', job.last_error)
+
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 3)
+
+    def test_failure_handler_runs_after_last_attempt(self):
+        """
+        Test failure handler of task is called only when job is not
+        retried any more.
+        """
+        failures = []
+
+        @jobs.task(on_failure=lambda job, error: failures.append(job.pk))
+        def failing_task(job):
+            raise ValueError('broken')
+
+        self.addCleanup(jobs._tasks.pop, 'failing_task')
+        self.addCleanup(jobs._failure_handlers.pop, 'failing_task')
+        job = jobs.enqueue('failing_task', max_attempts=2)
+        jobs.run_pending()
+        self.assertEqual(failures, [])
+        Job.objects.filter(pk=job.pk).update(run_after=timezone.now())
+        jobs.run_pending()
+        self.assertEqual(failures, [job.pk])
+
+    def test_claimed_job_is_hidden_until_visibility_timeout(self):
+        """
+        Test job of crashed worker is claimed again after timeout.
+        """
+        job = jobs.enqueue('missing_task')
+        self.assertEqual(jobs.claim().pk, job.pk)
+        self.assertIsNone(jobs.claim())
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        claimed = jobs.claim()
+        self.assertEqual(claimed.pk, job.pk)
+        self.assertEqual(claimed.attempts, 2)
+
+    def test_abandoned_last_attempt_is_failed(self):
+        """
+        Test job whose worker died during the last attempt is not
+        claimed again but failed with its failure handler called.
+        """
+        failures = []
+
+        @jobs.task(on_failure=lambda job, error: failures.append(error))
+        def abandoned_task(job):
+            pass
+
+        self.addCleanup(jobs._tasks.pop, 'abandoned_task')
+        self.addCleanup(jobs._failure_handlers.pop, 'abandoned_task')
+        job = jobs.enqueue('abandoned_task', max_attempts=1)
+        self.assertEqual(jobs.claim().pk, job.pk)
+        Job.objects.filter(pk=job.pk).update(
+            locked_until=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertIsNone(jobs.claim())
+        self.assertEqual(failures, [])
+
+        self.assertEqual(jobs.fail_abandoned(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 3)
+        self.assertEqual(failures, [jobs.ABANDONED_ERROR])
+        self.assertEqual(jobs.fail_abandoned(), 0)
+
+    def test_locked_last_attempt_is_not_failed(self):
+        """
+        Test job still run by worker is not failed by sweep.
+        """
+        job = jobs.enqueue('missing_task', max_attempts=1)
+        jobs.claim()
+        self.assertEqual(jobs.fail_abandoned(), 0)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 1)
+
+    @override_settings(JOBS_KEEP_DAYS=7)
+    def test_old_finished_jobs_are_pruned(self):
+        """
+        Test run_jobs deletes done and failed jobs older than
+        JOBS_KEEP_DAYS and keeps pending and recent ones.
+        """
+        old = timezone.now() - timedelta(days=8)
+        done = jobs.enqueue('missing_task')
+        failed = jobs.enqueue('missing_task')
+        pending = jobs.enqueue('missing_task')
+        recent = jobs.enqueue('missing_task')
+        Job.objects.filter(pk=done.pk).update(status=2, created_at=old)
+        Job.objects.filter(pk=failed.pk).update(status=3, created_at=old)
+        Job.objects.filter(pk=pending.pk).update(
+            created_at=old, run_after=timezone.now() + timedelta(days=1)
+        )
+        Job.objects.filter(pk=recent.pk).update(status=2)
+
+        out = io.StringIO()
+        call_command('run_jobs', '--once', stdout=out)
+        self.assertIn('Deleted 2 finished jobs', out.getvalue())
+        self.assertEqual(
+            set(Job.objects.values_list('pk', flat=True)),
+            {pending.pk, recent.pk}
+        )
@@ -0,0 +1,365 @@
+import contextlib
+from unittest import skipUnless
+
+from django.conf import settings
+from django.contrib.auth.models import User as AppUser
+from django.contrib.contenttypes.models import ContentType
+from django.db import connections
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from craigslist.cache import get_categories, get_price_facets
+from craigslist.models import Announcement, Category, Reservation
+from craigslist.sharding import shard_for_region
+
+ROWS = 10
+
+# Admin pages need manifest of collected static files otherwise.
+STATIC_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+
+# Budgets are of single database, with shards users and categories of
+# sharded rows are prefetched instead of joined (see sharding.related).
+@override_settings(DATABASE_SHARDS=['default'])
+class QueryBudgetTests(TestCase):
+    """
+    Every URL issues fixed number of queries, no matter how many rows
+    are rendered on the page.
+    """
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.seller = AppUser.objects.create_user(
+            username='seller',
+            password='seller'
+        )
+        self.buyer = AppUser.objects.create_user(
+            username='buyer',
+            password='buyer'
+        )
+        self.category = Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.admin = AppUser.objects.create_superuser(
+            username='admin',
+            password='admin'
+        )
+        self.announcement = self.add_rows(1)[0]
+
+    def add_rows(self, count):
+        """
+        Add accepted, reserved, sold and new announcements of seller,
+        reserved and sold ones are reserved by buyer.
+        """
+        announcements = []
+        for _ in range(count):
+            for status in (2, 4, 5, 1):
+                announcement = Announcement.objects.create(
+                    title='TEST',
+                    description='Test description',
+                    price=30000,
+                    category=self.category,
+                    user_who_added=self.seller,
+                    status=status,
+                    image='staticfiles/2022/06/04/test.jpg'
+                )
+                if status in (4, 5):
+                    Reservation.objects.create(
+                        announcement=announcement,
+                        reserved_by_user=self.buyer
+                    )
+                announcements.append(announcement)
+        return announcements
+
+    def assertQueryBudget(self, budget, url, user=None):
+        """
+        Assert GET of url issues budget queries with few and many rows.
+        """
+        for rows in (0, ROWS):
+            self.add_rows(rows)
+            if user is not None:
+                self.client.force_login(user)
+            get_categories()
+            get_price_facets()
+            with self.assertNumQueries(budget):
+                response = self.client.get(url)
+            self.assertIn(response.status_code, (200, 302))
+
+    def test_index(self):
+        """
+        Test queries budget of index page.
+        """
+        self.assertQueryBudget(2, reverse('index'))
+
+    def test_category(self):
+        """
+        Test queries budget of category announcements page.
+        """
+        self.assertQueryBudget(
+            3, reverse('category-announcement', args=(self.category.id,))
+        )
+
+    def test_category_filtered(self):
+        """
+        Test queries budget of category page filtered by price range
+        other than price facet and sorted by price.
+        """
+        self.assertQueryBudget(
+            4, reverse('category-announcement', args=(self.category.id,))
+            + '?price_min=10&price_max=99999&sort=-price'
+        )
+
+    def test_region(self):
+        """
+        Test queries budget of region announcements page.
+        """
+        self.assertQueryBudget(
+            2, reverse('region-announcement', args=(0,))
+        )
+
+    # Suggestions are looked up, not taken from cache.
+    @override_settings(AUTOCOMPLETE_CACHE_TIMEOUT=0)
+    def test_autocomplete(self):
+        """
+        Test queries budget of search suggestions.
+        """
+        self.assertQueryBudget(1, reverse('autocomplete') + '?q=tes')
+
+    def test_metrics(self):
+        """
+        Test queries budget of metrics scraped from allowed address.
+        """
+        self.assertQueryBudget(0, reverse('metrics'))
+
+    def test_search(self):
+        """
+        Test queries budget of search results.
+        """
+        self.assertQueryBudget(1, reverse('search') + '?q=test')
+
+    def test_announcement_detail(self):
+        """
+        Test queries budget of announcement detail page.
+        """
+        self.assertQueryBudget(
+            3, reverse('announcement', args=(self.announcement.id,)),
+            user=self.buyer
+        )
+
+    def test_add_announcement(self):
+        """
+        Test queries budget of add announcement form.
+        """
+        self.assertQueryBudget(2, reverse('add-announcement'),
+                               user=self.seller)
+
+    def test_edit_announcement(self):
+        """
+        Test queries budget of edit announcement form.
+        """
+        self.assertQueryBudget(
+            3, reverse('edit-announcement', args=(self.announcement.id,)),
+            user=self.seller
+        )
+
+    def test_delete_announcement(self):
+        """
+        Test queries budget of delete announcement confirmation.
+        """
+        self.assertQueryBudget(
+            2, reverse('delete-announcement', args=(self.announcement.id,)),
+            user=self.seller
+        )
+
+    def test_my_announcements(self):
+        """
+        Test queries budget of user announcements list, merged with
+        archived announcements.
+        """
+        self.assertQueryBudget(4, reverse('my-announcements'),
+                               user=self.seller)
+
+    def test_my_reservations(self):
+        """
+        Test queries budget of user reservations list, followed by
+        archived reservations.
+        """
+        self.assertQueryBudget(3, reverse('my-reservations'),
+                               user=self.buyer)
+
+    def test_moderation_queue(self):
+        """
+        Test queries budget of moderation queue.
+        """
+        self.buyer.is_staff = True
+        self.buyer.save()
+        self.assertQueryBudget(6, reverse('moderation-queue'),
+                               user=self.buyer)
+
+    def test_my_profile(self):
+        """
+        Test queries budget of user profile page.
+        """
+        self.assertQueryBudget(2, reverse('my-profile'), user=self.buyer)
+
+    def test_login(self):
+        """
+        Test queries budget of log in form.
+        """
+        self.assertQueryBudget(0, reverse('login'))
+
+    def test_register(self):
+        """
+        Test queries budget of register form.
+        """
+        self.assertQueryBudget(0, reverse('register'))
+
+    def test_logout(self):
+        """
+        Test queries budget of log out.
+        """
+        self.assertQueryBudget(3, reverse('logout'), user=self.buyer)
+
+    @override_settings(STATICFILES_STORAGE=STATIC_STORAGE)
+    def test_admin_changelist(self):
+        """
+        Test queries budget of announcements admin list.
+        """
+        self.assertQueryBudget(
+            3, reverse('admin:craigslist_announcement_changelist'),
+            user=self.admin
+        )
+
+    @override_settings(STATICFILES_STORAGE=STATIC_STORAGE)
+    def test_admin_change(self):
+        """
+        Test queries budget of announcement admin form, with SAVEPOINT
+        and RELEASE of the atomic block.
+        """
+        # Content types are cached in process memory after first use.
+        ContentType.objects.get_for_model(Announcement)
+        self.assertQueryBudget(
+            6, reverse('admin:craigslist_announcement_change',
+                       args=(self.announcement.id,)),
+            user=self.admin
+        )
+
+    def test_book_announcement(self):
+        """
+        Test queries budget of announcement reservation.
+        """
+        self.client.force_login(self.buyer)
+        # SAVEPOINT and RELEASE of the atomic block are counted in tests.
+        with self.assertNumQueries(5):
+            self.client.post(reverse('book-announcement'),
+                             {'announcement_id': self.announcement.id})
+
+    def test_confirm(self):
+        """
+        Test queries budget of transaction confirmation.
+        """
+        self.client.force_login(self.buyer)
+        reserved = Announcement.objects.filter(status=4).first()
+        with self.assertNumQueries(7):
+            self.client.post(reverse('confirm'),
+                             {'announcement_id': reserved.id})
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) > 1,
+            'needs DATABASE_SHARD_URLS with at least one shard')
+class ShardedQueryBudgetTests(TestCase):
+    """
+    Pages reading shards issue fixed number of queries on all databases
+    together, no matter how many rows are rendered on the page.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.shard = settings.DATABASE_SHARDS[1]
+        self.seller = AppUser.objects.create_user(
+            username='seller',
+            password='seller'
+        )
+        self.admin = AppUser.objects.create_superuser(
+            username='admin',
+            password='admin'
+        )
+        self.category = Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.add_rows(1)
+
+    def add_rows(self, count):
+        """
+        Add accepted announcements of region on default database and
+        of region on the first shard.
+        """
+        for _ in range(count):
+            for region in (0, 1):
+                Announcement.objects.using(shard_for_region(region)).create(
+                    title='TEST',
+                    description='Test description',
+                    price=30000,
+                    category=self.category,
+                    user_who_added=self.seller,
+                    status=2,
+                    region=region,
+                    image='staticfiles/2022/06/04/test.jpg'
+                )
+
+    def assertQueryBudget(self, budget, url, user=None):
+        """
+        Assert GET of url issues budget queries on all databases with
+        few and many rows.
+        """
+        for rows in (0, ROWS):
+            self.add_rows(rows)
+            if user is not None:
+                self.client.force_login(user)
+            get_categories()
+            with contextlib.ExitStack() as stack:
+                captured = [
+                    stack.enter_context(
+                        CaptureQueriesContext(connections[alias]))
+                    for alias in settings.DATABASE_SHARDS
+                ]
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(
+                sum(len(queries) for queries in captured), budget,
+                [query['sql'] for queries in captured for query in queries]
+            )
+
+    def test_index(self):
+        """
+        Test queries budget of index merging all shards.
+        """
+        self.assertQueryBudget(4, reverse('index'))
+
+    def test_region(self):
+        """
+        Test queries budget of region page reading its shard and
+        default database.
+        """
+        self.assertQueryBudget(
+            4, reverse('region-announcement', args=(1,))
+        )
+
+    @override_settings(STATICFILES_STORAGE=STATIC_STORAGE)
+    def test_admin_changelist(self):
+        """
+        Test queries budget of announcements admin list of shard,
+        sellers are prefetched from default database.
+        """
+        self.assertQueryBudget(
+            4, '{}?shard={}'.format(
+                reverse('admin:craigslist_announcement_changelist'),
+                self.shard),
+            user=self.admin
+        )
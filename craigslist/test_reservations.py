@@ -0,0 +1,204 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User as AppUser
+from django.db import connection, OperationalError
+from django.test import TestCase, TransactionTestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from craigslist.models import Announcement, Category, Reservation, \
+    Transaction
+from craigslist.tests import create_announcement
+
+logger = logging.getLogger(__name__)
+
+BUYERS = 16
+ATTEMPTS_PER_BUYER = 5
+
+
+class ReservationTransitionTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.seller = AppUser.objects.create_user(username='test',
+                                                  password='test')
+        self.buyer = AppUser.objects.create_user(username='buyer',
+                                                 password='buyer')
+        Category.objects.create(category_name='AGD')
+        self.announcement = create_announcement(2, 'AGD')
+
+    def test_second_reservation_is_rejected(self):
+        """
+        Test reserved announcement can not be reserved again.
+        """
+        other = AppUser.objects.create_user(username='other',
+                                            password='other')
+        self.assertIsNotNone(
+            Announcement.objects.reserve(self.announcement.id, self.buyer)
+        )
+        self.assertIsNone(
+            Announcement.objects.reserve(self.announcement.id, other)
+        )
+        self.assertEqual(Reservation.objects.count(), 1)
+
+    def test_seller_can_not_reserve_own_announcement(self):
+        """
+        Test user who added announcement can not reserve it.
+        """
+        self.assertIsNone(
+            Announcement.objects.reserve(self.announcement.id, self.seller)
+        )
+        self.announcement.refresh_from_db()
+        self.assertEqual(self.announcement.status, 2)
+
+    def test_only_reserving_user_confirms_purchase(self):
+        """
+        Test only user who reserved announcement can confirm it.
+        """
+        Announcement.objects.reserve(self.announcement.id, self.buyer)
+        self.assertIsNone(
+            Announcement.objects.confirm_purchase(self.announcement.id,
+                                                  self.seller)
+        )
+        transaction = Announcement.objects.confirm_purchase(
+            self.announcement.id, self.buyer
+        )
+        self.assertEqual(transaction.seller, self.seller)
+        self.assertIsNone(
+            Announcement.objects.confirm_purchase(self.announcement.id,
+                                                  self.buyer)
+        )
+        self.assertEqual(Transaction.objects.count(), 1)
+
+    def test_expired_reservation_is_not_confirmed(self):
+        """
+        Test purchase can not be confirmed after reservation expired.
+        """
+        reservation = Announcement.objects.reserve(self.announcement.id,
+                                                   self.buyer)
+        Reservation.objects.filter(pk=reservation.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertIsNone(
+            Announcement.objects.confirm_purchase(self.announcement.id,
+                                                  self.buyer)
+        )
+        self.announcement.refresh_from_db()
+        self.assertEqual(self.announcement.status, 4)
+        self.assertEqual(Transaction.objects.count(), 0)
+
+    def test_only_current_reservation_is_confirmed(self):
+        """
+        Test expired reservation is taken over by other user, then only
+        the new reservation can be confirmed.
+        """
+        other = AppUser.objects.create_user(username='other',
+                                            password='other')
+        reservation = Announcement.objects.reserve(self.announcement.id,
+                                                   self.buyer)
+        Reservation.objects.filter(pk=reservation.pk).update(
+            expires_at=timezone.now() - timedelta(seconds=1)
+        )
+        self.assertIsNone(
+            Announcement.objects.reserve(self.announcement.id, self.seller)
+        )
+        self.assertIsNotNone(
+            Announcement.objects.reserve(self.announcement.id, other)
+        )
+        Reservation.objects.filter(pk=reservation.pk).update(
+            expires_at=timezone.now() + timedelta(days=1)
+        )
+        self.assertIsNone(
+            Announcement.objects.confirm_purchase(self.announcement.id,
+                                                  self.buyer)
+        )
+        transaction = Announcement.objects.confirm_purchase(
+            self.announcement.id, other
+        )
+        self.assertEqual(transaction.buyer, other)
+
+    def test_view_reports_unavailable_announcement(self):
+        """
+        Test reservation view shows warning if announcement is taken.
+        """
+        self.client.login(username='buyer', password='buyer')
+        self.client.post(reverse('book-announcement'),
+                         {'announcement_id': self.announcement.id})
+        response = self.client.post(
+            reverse('book-announcement'),
+            {'announcement_id': self.announcement.id},
+            follow=True
+        )
+        self.assertContains(response, 'nie jest już dostępny')
+
+
+class ConcurrentReservationTests(TransactionTestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(username='test', password='test')
+        Category.objects.create(category_name='AGD')
+        self.buyers = [
+            AppUser.objects.create_user(username='buyer{}'.format(number),
+                                        password='buyer')
+            for number in range(BUYERS)
+        ]
+        self.announcement = create_announcement(2, 'AGD')
+
+    def test_exactly_one_parallel_reservation_wins(self):
+        """
+        Fire many parallel reservations of one announcement,
+        only one of them can succeed.
+        """
+        barrier = threading.Barrier(BUYERS)
+        results = []
+        errors = []
+
+        def reserve(buyer):
+            barrier.wait()
+            try:
+                attempts = 0
+                while attempts < ATTEMPTS_PER_BUYER:
+                    try:
+                        results.append(Announcement.objects.reserve(
+                            self.announcement.id, buyer
+                        ))
+                        attempts += 1
+                    except OperationalError as error:
+                        # In-memory SQLite reports lock contention instead
+                        # of waiting for lock like PostgreSQL does.
+                        if connection.vendor != 'sqlite':
+                            raise
+                        if 'locked' not in str(error):
+                            raise
+                        time.sleep(0.001)
+            except Exception as error:
+                errors.append(error)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=reserve, args=(buyer,))
+                   for buyer in self.buyers]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len([r for r in results if r is not None]), 1)
+        self.assertEqual(Reservation.objects.count(), 1)
+        self.announcement.refresh_from_db()
+        self.assertEqual(self.announcement.status, 4)
+        logger.info('%d reservation attempts in %.3f s (%.0f/s)',
+                    len(results), elapsed, len(results) / elapsed)
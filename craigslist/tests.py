@@ -1,7 +1,48 @@
-from django.test import TestCase
+import contextlib
+import io
+import json
+import marshal
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from unittest import mock, skipUnless
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.db.models import F
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
-from craigslist.models import Announcement, Category
+from django.utils import timezone
+from django.utils.http import http_date
+from craigslist.cache import get_categories
+from craigslist.images import generate_variants, variant_name
+from craigslist.jobs import run_pending
+from craigslist.management.commands.explain_feeds import \
+    Command as ExplainFeedsCommand
+from craigslist.management.commands.generate_data import build_users
+from craigslist.models import Announcement, ArchivedAnnouncement, \
+    ArchivedReservation, Category, Job, Profile, Reservation, Transaction, \
+    RequestProfile
+from craigslist.pagination import KeysetPaginator
+from craigslist.pool import ConnectionPool, PoolTimeout, statement_timeout
+from craigslist import routers
+from craigslist.routers import PrimaryReplicaRouter
+from craigslist.search import search, stem, tokenize
+from craigslist.sessions import flush_dirty
+from craigslist.sharding import SHARD_ID_RANGE, region_for_zip, related, \
+    scatter, shard_for_id, shard_for_region
+from craigslist.views import AnnouncementListView, \
+    CategoryAnnouncementView, ModerationQueueView, SearchView, \
+    UserAnnouncementView
 from django.contrib.auth.models import User as AppUser
+from django.contrib.sessions.models import Session
+from PIL import Image
+from prometheus_client import REGISTRY
 
 
 def create_announcement(status, category):
@@ -22,6 +63,39 @@ def create_announcement(status, category):
     )
 
 
+class FakeConnection:
+    """
+    Database connection stub counting closes.
+    """
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def index_conditions(queryset):
+    """
+    Return conditions searched in indexes by query plan of queryset.
+    """
+    if connection.vendor != 'postgresql':
+        return ExplainFeedsCommand.index_conditions(queryset)
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Tiny test tables are cheaper to scan than to search.
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        return ExplainFeedsCommand.index_conditions(queryset)
+
+
+def create_test_image(name='photo.jpg', size=(2000, 1500)):
+    """
+    Create uploaded JPEG image.
+    """
+    buffer = io.BytesIO()
+    Image.new('RGB', size, 'red').save(buffer, 'JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(),
+                              content_type='image/jpeg')
+
+
 def create_test_user(username, password):
     """
     Create second test user.
@@ -33,6 +107,8 @@ def create_test_user(username, password):
 
 
 class AnnouncementsIndexViewTests(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         """
         Set up data to test.
@@ -67,6 +143,8 @@ class AnnouncementsIndexViewTests(TestCase):
 
 
 class AnnouncementsDetailViewTests(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         """
         Set up data to test.
@@ -120,6 +198,8 @@ class AnnouncementsDetailViewTests(TestCase):
 
 
 class AnnouncementsCategoryViewTests(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         """
         Set up data to test.
@@ -153,7 +233,108 @@ class AnnouncementsCategoryViewTests(TestCase):
                                )
 
 
+class CategoryFiltersTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.category = Category.objects.create(category_name='Elektronika')
+        self.other = Category.objects.create(category_name='AGD')
+        self.announcements = {}
+        for price in (10, 60, 150, 30000):
+            announcement = create_announcement(2, 'Elektronika')
+            announcement.price = price
+            announcement.save()
+            self.announcements[price] = announcement
+        self.other_announcement = create_announcement(2, 'AGD')
+        self.url = reverse('category-announcement', args=(self.category.id,))
+
+    def prices(self, response):
+        return [int(a.price) for a in response.context['announcements']]
+
+    def test_price_range_and_sort(self):
+        """
+        Test announcements in price range sorted by price.
+        """
+        response = self.client.get(self.url, {
+            'price_min': 50, 'price_max': 30000, 'sort': '-price'
+        })
+        self.assertEqual(self.prices(response), [30000, 150, 60])
+        response = self.client.get(self.url, {'sort': 'price'})
+        self.assertEqual(self.prices(response), [10, 60, 150, 30000])
+
+    def test_invalid_filters_are_ignored(self):
+        """
+        Test broken filter values show unfiltered newest first.
+        """
+        response = self.client.get(self.url, {
+            'price_min': 'abc', 'price_max': 100, 'sort': 'title'
+        })
+        self.assertEqual(self.prices(response), [60, 10])
+
+    def test_pages_sorted_by_price(self):
+        """
+        Test next page continues after the last price.
+        """
+        patcher = mock.patch.object(CategoryAnnouncementView, 'per_page', 3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.get(self.url, {'sort': 'price'})
+        response = self.client.get(
+            self.url + '?' + response.context['page'].next_query
+        )
+        self.assertEqual(self.prices(response), [30000])
+
+    def test_facet_counts(self):
+        """
+        Test counts of price ranges and of categories in chosen range.
+        """
+        response = self.client.get(self.url)
+        self.assertEqual([facet['count']
+                          for facet in response.context['price_facets']],
+                         [1, 2, 0, 0, 0, 1])
+        self.assertEqual([count for _, count, _
+                          in response.context['category_facets']],
+                         [4, 1])
+
+        # Whole price range is counted from cached facets.
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url + '?' + response.context[
+                'price_facets'][1]['query'])
+        self.assertEqual(self.prices(response), [150, 60])
+        self.assertTrue(response.context['price_facets'][1]['active'])
+        self.assertEqual([count for _, count, _
+                          in response.context['category_facets']],
+                         [2, 0])
+
+        response = self.client.get(self.url, {'price_min': 100})
+        self.assertEqual([count for _, count, _
+                          in response.context['category_facets']],
+                         [2, 1])
+
+    def test_price_change_refreshes_facets(self):
+        """
+        Test edited price of accepted announcement is counted again.
+        """
+        self.client.get(self.url)
+        announcement = Announcement.objects.get(
+            pk=self.announcements[10].pk)
+        announcement.price = 100
+        announcement.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['price_facets'][0]['count'], 0)
+        self.assertEqual(response.context['price_facets'][1]['count'], 3)
+
+
 class UserAnnouncementViewTest(TestCase):
+    databases = '__all__'
+
     def setUp(self):
         """
         Set up data to test.
@@ -186,3 +367,1657 @@ class UserAnnouncementViewTest(TestCase):
         self.assertContains(response,
                             'Lista Twoich wszystkich Twoich ogłoszeń'
                             )
+
+
+class AnnouncementsPaginationTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcements = [
+            create_announcement(2, 'Elektronika') for _ in range(5)
+        ]
+
+    def test_pages_follow_next_and_previous_links(self):
+        """
+        Test index page split by cursor, newest announcements first.
+        """
+        patcher = mock.patch.object(AnnouncementListView, 'per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        response = self.client.get(reverse('index'))
+        first_page = response.context['announcements']
+        self.assertEqual(
+            [a.id for a in first_page],
+            [a.id for a in reversed(self.announcements)][:2]
+        )
+        page = response.context['page']
+        self.assertFalse(page.has_previous)
+        self.assertTrue(page.has_next)
+
+        response = self.client.get(
+            reverse('index') + '?' + page.next_query
+        )
+        second_page = response.context['page']
+        self.assertEqual(
+            [a.id for a in second_page],
+            [a.id for a in reversed(self.announcements)][2:4]
+        )
+        self.assertContains(response, 'Poprzednia strona')
+
+        response = self.client.get(
+            reverse('index') + '?' + second_page.previous_query
+        )
+        self.assertEqual(
+            [a.id for a in response.context['announcements']],
+            [a.id for a in first_page]
+        )
+
+    def test_pagination_does_not_count_rows(self):
+        """
+        Test page is fetched without COUNT(*) and OFFSET.
+        """
+        get_categories()
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+        for query in queries.captured_queries:
+            self.assertNotIn('COUNT(', query['sql'].upper())
+            self.assertNotIn('OFFSET', query['sql'].upper())
+
+    def test_deep_page_seeks_in_index(self):
+        """
+        Test cursor of deep page is searched in index, not filtered out
+        of rows read from the top of the feed.
+        """
+        paginator = KeysetPaginator(Announcement.objects.filter(status=2), 2)
+        cursor = paginator.encode_cursor(self.announcements[2])
+        queryset = paginator.get_queryset(after=cursor)[:3]
+        self.assertEqual([a.id for a in queryset],
+                         [a.id for a in reversed(self.announcements[:2])])
+        self.assertTrue(any('created_at' in condition
+                            for condition in index_conditions(queryset)))
+
+    def test_invalid_cursor(self):
+        """
+        Test broken cursor returns 404 page.
+        """
+        response = self.client.get(reverse('index') + '?after=broken')
+        self.assertEqual(response.status_code, 404)
+
+
+class SearchTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.user = AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.category = Category.objects.create(category_name='Sport')
+        self.other_category = Category.objects.create(category_name='Dom')
+
+    def add(self, title, description='Opis', status=2, category=None):
+        return Announcement.objects.create(
+            title=title,
+            description=description,
+            price=100,
+            category=category or self.category,
+            user_who_added=self.user,
+            status=status,
+            image='staticfiles/2022/06/04/test.jpg'
+        )
+
+    def search(self, **params):
+        response = self.client.get(reverse('search'), params)
+        self.assertEqual(response.status_code, 200)
+        return [a.id for a in response.context['announcements']]
+
+    def test_stemmer_joins_inflected_forms(self):
+        """
+        Test inflected forms of words have the same stem without
+        diacritics.
+        """
+        self.assertEqual(stem('rowerami'), stem('rower'))
+        self.assertEqual(stem('rowerów'), stem('rowery'))
+        self.assertEqual(tokenize('Lodówka'), tokenize('lodowki'))
+        self.assertEqual(stem('dom'), 'dom')
+
+    def test_finds_inflected_words_without_diacritics(self):
+        """
+        Test accepted announcements matching every word are found.
+        """
+        bikes = self.add('Sprzedam rower górski')
+        self.add('Rower', description='Zablokowany', status=3)
+        self.add('Sprzedam lodówkę')
+        self.assertEqual(self.search(q='rowery gorskie'), [bikes.id])
+        self.assertEqual(self.search(q='ROWERÓW'), [bikes.id])
+
+    def test_matches_prefix_of_word(self):
+        """
+        Test the last typed word may be unfinished.
+        """
+        phone = self.add('Telefon komórkowy')
+        self.assertEqual(self.search(q='telef'), [phone.id])
+
+    def test_title_match_ranks_above_description_match(self):
+        """
+        Test announcements with searched word in title are first.
+        """
+        in_description = self.add('Sprzedam', description='Stary rower')
+        in_title = self.add('Rower miejski')
+        self.assertEqual(self.search(q='rower'),
+                         [in_title.id, in_description.id])
+
+    def test_edited_announcement_is_reindexed(self):
+        """
+        Test search index follows changed title.
+        """
+        announcement = self.add('Rower')
+        announcement.title = 'Hulajnoga'
+        announcement.save(update_fields=['title'])
+        self.assertEqual(self.search(q='rower'), [])
+        self.assertEqual(self.search(q='hulajnoga'), [announcement.id])
+
+    def test_filters_by_category(self):
+        """
+        Test only announcements from chosen category are found.
+        """
+        self.add('Rower')
+        other = self.add('Rower', category=self.other_category)
+        self.assertEqual(self.search(q='rower',
+                                     category=self.other_category.id),
+                         [other.id])
+        response = self.client.get(reverse('search'),
+                                   {'q': 'rower', 'category': 'x'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_empty_query_finds_nothing(self):
+        """
+        Test query without words returns empty page.
+        """
+        self.add('Rower')
+        self.assertEqual(self.search(q=' , '), [])
+
+    def test_pages_follow_next_link(self):
+        """
+        Test results with the same rank are split by cursor.
+        """
+        patcher = mock.patch.object(SearchView, 'per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        announcements = [self.add('Rower') for _ in range(5)]
+        response = self.client.get(reverse('search'), {'q': 'rower'})
+        seen = [a.id for a in response.context['announcements']]
+        page = response.context['page']
+        while page.has_next:
+            response = self.client.get(
+                reverse('search') + '?' + page.next_query
+            )
+            page = response.context['page']
+            seen += [a.id for a in page]
+        self.assertEqual(seen, [a.id for a in reversed(announcements)])
+
+    @skipUnless(connection.vendor == 'postgresql',
+                'ts_rank is computed by PostgreSQL only')
+    def test_pages_of_tied_float_ranks_miss_no_row(self):
+        """
+        Test paging through groups of rows with equal ts_rank, which is
+        not exact in binary, neither repeats nor skips a row.
+        """
+        patcher = mock.patch.object(SearchView, 'per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        for words in range(1, 4):
+            for _ in range(3):
+                self.add('Rower', description=' '.join(['opis'] * words))
+        expected = list(
+            search(Announcement.objects.filter(status=2), 'rower')
+            .order_by('-rank', '-id').values_list('id', flat=True)
+        )
+        response = self.client.get(reverse('search'), {'q': 'rower'})
+        page = response.context['page']
+        seen = [a.id for a in page]
+        while page.has_next:
+            response = self.client.get(
+                reverse('search') + '?' + page.next_query
+            )
+            page = response.context['page']
+            seen += [a.id for a in page]
+        self.assertEqual(len(expected), 9)
+        self.assertEqual(seen, expected)
+
+
+class AutocompleteTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.category = Category.objects.create(category_name='Motoryzacja')
+        Category.objects.create(category_name='Elektronika')
+        cache.clear()
+
+    def add(self, title, status=2):
+        return Announcement.objects.create(
+            title=title,
+            description='Opis',
+            price=100,
+            category=self.category,
+            user_who_added=AppUser.objects.get(username='test'),
+            status=status,
+            image='staticfiles/2022/06/04/test.jpg'
+        )
+
+    def suggest(self, prefix, **params):
+        response = self.client.get(reverse('autocomplete'),
+                                   dict(params, q=prefix))
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_suggests_accepted_titles_once(self):
+        """
+        Test distinct titles of accepted announcements are suggested.
+        """
+        self.add('Opony zimowe')
+        self.add('Opony zimowe')
+        self.add('Opony letnie', status=1)
+        self.add('Felgi')
+        self.assertEqual(self.suggest('opon')['titles'], ['Opony zimowe'])
+
+    def test_suggests_categories_despite_typo(self):
+        """
+        Test categories similar to prefix are suggested with their url.
+        """
+        data = self.suggest('motorizacj')
+        self.assertEqual(data['categories'], [{
+            'id': self.category.id,
+            'name': 'Motoryzacja',
+            'url': reverse('category-announcement',
+                           args=(self.category.id,)),
+        }])
+
+    def test_short_prefix_does_not_query_database(self):
+        """
+        Test single letter returns no suggestions without queries.
+        """
+        with self.assertNumQueries(0):
+            data = self.suggest('o')
+        self.assertEqual(data, {'titles': [], 'categories': []})
+
+    def test_hot_prefix_is_cached(self):
+        """
+        Test the same prefix is answered from cache.
+        """
+        self.add('Opony zimowe')
+        self.suggest('Opony')
+        get_categories()
+        with self.assertNumQueries(0):
+            data = self.suggest('opony ')
+        self.assertEqual(data['titles'], ['Opony zimowe'])
+
+    def test_limit_is_bounded(self):
+        """
+        Test at most limit titles are returned.
+        """
+        for number in range(5):
+            self.add('Opony {}'.format(number))
+        self.assertEqual(len(self.suggest('opony', limit=2)['titles']), 2)
+        self.assertEqual(len(self.suggest('opony', limit='x')['titles']), 5)
+
+
+class CategoriesCacheTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+
+    def test_cached_categories_do_not_query_database(self):
+        """
+        Test second read of categories is served from cache.
+        """
+        get_categories()
+        with self.assertNumQueries(0):
+            categories = get_categories()
+        self.assertEqual([c.category_name for c in categories],
+                         ['Elektronika'])
+
+    def test_new_category_invalidates_cache(self):
+        """
+        Test added category is visible in navbar.
+        """
+        get_categories()
+        Category.objects.create(category_name='AGD')
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'AGD')
+
+    def test_accepting_announcement_updates_count(self):
+        """
+        Test accepted announcements count follows status changes.
+        """
+        announcement = create_announcement(1, 'Elektronika')
+        self.assertEqual(get_categories()[0].accepted_count, 0)
+        announcement = Announcement.objects.get(pk=announcement.pk)
+        announcement.status = 2
+        announcement.save()
+        self.assertEqual(get_categories()[0].accepted_count, 1)
+        announcement.delete()
+        self.assertEqual(get_categories()[0].accepted_count, 0)
+
+    def test_process_local_version_expires(self):
+        """
+        Test change not seen by this process (made by other worker with
+        own cache) shows up once local version expires.
+        """
+        cache.clear()
+        get_categories()
+        Category.objects.bulk_create([Category(category_name='AGD')])
+        self.assertEqual(len(get_categories()), 1)
+        later = time.time() + settings.CATEGORIES_LOCAL_VERSION_TIMEOUT + 1
+        with mock.patch('django.core.cache.backends.locmem.time.time',
+                        return_value=later):
+            self.assertEqual(len(get_categories()), 2)
+
+
+class AnnouncementImageVariantsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test, store files in temporary directory.
+        """
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        storage = override_settings(
+            DEFAULT_FILE_STORAGE='django.core.files.storage.'
+                                 'FileSystemStorage',
+            MEDIA_ROOT=media_root,
+        )
+        storage.enable()
+        self.addCleanup(storage.disable)
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.category = Category.objects.create(
+            category_name='Elektronika'
+        )
+
+    def test_upload_generates_resized_variants(self):
+        """
+        Test added announcement has resized JPEG and WebP images.
+        """
+        self.client.login(username='test', password='test')
+        self.client.post(reverse('add-announcement'), {
+            'title': 'TEST',
+            'description': 'Test description',
+            'price': 100,
+            'category': self.category.id,
+            'image': create_test_image(),
+        })
+        run_pending()
+        announcement = Announcement.objects.get()
+        self.assertTrue(announcement.image_variants)
+        storage = announcement.image.storage
+        for variant, size in (('card', 400), ('detail', 1200)):
+            for extension in ('jpg', 'webp'):
+                name = variant_name(announcement.image.name, variant,
+                                    extension)
+                with storage.open(name) as image_file:
+                    self.assertEqual(max(Image.open(image_file).size), size)
+
+    def test_index_renders_srcset(self):
+        """
+        Test index page renders lazy loaded responsive image.
+        """
+        announcement = create_announcement(2, 'Elektronika')
+        announcement.image = create_test_image()
+        announcement.save()
+        generate_variants(announcement)
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, 'srcset=')
+        self.assertContains(response, 'image/webp')
+        self.assertContains(response, 'loading="lazy"')
+
+    def test_srcset_uses_width_of_portrait_variants(self):
+        """
+        Test srcset describes variants by their real width, not by their
+        longest side.
+        """
+        announcement = create_announcement(2, 'Elektronika')
+        announcement.image = create_test_image(size=(1500, 2000))
+        announcement.save()
+        generate_variants(announcement)
+        self.assertEqual(announcement.image_widths,
+                         {'card': 300, 'detail': 900})
+        response = self.client.get(reverse('index'))
+        self.assertContains(response, '__card.jpg 300w')
+        self.assertContains(response, '__detail.webp 900w')
+
+
+class ConditionalGetTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcement = create_announcement(2, 'Elektronika')
+
+    def test_unchanged_index_returns_not_modified(self):
+        """
+        Test index page is not rendered again for client with its ETag.
+        """
+        response = self.client.get(reverse('index'))
+        self.assertIn('ETag', response.headers)
+        self.assertNotIn('Last-Modified', response.headers)
+        get_categories()
+        with self.assertNumQueries(1):
+            response = self.client.get(
+                reverse('index'),
+                HTTP_IF_NONE_MATCH=response.headers['ETag']
+            )
+        self.assertEqual(response.status_code, 304)
+
+    def test_changed_announcement_renders_page(self):
+        """
+        Test detail page is rendered after announcement changed.
+        """
+        url = reverse('announcement', args=(self.announcement.id,))
+        etag = self.client.get(url).headers['ETag']
+        self.announcement.title = 'Nowy tytuł'
+        self.announcement.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Nowy tytuł')
+
+    def test_if_modified_since_renders_page_without_row(self):
+        """
+        Test page is rendered for client sending only If-Modified-Since
+        after announcement left the page, newest updated_at of the rest
+        did not change.
+        """
+        create_announcement(2, 'Elektronika')
+        Announcement.objects.filter(pk=self.announcement.pk).update(
+            title='Wycofane'
+        )
+        self.assertContains(self.client.get(reverse('index')), 'Wycofane')
+        Announcement.objects.filter(pk=self.announcement.pk).update(
+            status=3
+        )
+        response = self.client.get(
+            reverse('index'),
+            HTTP_IF_MODIFIED_SINCE=http_date(time.time() + 60)
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Wycofane')
+
+    def test_logged_user_gets_own_etag(self):
+        """
+        Test ETag of anonymous page does not match page of logged user.
+        """
+        url = reverse('category-announcement', args=(1,))
+        etag = self.client.get(url).headers['ETag']
+        self.client.login(username='test', password='test')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_pending_messages_are_rendered(self):
+        """
+        Test page with flash message is rendered even if ETag matches.
+        """
+        url = reverse('index')
+        self.client.login(username='test', password='test')
+        etag = self.client.get(url).headers['ETag']
+        self.client.get(reverse('login'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Jesteś już zalogowany!')
+
+
+class AnnouncementAdminActionsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        AppUser.objects.create_superuser(
+            username='admin',
+            password='admin'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.client.login(username='admin', password='admin')
+
+    def run_action(self, action, announcements):
+        """
+        Post admin action for announcements.
+        """
+        return self.client.post(
+            reverse('admin:craigslist_announcement_changelist'), {
+                'action': action,
+                '_selected_action': [a.id for a in announcements],
+            })
+
+    def test_bulk_accept_is_single_update(self):
+        """
+        Test accepting many announcements issues one UPDATE.
+        """
+        announcements = [create_announcement(1, 'Elektronika')
+                         for _ in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            self.run_action('accept', announcements)
+        updates = [q for q in queries.captured_queries
+                   if q['sql'].startswith('UPDATE "craigslist_announcement"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Announcement.objects.filter(status=2).count(), 5)
+        self.assertEqual(get_categories()[0].accepted_count, 5)
+
+    def test_actions_skip_announcements_in_other_statuses(self):
+        """
+        Test reserved announcement is not rejected or archived.
+        """
+        reserved = create_announcement(4, 'Elektronika')
+        accepted = create_announcement(2, 'Elektronika')
+        self.run_action('reject', [reserved, accepted])
+        reserved.refresh_from_db()
+        accepted.refresh_from_db()
+        self.assertEqual(reserved.status, 4)
+        self.assertEqual(accepted.status, 3)
+        self.run_action('archive', [reserved, accepted])
+        accepted.refresh_from_db()
+        self.assertEqual(accepted.status, 6)
+
+    # Manifest of collected static files does not exist in tests.
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.'
+                                           'storage.StaticFilesStorage')
+    def test_changelist_loads_users_in_one_query(self):
+        """
+        Test changelist queries do not grow with number of rows.
+        """
+        create_announcement(1, 'Elektronika')
+        url = reverse('admin:craigslist_announcement_changelist')
+        # Warm up categories cache used by the context processor.
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as few:
+            self.client.get(url)
+        for _ in range(10):
+            create_announcement(1, 'Elektronika')
+        with CaptureQueriesContext(connection) as many:
+            self.client.get(url)
+        self.assertEqual(len(few), len(many))
+
+
+@mock.patch.object(ModerationQueueView, 'batch_size', 3)
+class ModerationQueueTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.first = AppUser.objects.create_user(
+            username='first',
+            password='first',
+            is_staff=True
+        )
+        self.second = AppUser.objects.create_user(
+            username='second',
+            password='second',
+            is_staff=True
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcements = [create_announcement(1, 'Elektronika')
+                              for _ in range(5)]
+
+    def get_batch(self, user):
+        """
+        Return ids of announcements shown to moderator.
+        """
+        self.client.force_login(user)
+        response = self.client.get(reverse('moderation-queue'))
+        return [a.id for a in response.context['announcements']]
+
+    def test_moderators_get_different_announcements(self):
+        """
+        Test concurrent moderators do not get the same announcements
+        and reloading page keeps the batch.
+        """
+        first = self.get_batch(self.first)
+        second = self.get_batch(self.second)
+        self.assertEqual(len(first), 3)
+        self.assertEqual(len(second), 2)
+        self.assertFalse(set(first) & set(second))
+        self.assertEqual(self.get_batch(self.first), first)
+
+    def test_expired_lease_is_claimed_again(self):
+        """
+        Test announcements of moderator who left go to other moderator.
+        """
+        first = self.get_batch(self.first)
+        Announcement.objects.filter(pk__in=first).update(
+            moderation_lease_until=timezone.now()
+        )
+        self.assertEqual(len(self.get_batch(self.second)), 3)
+
+    def test_only_claiming_moderator_decides(self):
+        """
+        Test announcement is moderated only by moderator holding it.
+        """
+        announcement_id = self.get_batch(self.first)[0]
+        self.client.force_login(self.second)
+        self.client.post(reverse('moderation-queue'), {
+            'announcement_id': announcement_id, 'decision': 'accept'
+        })
+        self.assertEqual(
+            Announcement.objects.get(pk=announcement_id).status, 1
+        )
+        self.client.force_login(self.first)
+        self.client.post(reverse('moderation-queue'), {
+            'announcement_id': announcement_id, 'decision': 'reject'
+        })
+        self.assertEqual(
+            Announcement.objects.get(pk=announcement_id).status, 3
+        )
+
+    def test_not_staff_can_not_display_view(self):
+        """
+        Test regular user can not open moderation queue.
+        """
+        self.client.login(username='test', password='test')
+        response = self.client.get(reverse('moderation-queue'))
+        self.assertEqual(response.status_code, 403)
+
+
+class ArchiveTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.seller = AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.buyer = create_test_user('buyer', 'buyer')
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.sold = create_announcement(5, 'Elektronika')
+        Reservation.objects.create(announcement=self.sold,
+                                   reserved_by_user=self.buyer)
+        self.rejected = create_announcement(3, 'Elektronika')
+        self.accepted = create_announcement(2, 'Elektronika')
+        Announcement.objects.filter(pk__in=[self.sold.pk, self.rejected.pk])\
+            .update(updated_at=timezone.now() - timedelta(days=60))
+
+    def archive(self, **options):
+        call_command('archive_announcements', stdout=io.StringIO(),
+                     **options)
+
+    def test_old_rejected_and_sold_are_moved(self):
+        """
+        Test only old announcements in final statuses are moved with
+        their reservations.
+        """
+        recent = create_announcement(5, 'Elektronika')
+        self.archive(batch_size=1)
+        self.assertEqual(
+            set(ArchivedAnnouncement.objects.values_list('id', flat=True)),
+            {self.sold.id, self.rejected.id}
+        )
+        self.assertEqual(
+            set(Announcement.objects.values_list('id', flat=True)),
+            {self.accepted.id, recent.id}
+        )
+        archived = ArchivedReservation.objects.get()
+        self.assertEqual(archived.announcement_id, self.sold.id)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_background_job_moves_all_batches(self):
+        """
+        Test worker keeps enqueueing batches until nothing is left.
+        """
+        self.archive(batch_size=1, background=True)
+        run_pending()
+        self.assertEqual(ArchivedAnnouncement.objects.count(), 2)
+        self.assertFalse(Job.objects.filter(status=1).exists())
+
+    def test_user_views_show_archived_announcements(self):
+        """
+        Test user announcements and reservations include archived ones
+        and archived announcement can be displayed.
+        """
+        self.archive()
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('my-announcements'))
+        self.assertEqual(
+            [a.id for a in response.context['announcements']],
+            [self.accepted.id, self.rejected.id, self.sold.id]
+        )
+        self.client.force_login(self.buyer)
+        response = self.client.get(reverse('my-reservations'))
+        self.assertContains(response, 'Potwierdzono otrzymanie przedmiotu')
+        response = self.client.get(reverse('announcement',
+                                           args=(self.sold.id,)))
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'Sprzedane')
+
+    def test_user_announcements_pages_merge_archive(self):
+        """
+        Test pages of live and archived announcements follow each other.
+        """
+        patcher = mock.patch.object(UserAnnouncementView, 'per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.archive()
+        self.client.force_login(self.seller)
+        response = self.client.get(reverse('my-announcements'))
+        page = response.context['page']
+        response = self.client.get(
+            reverse('my-announcements') + '?' + page.next_query
+        )
+        self.assertEqual([a.id for a in response.context['announcements']],
+                         [self.sold.id])
+        response = self.client.get(
+            reverse('my-announcements') + '?' +
+            response.context['page'].previous_query
+        )
+        self.assertEqual([a.id for a in response.context['announcements']],
+                         [self.accepted.id, self.rejected.id])
+
+
+class ReplicaRoutingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.user = AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcement = create_announcement(2, 'Elektronika')
+        self.router = PrimaryReplicaRouter()
+        routers._lags.clear()
+        self.addCleanup(routers._lags.clear)
+
+    def read_db(self, replica_reads=True):
+        """
+        Return database chosen for read of request, outside of
+        transaction of test case.
+        """
+        token = routers.start_request()
+        try:
+            if replica_reads:
+                routers.allow_replica_reads()
+            with mock.patch.object(connection, 'in_atomic_block', False):
+                return self.router.db_for_read(Announcement)
+        finally:
+            routers.finish_request(token)
+
+    @override_settings(DATABASE_REPLICAS=['replica'])
+    def test_router_reads_from_healthy_replica(self):
+        """
+        Test allowed reads go to replica, other reads, reads in
+        transaction and writes to primary.
+        """
+        with mock.patch.object(routers, 'replica_lag', return_value=0.5):
+            self.assertEqual(self.read_db(), 'replica')
+            self.assertEqual(self.read_db(replica_reads=False), 'default')
+            self.assertEqual(self.router.db_for_read(Announcement),
+                             'default')
+            self.assertEqual(self.router.db_for_write(Announcement),
+                             'default')
+            token = routers.start_request()
+            routers.allow_replica_reads()
+            try:
+                with transaction.atomic():
+                    self.assertEqual(self.router.db_for_read(Announcement),
+                                     'default')
+                with routers.use_primary():
+                    self.assertEqual(self.router.db_for_read(Announcement),
+                                     'default')
+            finally:
+                routers.finish_request(token)
+
+    @override_settings(DATABASE_REPLICAS=['replica'],
+                       REPLICA_MAX_LAG_SECONDS=2)
+    def test_lagging_or_unreachable_replica_is_skipped(self):
+        """
+        Test reads fall back to primary when replica lags or is down.
+        """
+        with mock.patch.object(routers, 'replica_lag', return_value=5):
+            self.assertEqual(self.read_db(), 'default')
+        with mock.patch.object(routers, 'replica_lag', return_value=None):
+            self.assertEqual(self.read_db(), 'default')
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_replica_lag_is_checked_periodically(self):
+        """
+        Test lag is measured once per check interval.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(routers.replica_lag('default'), 0)
+            self.assertEqual(routers.replica_lag('default'), 0)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_middleware_pins_writer_to_primary(self):
+        """
+        Test listing reads from replica until browser posts, then
+        it reads from primary while it has pin cookie.
+        """
+        allow = mock.patch.object(routers, 'allow_replica_reads',
+                                  wraps=routers.allow_replica_reads)
+        with allow as allowed:
+            self.client.get(reverse('index'))
+            self.assertTrue(allowed.called)
+
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('book-announcement'),
+                                    {'announcement_id': 0})
+        self.assertIn(routers.PIN_COOKIE, response.cookies)
+        with allow as allowed:
+            self.client.get(reverse('index'))
+            self.client.get(reverse('announcement',
+                                    args=(self.announcement.id,)))
+            self.assertFalse(allowed.called)
+
+    @override_settings(DATABASE_REPLICAS=['default'])
+    def test_only_marked_views_read_from_replica(self):
+        """
+        Test user pages always read from primary.
+        """
+        self.client.force_login(self.user)
+        with mock.patch.object(routers, 'allow_replica_reads') as allowed:
+            self.client.get(reverse('my-announcements'))
+            self.assertFalse(allowed.called)
+
+
+class ShardingTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.router = routers.ShardRouter()
+
+    def test_region_for_zip(self):
+        """
+        Test region is postal district of zip code.
+        """
+        self.assertEqual(region_for_zip('31-042'), 3)
+        self.assertEqual(region_for_zip(' 90-001'), 9)
+        self.assertEqual(region_for_zip(''), 0)
+        self.assertEqual(region_for_zip(None), 0)
+        self.assertEqual(region_for_zip('AB-123'), 0)
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard_1'])
+    def test_shard_is_picked_by_region_and_id(self):
+        """
+        Test regions are spread over shards and shard of row is known
+        from its id.
+        """
+        self.assertEqual(shard_for_region(0), 'default')
+        self.assertEqual(shard_for_region(3), 'shard_1')
+        self.assertEqual(shard_for_id(42), 'default')
+        self.assertEqual(shard_for_id(SHARD_ID_RANGE + 42), 'shard_1')
+        self.assertEqual(shard_for_id(str(SHARD_ID_RANGE)), 'shard_1')
+        self.assertEqual(shard_for_id(5 * SHARD_ID_RANGE), 'default')
+        self.assertEqual(shard_for_id('abc'), 'default')
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard_1'])
+    def test_router_keeps_rows_on_their_shard(self):
+        """
+        Test new announcement goes to shard of its region, loaded rows
+        stay on their shard and other models are left to next router.
+        """
+        announcement = Announcement(region=1)
+        self.assertEqual(
+            self.router.db_for_write(Announcement, instance=announcement),
+            'shard_1')
+        reservation = Reservation(announcement_id=SHARD_ID_RANGE + 1)
+        self.assertEqual(
+            self.router.db_for_write(Reservation, instance=reservation),
+            'shard_1')
+        announcement._state.adding = False
+        announcement._state.db = 'shard_1'
+        self.assertEqual(
+            self.router.db_for_read(Reservation, instance=announcement),
+            'shard_1')
+        self.assertIsNone(
+            self.router.db_for_read(Category, instance=announcement))
+        self.assertIsNone(self.router.db_for_read(Announcement))
+        announcement._state.db = 'default'
+        self.assertIsNone(
+            self.router.db_for_read(Reservation, instance=announcement))
+
+    @override_settings(DATABASE_SHARDS=['default', 'shard_1'])
+    def test_related_does_not_join_across_shards(self):
+        """
+        Test users and categories are prefetched from default database
+        when announcements are sharded.
+        """
+        queryset = related(Reservation.objects.all(),
+                           'announcement__user_who_added__profile')
+        self.assertEqual(queryset.query.select_related,
+                         {'announcement': {}})
+        self.assertEqual(queryset._prefetch_related_lookups,
+                         ('announcement__user_who_added__profile',))
+        with override_settings(DATABASE_SHARDS=['default']):
+            queryset = related(Reservation.objects.all(),
+                               'announcement__user_who_added__profile')
+        self.assertFalse(queryset._prefetch_related_lookups)
+
+    @override_settings(DATABASE_SHARDS=['default'])
+    def test_region_page(self):
+        """
+        Test region page lists accepted announcements of sellers from
+        region only.
+        """
+        AppUser.objects.create_user(username='test', password='test')
+        Category.objects.create(category_name='Elektronika')
+        announcement = create_announcement(2, 'Elektronika')
+        Announcement.objects.filter(pk=announcement.pk).update(region=3)
+        other = create_announcement(2, 'Elektronika')
+        response = self.client.get(reverse('region-announcement',
+                                           args=(3,)))
+        self.assertEqual(list(response.context['announcements']),
+                         [announcement])
+        self.assertNotIn(other, response.context['announcements'])
+        response = self.client.get(reverse('region-announcement',
+                                           args=(10,)))
+        self.assertEqual(response.status_code, 404)
+
+    @override_settings(DATABASE_SHARDS=['default'])
+    def test_added_announcement_gets_region_of_seller(self):
+        """
+        Test region of new announcement comes from seller zip code.
+        """
+        user = AppUser.objects.create_user(username='test', password='test')
+        user.profile.zip_code = '31-042'
+        user.profile.save()
+        category = Category.objects.create(category_name='Elektronika')
+        self.client.force_login(user)
+        self.client.post(reverse('add-announcement'), {
+            'title': 'TEST',
+            'description': 'Test description',
+            'price': 100,
+            'category': category.id,
+            'image': create_test_image(),
+        })
+        self.assertEqual(Announcement.objects.get().region, 3)
+
+
+@skipUnless(len(settings.DATABASE_SHARDS) > 1,
+            'needs DATABASE_SHARD_URLS with at least one shard')
+class ShardedDatabasesTests(TestCase):
+    """
+    Run with shards configured, e.g.
+    DATABASE_SHARD_URLS=sqlite:////tmp/shard_1.sqlite3.
+    """
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up sellers of regions placed on default database and on the
+        first shard.
+        """
+        cache.clear()
+        self.shard = settings.DATABASE_SHARDS[1]
+        self.category = Category.objects.create(category_name='Elektronika')
+        self.local = self.create_user('local', '00-950')
+        self.remote = self.create_user('remote', '10-001')
+        self.buyer = self.create_user('buyer', '')
+
+    def create_user(self, username, zip_code):
+        user = AppUser.objects.create_user(username=username,
+                                           password=username)
+        user.profile.zip_code = zip_code
+        user.profile.save()
+        return user
+
+    def create_announcement(self, seller, status=2, minutes_ago=0):
+        """
+        Create announcement on shard of region of seller.
+        """
+        region = region_for_zip(seller.profile.zip_code)
+        announcement = Announcement.objects.using(
+            shard_for_region(region)
+        ).create(
+            title='TEST', description='Test description', price=100,
+            category=self.category, user_who_added=seller, status=status,
+            region=region, image='staticfiles/2022/06/04/test.jpg',
+        )
+        Announcement.objects.using(announcement._state.db).filter(
+            pk=announcement.pk
+        ).update(created_at=timezone.now() - timedelta(minutes=minutes_ago))
+        return announcement
+
+    def test_added_announcement_is_stored_on_shard_of_seller(self):
+        """
+        Test announcement added by seller from sharded region gets id
+        from range of the shard and is shown from there.
+        """
+        self.client.force_login(self.remote)
+        self.client.post(reverse('add-announcement'), {
+            'title': 'TEST',
+            'description': 'Test description',
+            'price': 100,
+            'category': self.category.id,
+            'image': create_test_image(),
+        })
+        self.assertFalse(Announcement.objects.using('default').exists())
+        announcement = Announcement.objects.using(self.shard).get()
+        self.assertGreaterEqual(announcement.pk, SHARD_ID_RANGE)
+        self.assertEqual(announcement.region, 1)
+        response = self.client.get(reverse('my-announcements'))
+        self.assertEqual(list(response.context['announcements']),
+                         [announcement])
+        response = self.client.get(reverse('announcement',
+                                           args=(announcement.pk,)))
+        self.assertEqual(response.context['object'], announcement)
+
+    def test_index_merges_shards_by_created_at(self):
+        """
+        Test index lists announcements of all shards newest first,
+        categories count them all.
+        """
+        expected = [self.create_announcement(seller, minutes_ago=minutes)
+                    for minutes, seller in enumerate(
+                        (self.local, self.remote, self.local, self.remote))]
+        response = self.client.get(reverse('index'))
+        self.assertEqual(list(response.context['announcements']), expected)
+        response = self.client.get(reverse('category-announcement',
+                                           args=(self.category.id,)))
+        self.assertEqual(list(response.context['announcements']), expected)
+        self.assertEqual(get_categories()[0].accepted_count, 4)
+        response = self.client.get(reverse('region-announcement',
+                                           args=(1,)))
+        self.assertEqual(list(response.context['announcements']),
+                         expected[1::2])
+
+    def test_reservation_and_purchase_stay_on_shard(self):
+        """
+        Test reservation and transaction are stored with announcement.
+        """
+        announcement = self.create_announcement(self.remote)
+        self.client.force_login(self.buyer)
+        self.client.post(reverse('book-announcement'),
+                         {'announcement_id': announcement.pk})
+        reservation = Reservation.objects.using(self.shard).get()
+        self.assertEqual(reservation.reserved_by_user, self.buyer)
+        response = self.client.get(reverse('my-reservations'))
+        self.assertContains(
+            response, 'value="{}"'.format(announcement.pk))
+        self.client.post(reverse('confirm'),
+                         {'announcement_id': announcement.pk})
+        self.assertTrue(Transaction.objects.using(self.shard).filter(
+            seller=self.remote, buyer=self.buyer).exists())
+        announcement.refresh_from_db()
+        self.assertEqual(announcement.status, 5)
+
+    def test_moderation_claims_from_all_shards(self):
+        """
+        Test moderator gets new announcements of every shard.
+        """
+        moderator = AppUser.objects.create_user(username='moderator',
+                                                password='moderator',
+                                                is_staff=True)
+        expected = [self.create_announcement(seller, status=1,
+                                             minutes_ago=minutes)
+                    for minutes, seller in ((2, self.local),
+                                            (1, self.remote))]
+        self.client.force_login(moderator)
+        response = self.client.get(reverse('moderation-queue'))
+        self.assertEqual(list(response.context['announcements']), expected)
+        self.client.post(reverse('moderation-queue'), {
+            'announcement_id': expected[1].pk, 'decision': 'accept',
+        })
+        expected[1].refresh_from_db()
+        self.assertEqual(expected[1].status, 2)
+
+    def test_region_page_includes_rows_left_on_default(self):
+        """
+        Test region page lists announcements of region added before
+        shards were configured, which stay on default database.
+        """
+        added = self.create_announcement(self.remote)
+        legacy = Announcement.objects.using('default').create(
+            title='TEST', description='Test description', price=100,
+            category=self.category, user_who_added=self.remote, status=2,
+            region=1, image='staticfiles/2022/06/04/test.jpg',
+        )
+        Announcement.objects.using('default').filter(pk=legacy.pk).update(
+            created_at=timezone.now() - timedelta(minutes=1))
+        self.create_announcement(self.local)
+        response = self.client.get(reverse('region-announcement',
+                                           args=(1,)))
+        self.assertEqual(list(response.context['announcements']),
+                         [added, legacy])
+
+    @override_settings(STATICFILES_STORAGE='django.contrib.staticfiles.'
+                                           'storage.StaticFilesStorage')
+    def test_admin_works_on_chosen_shard(self):
+        """
+        Test admin lists and changes announcements of shard chosen by
+        filter and opens announcement from shard of its id.
+        """
+        admin = AppUser.objects.create_superuser(username='admin',
+                                                 password='admin')
+        local = self.create_announcement(self.local, status=1)
+        remote = self.create_announcement(self.remote, status=1)
+        self.client.force_login(admin)
+        changelist = reverse('admin:craigslist_announcement_changelist')
+        response = self.client.get(changelist)
+        self.assertEqual(list(response.context['cl'].result_list), [local])
+        response = self.client.get(changelist, {'shard': self.shard})
+        self.assertEqual(list(response.context['cl'].result_list), [remote])
+        self.client.post('{}?shard={}'.format(changelist, self.shard), {
+            'action': 'accept', '_selected_action': [remote.pk],
+        })
+        remote.refresh_from_db()
+        self.assertEqual(remote.status, 2)
+        response = self.client.get(reverse(
+            'admin:craigslist_announcement_change', args=(remote.pk,)))
+        self.assertEqual(response.context['original'], remote)
+
+
+class GenerateDataTests(TestCase):
+    databases = '__all__'
+
+    def test_generates_related_rows(self):
+        """
+        Test every user has profile and reserved and sold announcements
+        have reservations of other users.
+        """
+        def count(queryset):
+            # Rows are spread over shards by region of seller.
+            return sum(shard.count() for shard in scatter(queryset))
+
+        call_command('generate_data', users=20, announcements=300,
+                     categories=3, batch_size=100, processes=1,
+                     stdout=io.StringIO())
+        self.assertEqual(AppUser.objects.count(), 20)
+        self.assertEqual(Profile.objects.count(), 20)
+        self.assertEqual(Category.objects.count(), 3)
+        self.assertEqual(count(Announcement.objects.all()), 300)
+        self.assertEqual(
+            count(Reservation.objects.all()),
+            count(Announcement.objects.filter(status__in=(4, 5)))
+        )
+        self.assertEqual(count(Transaction.objects.all()),
+                         count(Announcement.objects.filter(status=5)))
+        self.assertFalse(count(Reservation.objects.filter(
+            reserved_by_user=F('announcement__user_who_added'))))
+        self.assertEqual(get_categories()[0].accepted_count,
+                         count(Announcement.objects.filter(
+                             status=2, category=get_categories()[0])))
+
+    def test_same_seed_gives_same_data(self):
+        """
+        Test chunk generated with the same seed is the same.
+        """
+        first, _ = build_users(1, 0, 0, 10, '')
+        second, _ = build_users(1, 0, 0, 10, '')
+        other, _ = build_users(2, 0, 0, 10, '')
+        self.assertEqual([u.username for u in first],
+                         [u.username for u in second])
+        self.assertNotEqual([u.first_name for u in first],
+                            [u.first_name for u in other])
+
+
+class PerformanceMiddlewareTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        create_announcement(2, 'Elektronika')
+
+    @override_settings(SERVER_TIMING=True)
+    def test_server_timing_reports_queries(self):
+        """
+        Test Server-Timing header reports queries, template,
+        storage and total time.
+        """
+        # Index reads every shard.
+        with contextlib.ExitStack() as stack:
+            captured = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in settings.DATABASE_SHARDS
+            ]
+            response = self.client.get(reverse('index'))
+        queries = sum(len(queries) for queries in captured)
+        timing = response.headers['Server-Timing']
+        self.assertIn('db;desc="{} queries"'.format(queries), timing)
+        for metric in ('tpl;dur=', 'storage;dur=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    @override_settings(SERVER_TIMING=False, DEBUG=False)
+    def test_server_timing_is_sent_to_staff_only(self):
+        """
+        Test Server-Timing header is not sent to anonymous and regular
+        users, only to staff members.
+        """
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response.headers)
+        self.client.login(username='test', password='test')
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response.headers)
+        AppUser.objects.filter(username='test').update(is_staff=True)
+        response = self.client.get(reverse('index'))
+        self.assertIn('Server-Timing', response.headers)
+
+    @override_settings(SLOW_REQUEST_THRESHOLD_MS=0)
+    def test_slow_request_is_logged_with_view_name(self):
+        """
+        Test request over threshold is logged with view name.
+        """
+        with self.assertLogs('craigslist.performance', 'WARNING') as logs:
+            self.client.get(reverse('index'))
+        record = json.loads(logs.records[0].args[0])
+        self.assertEqual(record['view'], 'index')
+        self.assertEqual(record['status'], 200)
+        self.assertGreater(record['template_ms'], 0)
+
+
+class ProfilingMiddlewareTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        AppUser.objects.create_superuser(
+            username='admin',
+            password='admin'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        create_announcement(2, 'Elektronika')
+        self.directory = tempfile.mkdtemp()
+        self.settings = override_settings(PROFILE_STORE_DIR=self.directory,
+                                          PROFILE_STORE_MAX_FILES=2)
+        self.settings.enable()
+
+    def tearDown(self):
+        self.settings.disable()
+        shutil.rmtree(self.directory)
+
+    def test_staff_request_is_profiled(self):
+        """
+        Test staff member gets profile of view in pstats format.
+        """
+        self.client.login(username='admin', password='admin')
+        response = self.client.get(reverse('index'), {'profile': 'cprofile'})
+        profile = RequestProfile.objects.get(
+            pk=response.headers['X-Profile-Id']
+        )
+        self.assertEqual(profile.view_name, 'index')
+        with profile.file.open('rb') as file:
+            stats = marshal.load(file)
+        functions = {function for _, _, function in stats}
+        self.assertIn('get_context_data', functions)
+
+    def test_other_users_are_not_profiled(self):
+        """
+        Test profiling is ignored for users who are not staff.
+        """
+        self.client.login(username='test', password='test')
+        response = self.client.get(reverse('index'), HTTP_X_PROFILE='sampling')
+        self.assertNotIn('X-Profile-Id', response.headers)
+        self.assertFalse(RequestProfile.objects.exists())
+
+    def test_only_latest_profiles_are_kept(self):
+        """
+        Test store keeps PROFILE_STORE_MAX_FILES latest profiles
+        and admin serves them.
+        """
+        self.client.login(username='admin', password='admin')
+        for _ in range(3):
+            response = self.client.get(reverse('index'),
+                                       HTTP_X_PROFILE='sampling')
+        self.assertEqual(RequestProfile.objects.count(), 2)
+        self.assertEqual(len(os.listdir(self.directory)), 2)
+        response = self.client.get(reverse(
+            'admin:craigslist_requestprofile_download',
+            args=(response.headers['X-Profile-Id'],)
+        ))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('.folded', response.headers['Content-Disposition'])
+
+
+class MetricsTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        self.buyer = AppUser.objects.create_user(
+            username='buyer',
+            password='buyer'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcement = create_announcement(2, 'Elektronika')
+
+    @override_settings(METRICS_ALLOWED_IPS=[], METRICS_TOKEN='secret')
+    def test_metrics_require_allowed_address_or_token(self):
+        """
+        Test metrics are hidden from public and served with token.
+        """
+        self.assertEqual(self.client.get(reverse('metrics')).status_code,
+                         404)
+        self.client.get(reverse('index'))
+        response = self.client.get(reverse('metrics'),
+                                   HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(
+            'craigslist_http_requests_total{method="GET",status="200",'
+            'view="index"}', response.content.decode()
+        )
+
+    def test_reservation_is_counted_after_commit(self):
+        """
+        Test business counter is incremented by committed reservation.
+        """
+        def reservations():
+            return REGISTRY.get_sample_value(
+                'craigslist_reservations_created_total'
+            )
+
+        before = reservations()
+        self.client.login(username='buyer', password='buyer')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('book-announcement'),
+                             {'announcement_id': self.announcement.id})
+        self.assertEqual(reservations(), before + 1)
+
+
+class ConnectionPoolTests(TestCase):
+    databases = '__all__'
+
+    def create_pool(self, max_size=2, health_check_interval=60):
+        """
+        Create pool of fake connections, healthy unless closed.
+        """
+        return ConnectionPool(
+            'test', FakeConnection, lambda conn: not conn.closed,
+            max_size=max_size, timeout=0.05,
+            health_check_interval=health_check_interval,
+        )
+
+    @staticmethod
+    def checked_out():
+        return REGISTRY.get_sample_value(
+            'craigslist_db_pool_checked_out_connections',
+            {'database': 'test'}
+        )
+
+    def test_returned_connection_is_reused(self):
+        """
+        Test connection returned to pool is handed out again.
+        """
+        pool = self.create_pool()
+        first = pool.checkout()
+        pool.checkin(first)
+        self.assertIs(pool.checkout(), first)
+        self.assertEqual(pool.size, 1)
+
+    def test_full_pool_times_out(self):
+        """
+        Test checkout waits for returned connection and gives up after
+        timeout when none is returned.
+        """
+        pool = self.create_pool(max_size=1)
+        before = self.checked_out()
+        pool.checkout()
+        self.assertEqual(self.checked_out(), before + 1)
+        with self.assertRaises(PoolTimeout):
+            pool.checkout()
+
+    def test_broken_connection_is_replaced(self):
+        """
+        Test idle connection failing health check is closed and replaced
+        by new one.
+        """
+        pool = self.create_pool(health_check_interval=0)
+        broken = pool.checkout()
+        pool.checkin(broken)
+        broken.closed = True
+        connection = pool.checkout()
+        self.assertIsNot(connection, broken)
+        self.assertEqual(pool.size, 1)
+
+    def test_unreusable_connection_frees_slot(self):
+        """
+        Test connection returned as unreusable is closed and pool opens
+        new one in its place.
+        """
+        pool = self.create_pool(max_size=1)
+        connection = pool.checkout()
+        pool.checkin(connection, reusable=False)
+        self.assertTrue(connection.closed)
+        self.assertEqual((pool.size, pool.idle), (0, 0))
+        self.assertIsNot(pool.checkout(), connection)
+
+    def test_close_idle(self):
+        """
+        Test idle connections are closed, checked out ones are kept.
+        """
+        pool = self.create_pool()
+        idle, used = pool.checkout(), pool.checkout()
+        pool.checkin(idle)
+        pool.close_idle()
+        self.assertTrue(idle.closed)
+        self.assertFalse(used.closed)
+        self.assertEqual(pool.size, 1)
+
+    def test_statement_timeout_is_ignored_by_sqlite(self):
+        """
+        Test statement timeout runs no queries on other databases than
+        PostgreSQL.
+        """
+        if connection.vendor == 'postgresql':
+            self.skipTest('statement timeout is set on PostgreSQL')
+        with CaptureQueriesContext(connection) as queries:
+            with statement_timeout(100):
+                pass
+        self.assertEqual(len(queries), 0)
+
+
+@override_settings(SESSION_WRITE_BEHIND=True)
+class SessionStorageTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        cache.clear()
+        AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+        Category.objects.create(
+            category_name='Elektronika'
+        )
+        self.announcement = create_announcement(2, 'Elektronika')
+
+    def test_logged_browsing_does_not_touch_session_table(self):
+        """
+        Test session of logged user is read from cache and flash messages
+        are kept in cookie.
+        """
+        self.client.post(reverse('login'),
+                         {'username': 'test', 'password': 'test'})
+        self.assertIn('messages', self.client.cookies)
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('index'))
+            self.client.get(reverse('login'))
+            response = self.client.get(
+                reverse('announcement', args=(self.announcement.id,)))
+        self.assertEqual(response.context['user'].username, 'test')
+        self.assertFalse([query for query in queries
+                          if 'django_session' in query['sql']])
+
+    def test_changed_session_is_written_by_flush(self):
+        """
+        Test session is written to database by flush only once, and
+        is loaded from database when it is missing in cache.
+        """
+        self.client.login(username='test', password='test')
+        self.client.get(reverse('index'))
+        self.assertFalse(Session.objects.exists())
+        self.assertEqual(flush_dirty(), 1)
+        self.assertEqual(flush_dirty(), 0)
+        session = Session.objects.get()
+        self.assertEqual(session.get_decoded()['_auth_user_id'],
+                         str(AppUser.objects.get(username='test').id))
+        cache.clear()
+        response = self.client.get(reverse('index'))
+        self.assertEqual(response.context['user'].username, 'test')
+
+    def test_logout_deletes_session(self):
+        """
+        Test session of logged out user can not be loaded again.
+        """
+        self.client.login(username='test', password='test')
+        flush_dirty()
+        session_key = self.client.session.session_key
+        self.client.get(reverse('logout'))
+        self.assertFalse(
+            Session.objects.filter(session_key=session_key).exists())
+        self.client.cookies['sessionid'] = session_key
+        response = self.client.get(reverse('index'))
+        self.assertFalse(response.context['user'].is_authenticated)
+
+
+class ProfileWritesTests(TestCase):
+    databases = '__all__'
+
+    def setUp(self):
+        """
+        Set up data to test.
+        """
+        self.user = AppUser.objects.create_user(
+            username='test',
+            password='test'
+        )
+
+    @staticmethod
+    def profile_updates(queries):
+        return [query['sql'] for query in queries
+                if query['sql'].startswith('UPDATE "craigslist_profile"')]
+
+    def test_login_does_not_update_profile(self):
+        """
+        Test last_login update of user does not save profile.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('login'),
+                             {'username': 'test', 'password': 'test'})
+        self.assertTrue(any('UPDATE "auth_user"' in query['sql']
+                            for query in queries))
+        self.assertEqual(self.profile_updates(queries), [])
+
+    def test_profile_form_updates_changed_fields(self):
+        """
+        Test profile form updates only changed columns and unchanged
+        profile is not saved.
+        """
+        self.client.login(username='test', password='test')
+        data = {'first_name': '', 'last_name': '', 'email': '',
+                'street': '', 'zip_code': '10-001', 'city': '', 'phone': ''}
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('my-profile'), data)
+        updates = self.profile_updates(queries)
+        self.assertEqual(len(updates), 1)
+        self.assertIn('"zip_code"', updates[0])
+        self.assertNotIn('"city"', updates[0])
+        self.assertEqual(Profile.objects.get(user=self.user).zip_code,
+                         '10-001')
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse('my-profile'), data)
+        self.assertEqual(self.profile_updates(queries), [])
+
+    def test_missing_profile_is_created(self):
+        """
+        Test profile page creates profile of user saved without it.
+        """
+        Profile.objects.filter(user=self.user).delete()
+        self.client.login(username='test', password='test')
+        response = self.client.get(reverse('my-profile'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Profile.objects.filter(user=self.user).exists())
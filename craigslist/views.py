@@ -1,12 +1,33 @@
+import hashlib
+import itertools
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import Count, Prefetch
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response, \
+    patch_cache_control, patch_vary_headers, quote_etag
 from django.shortcuts import render, get_object_or_404, redirect
 from django.views import View
 from django.views.generic import FormView, \
     ListView, UpdateView, DeleteView, DetailView
 from django.contrib.auth import get_user_model, authenticate, login, logout
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from .forms import AnnouncementForm, LoginForm,\
-    RegisterUserForm, UserForm, ProfileForm
-from .models import Announcement, Category, STATUS, Reservation, Transaction
+    RegisterUserForm, UserForm, ProfileForm, CategoryFilterForm
+from .autocomplete import suggest
+from .cache import PRICE_BUCKETS, get_categories, \
+    get_categories_version, get_price_facets
+from .metrics import cache_lookup, export, is_allowed
+from .models import Announcement, ArchivedAnnouncement, \
+    ArchivedReservation, Category, Profile, STATUS, Reservation
+from .pagination import KeysetPaginator, InvalidCursor, \
+    MergedKeysetPaginator
+from .search import search
+from .sharding import REGIONS, on_shard, region_for_zip, related, \
+    scatter, shard_for_id, shard_for_region, shards_of_ids
+from .tasks import enqueue_image
 from django.contrib.auth.models import User as AppUser
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib import messages
@@ -14,11 +35,138 @@ from django.utils.translation import gettext as _
 
 User = get_user_model()
 
+CENT = Decimal('0.01')
 
-class AnnouncementListView(ListView):
+
+class KeysetPaginationMixin:
+    """
+    Split announcements list into pages using cursor in query string.
+    """
+    per_page = 24
+    keyset_ordering = ('-created_at', '-id')
+
+    def paginate_keyset(self, queryset, *querysets):
+        """
+        Return page of queryset selected by 'after' or 'before' parameter.
+        Rows of more querysets are merged into the same pages.
+        """
+        if querysets:
+            paginator = MergedKeysetPaginator((queryset,) + querysets,
+                                              self.per_page,
+                                              ordering=self.keyset_ordering)
+        else:
+            paginator = KeysetPaginator(queryset, self.per_page,
+                                        ordering=self.keyset_ordering)
+        try:
+            page = paginator.page(after=self.request.GET.get('after'),
+                                  before=self.request.GET.get('before'))
+        except InvalidCursor:
+            raise Http404(_('Niepoprawny numer strony'))
+        page.next_query = self._page_query('after', page.next_cursor)
+        page.previous_query = self._page_query('before',
+                                               page.previous_cursor)
+        return page
+
+    def page_values(self, queryset, *fields):
+        """
+        Return values of fields of rows shown on page, without loading
+        whole objects.
+        """
+        paginator = KeysetPaginator(queryset, self.per_page,
+                                    ordering=self.keyset_ordering)
+        try:
+            rows = paginator.get_queryset(
+                after=self.request.GET.get('after'),
+                before=self.request.GET.get('before'),
+            )
+        except InvalidCursor:
+            raise Http404(_('Niepoprawny numer strony'))
+        return rows.values_list(*fields)[:self.per_page + 1]
+
+    def _page_query(self, key, cursor):
+        """
+        Return query string for page link, keep other GET parameters.
+        """
+        if cursor is None:
+            return None
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        params[key] = cursor
+        return params.urlencode()
+
+
+class ConditionalGetMixin:
+    """
+    Answer 304 Not Modified if page did not change since client fetched
+    it, without running page queries and rendering template.
+
+    ETag is computed from (id, updated_at) of announcements shown on the
+    page, cached categories version (navbar and category names), logged
+    user and his CSRF token. Pages with pending flash messages are always
+    rendered. Last-Modified is not sent: newest updated_at of the page
+    does not change when announcement leaves it, categories change or
+    user logs in or out, so If-Modified-Since alone could get stale 304.
+    """
+    def get_validator_rows(self):
+        """
+        Return list of (id, updated_at) of announcements shown on page.
+        """
+        raise NotImplementedError
+
+    def get_etag(self):
+        """
+        Return ETag of the page or None if page must be rendered.
+        """
+        if len(messages.get_messages(self.request)):
+            return None
+        rows = list(self.get_validator_rows())
+        user = self.request.user
+        parts = [
+            settings.RELEASE_VERSION,
+            get_categories_version(),
+            user.pk,
+            self.request.META.get('CSRF_COOKIE', '')
+            if user.is_authenticated else '',
+            rows,
+        ]
+        return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+    def conditional_get(self):
+        """
+        Return 304 response if client has current page, None otherwise.
+        """
+        self.etag = self.get_etag()
+        if self.etag is None:
+            return None
+        response = get_conditional_response(self.request, etag=self.etag)
+        cache_lookup('http_etag', response is not None)
+        if response is not None:
+            self.add_validators(response)
+        return response
+
+    def add_validators(self, response):
+        """
+        Add ETag header to response.
+        """
+        if getattr(self, 'etag', None) is None:
+            return response
+        response.headers['ETag'] = self.etag
+        # Page depends on logged user, browsers and proxy have to ask.
+        patch_cache_control(response, no_cache=True)
+        if self.request.user.is_authenticated:
+            patch_cache_control(response, private=True)
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
+
+class AnnouncementListView(ConditionalGetMixin, KeysetPaginationMixin,
+                           ListView):
     """
     Display list all announcements with status = 2 ('zaakceptowane')
     """
+    # Reads go to replicas, see ReplicaRoutingMiddleware.
+    read_from_replica = True
     model = Announcement
     template_name = 'index.html'
     context_object_name = 'announcements'
@@ -27,31 +175,310 @@ class AnnouncementListView(ListView):
         """
         Return the list of announcements for this view filter by status.
         """
-        return Announcement.objects.\
-            filter(status=2).order_by('created_at').reverse()
+        return Announcement.objects.filter(status=2)
+
+    def get_shard_querysets(self, queryset):
+        """
+        Return queryset for every shard, pages merge rows of all shards.
+        """
+        return scatter(queryset)
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests: to display announcements list.
+        """
+        not_modified = self.conditional_get()
+        if not_modified is not None:
+            return not_modified
+        return self.add_validators(super().get(request, *args, **kwargs))
+
+    def get_validator_rows(self):
+        return itertools.chain.from_iterable(
+            self.page_values(queryset, 'id', 'updated_at')
+            for queryset in self.get_shard_querysets(self.get_queryset())
+        )
+
+    def get_context_data(self, **kwargs):
+        """
+        Replace full announcements list with single page.
+        """
+        page = self.paginate_keyset(
+            *self.get_shard_querysets(self.object_list)
+        )
+        kwargs['object_list'] = page.object_list
+        context = super().get_context_data(**kwargs)
+        context['page'] = page
+        return context
 
 
-class CategoryAnnouncementView(View):
+class RegionAnnouncementView(AnnouncementListView):
     """
-    Display list all announcements filter by category.
+    Display list all accepted announcements of sellers from region,
+    read from shard of the region and default database. Announcements
+    added before shards were configured stay on default database, their
+    ids (and URLs) place them there.
     """
+    def get_queryset(self):
+        """
+        Return accepted announcements of region.
+        """
+        if self.kwargs['region'] not in REGIONS:
+            raise Http404(_('Nie ma takiego regionu'))
+        return super().get_queryset().filter(region=self.kwargs['region'])
+
+    def get_shard_querysets(self, queryset):
+        shards = {DEFAULT_DB_ALIAS, shard_for_region(self.kwargs['region'])}
+        return [on_shard(queryset, alias) for alias in sorted(shards)]
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['region'] = self.kwargs['region']
+        return context
+
+
+class CategoryAnnouncementView(ConditionalGetMixin, KeysetPaginationMixin,
+                               View):
+    """
+    Display list all announcements filter by category, optionally
+    filtered by price range and sorted by price, with counts of
+    announcements in price ranges and other categories.
+    """
+    read_from_replica = True
+    template_name = "category_announcements.html"
+    # Keyset orderings of sort choices of CategoryFilterForm.
+    sort_orderings = {
+        'newest': ('-created_at', '-id'),
+        'price': ('price', 'id'),
+        '-price': ('-price', '-id'),
+    }
+
+    def setup(self, request, *args, **kwargs):
+        """
+        Read filters, invalid ones are ignored.
+        """
+        super().setup(request, *args, **kwargs)
+        self.filters = CategoryFilterForm(request.GET)
+        self.filters.is_valid()
+        self.price_min = self.filters.cleaned_data.get('price_min')
+        self.price_max = self.filters.cleaned_data.get('price_max')
+        self.sort = self.filters.cleaned_data.get('sort') or 'newest'
+        self.keyset_ordering = self.sort_orderings[self.sort]
+
     def get(self, request, category_id):
         """
         Handle GET requests: to display category announcements list.
         """
+        not_modified = self.conditional_get()
+        if not_modified is not None:
+            return not_modified
+        return self.add_validators(
+            render(request=request,
+                   template_name=self.template_name,
+                   context=self.get_context(category_id))
+        )
+
+    def filter_price(self, queryset):
+        """
+        Return queryset limited to chosen price range.
+        """
+        if self.price_min is not None:
+            queryset = queryset.filter(price__gte=self.price_min)
+        if self.price_max is not None:
+            queryset = queryset.filter(price__lte=self.price_max)
+        return queryset
+
+    def get_announcements(self, category_id):
+        return self.filter_price(
+            Announcement.objects.filter(category_id=category_id, status=2)
+        )
+
+    def get_validator_rows(self):
+        return itertools.chain.from_iterable(
+            self.page_values(queryset, 'id', 'updated_at')
+            for queryset in scatter(
+                self.get_announcements(self.kwargs['category_id'])
+            )
+        )
+
+    def get_context(self, category_id):
+        """
+        Return category, page of its accepted announcements from all
+        shards and facets.
+        """
         category = get_object_or_404(Category, id=category_id)
-        announcements = Announcement.objects.\
-            filter(category_id=category_id, status=2).\
-            order_by('created_at').reverse()
+        page = self.paginate_keyset(
+            *scatter(self.get_announcements(category_id))
+        )
+        return {
+            "category": category,
+            "announcements": page.object_list,
+            "page": page,
+            "filters": self.filters,
+            "price_facets": self.get_price_facets(category_id),
+            "category_facets": self.get_category_facets(),
+        }
+
+    def get_price_facets(self, category_id):
+        """
+        Return list of price ranges of category with their counts and
+        query strings selecting them.
+        """
+        counts = get_price_facets().get(category_id,
+                                        [0] * len(PRICE_BUCKETS))
+        facets = []
+        for index, lower in enumerate(PRICE_BUCKETS):
+            upper = (PRICE_BUCKETS[index + 1]
+                     if index + 1 < len(PRICE_BUCKETS) else None)
+            # Ranges are [lower, upper), price_max is inclusive.
+            price_max = upper - CENT if upper is not None else None
+            if upper is None:
+                label = _('od {} zł').format(lower)
+            elif not lower:
+                label = _('do {} zł').format(upper)
+            else:
+                label = _('{} – {} zł').format(lower, upper)
+            facets.append({
+                "label": label,
+                "count": counts[index],
+                "query": self._filter_query(price_min=lower or None,
+                                            price_max=price_max),
+                "active": (self.price_min or 0) == lower and
+                self.price_max == price_max,
+            })
+        return facets
+
+    def get_category_facets(self):
+        """
+        Return list of (category, count in chosen price range, query
+        string keeping filters).
+
+        Without price range counts come from cached categories, for
+        ranges made of whole price buckets from cached price facets,
+        other ranges are counted by single grouped query.
+        """
+        categories = get_categories()
+        if self.price_min is None and self.price_max is None:
+            counts = {category.id: category.accepted_count
+                      for category in categories}
+        else:
+            buckets = self._bucket_range()
+            if buckets is not None:
+                counts = {category_id: sum(bucket_counts[buckets])
+                          for category_id, bucket_counts
+                          in get_price_facets().items()}
+            else:
+                counts = {}
+                for queryset in scatter(self.filter_price(
+                    Announcement.objects.filter(status=2)
+                ).values_list('category_id').annotate(
+                    count=Count('id')
+                ).order_by()):
+                    for category_id, count in queryset:
+                        counts[category_id] = counts.get(category_id,
+                                                         0) + count
+        query = self._filter_query()
+        return [(category, counts.get(category.id, 0), query)
+                for category in categories]
+
+    def _bucket_range(self):
+        """
+        Return slice of PRICE_BUCKETS covered by chosen price range or
+        None if range does not start and end on bucket bounds.
+        """
+        lowers = list(PRICE_BUCKETS)
+        uppers = [bound - CENT for bound in PRICE_BUCKETS[1:]] + [None]
+        price_min = self.price_min or 0
+        if price_min not in lowers or self.price_max not in uppers:
+            return None
+        start = lowers.index(price_min)
+        stop = uppers.index(self.price_max) + 1
+        return slice(start, stop) if start < stop else None
+
+    def _filter_query(self, **changes):
+        """
+        Return query string with current filters and sorting updated
+        with changes, starting from first page.
+        """
+        params = self.request.GET.copy()
+        params.pop('after', None)
+        params.pop('before', None)
+        for key, value in changes.items():
+            if value is None:
+                params.pop(key, None)
+            else:
+                params[key] = value
+        return params.urlencode()
+
+
+class SearchView(KeysetPaginationMixin, View):
+    """
+    Display accepted announcements matching words given in 'q' parameter,
+    best matches first, optionally only from category given in 'category'
+    parameter. Results of shards are merged by their rank.
+    """
+    read_from_replica = True
+    template_name = "search_results.html"
+    keyset_ordering = ('-rank', '-id')
+
+    def get(self, request):
+        """
+        Handle GET requests: to display page of search results.
+        """
+        query = request.GET.get('q', '').strip()
+        category_id = request.GET.get('category', '')
+        announcements = Announcement.objects.filter(status=2)
+        if category_id:
+            if not category_id.isdigit():
+                raise Http404(_('Nie ma takiej kategorii'))
+            announcements = announcements.filter(category_id=category_id)
+        page = self.paginate_keyset(*[
+            search(queryset, query) for queryset in scatter(announcements)
+        ])
         return render(request=request,
-                      template_name="category_announcements.html",
+                      template_name=self.template_name,
                       context={
-                          "category": category,
-                          "announcements": announcements,
+                          "query": query,
+                          "category_id": category_id,
+                          "announcements": page.object_list,
+                          "page": page,
                       })
 
 
-class UserAnnouncementView(LoginRequiredMixin, View):
+class AutocompleteView(View):
+    """
+    Return JSON with titles of accepted announcements and categories
+    similar to prefix given in 'q' parameter, for search suggestions.
+    """
+    read_from_replica = True
+    default_limit = 8
+    max_limit = 20
+
+    def get(self, request):
+        """
+        Handle GET requests: to return suggestions for typed prefix.
+        """
+        try:
+            limit = int(request.GET.get('limit', self.default_limit))
+        except ValueError:
+            limit = self.default_limit
+        limit = min(max(limit, 1), self.max_limit)
+        suggestions = suggest(request.GET.get('q', ''), limit)
+        response = JsonResponse({
+            'titles': suggestions['titles'],
+            'categories': [
+                {'id': category_id, 'name': name,
+                 'url': reverse('category-announcement',
+                                args=(category_id,))}
+                for category_id, name in suggestions['categories']
+            ],
+        })
+        # Suggestions are the same for every user.
+        patch_cache_control(response, public=True,
+                            max_age=settings.AUTOCOMPLETE_CACHE_TIMEOUT)
+        return response
+
+
+class UserAnnouncementView(LoginRequiredMixin, KeysetPaginationMixin, View):
     """
     Display list all announcements filter by user_who_added.
     """
@@ -62,11 +489,29 @@ class UserAnnouncementView(LoginRequiredMixin, View):
         Handle GET requests: to display user announcements list.
         """
         user = request.user
-        announcements = Announcement.objects.filter(user_who_added=user)
+        reservations = Prefetch(
+            'reservation_set',
+            queryset=related(
+                Reservation.objects.filter(announcement__status=4),
+                'reserved_by_user__profile',
+            ).order_by('id'),
+            to_attr='prefetched_reservations',
+        )
+        page = self.paginate_keyset(
+            *scatter(related(
+                Announcement.objects.filter(user_who_added=user),
+                'category',
+            ).prefetch_related(reservations)),
+            *scatter(related(
+                ArchivedAnnouncement.objects.filter(user_who_added=user),
+                'category',
+            )),
+        )
         return render(request=request,
                       template_name="user_announcements.html",
                       context={
-                          "announcements": announcements,
+                          "announcements": page.object_list,
+                          "page": page,
                           "statuses": STATUS
                       })
 
@@ -91,14 +536,19 @@ class AddAnnouncementView(LoginRequiredMixin, FormView):
         category = form.cleaned_data['category']
         user_who_added = self.request.user
         image = form.cleaned_data['image']
-        Announcement.objects.create(
-            title=title,
-            description=description,
-            price=price,
-            category=category,
-            user_who_added=user_who_added,
-            image=image,
-        )
+        region = region_for_zip(Profile.of(user_who_added).zip_code)
+        shard = shard_for_region(region)
+        with transaction.atomic(using=shard):
+            announcement = Announcement.objects.using(shard).create(
+                title=title,
+                description=description,
+                price=price,
+                category=category,
+                user_who_added=user_who_added,
+                region=region,
+                image_processing=True,
+            )
+            enqueue_image(announcement, image)
         messages.add_message(self.request, messages.SUCCESS,
                              _('Ogłoszenie zostało dodane. '
                                'Zanim pojawi się na stronie głównej musi '
@@ -108,42 +558,66 @@ class AddAnnouncementView(LoginRequiredMixin, FormView):
         return redirect_site
 
 
-class AnnouncementUpdateView(LoginRequiredMixin,
-                             UserPassesTestMixin,
-                             UpdateView):
+class AnnouncementOwnerMixin(LoginRequiredMixin, UserPassesTestMixin):
     """
-    Display view to update announcement.
+    Allow access only to user who added announcement.
     """
-    model = Announcement
-    form_class = AnnouncementForm
-    success_url = reverse_lazy('my-announcements')
-    template_name_suffix = '_update_form'
     login_url = reverse_lazy('login')
 
+    def get_queryset(self):
+        return on_shard(super().get_queryset(),
+                        shard_for_id(self.kwargs['pk']))
+
+    def get_object(self, queryset=None):
+        """
+        Return announcement, load it from database once per request
+        for both permission check and the view itself.
+        """
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
     def test_func(self):
         """
-        Check if request user is user who added announcement to update
+        Check if request user is user who added announcement
         """
         obj = self.get_object()
-        return obj.user_who_added == self.request.user
+        return obj.user_who_added_id == self.request.user.id
 
 
-class AnnouncementDeleteView(LoginRequiredMixin,
-                             UserPassesTestMixin,
-                             DeleteView):
+class AnnouncementUpdateView(AnnouncementOwnerMixin, UpdateView):
     """
-    View to delete announcement.
+    Display view to update announcement.
     """
     model = Announcement
+    form_class = AnnouncementForm
     success_url = reverse_lazy('my-announcements')
-    login_url = reverse_lazy('login')
+    template_name_suffix = '_update_form'
 
-    def test_func(self):
+    def form_valid(self, form):
         """
-        Check if request user is user who added announcement to delete
+        Save announcement, new image is uploaded by background worker,
+        until then the previous one is displayed.
         """
-        obj = self.get_object()
-        return obj.user_who_added == self.request.user
+        if 'image' not in form.changed_data:
+            return super().form_valid(form)
+        upload = form.cleaned_data['image']
+        form.instance.image = form.initial['image']
+        form.instance.image_processing = True
+        with transaction.atomic(using=self.object._state.db):
+            response = super().form_valid(form)
+            enqueue_image(self.object, upload)
+        return response
+
+
+class AnnouncementDeleteView(AnnouncementOwnerMixin, DeleteView):
+    """
+    View to delete announcement.
+    """
+    model = Announcement
+    success_url = reverse_lazy('my-announcements')
 
 
 class LoginView(View):
@@ -186,11 +660,52 @@ class LoginView(View):
         return render(request, 'login_form.html', context)
 
 
-class AnnouncementDetailView(DetailView):
+class AnnouncementDetailView(ConditionalGetMixin, DetailView):
     """
     Display view single announcement.
     """
-    model = Announcement
+    read_from_replica = True
+    # Also used for archived announcements.
+    template_name = 'craigslist/announcement_detail.html'
+
+    def get(self, request, *args, **kwargs):
+        """
+        Handle GET requests: to display announcement.
+        """
+        not_modified = self.conditional_get()
+        if not_modified is not None:
+            return not_modified
+        return self.add_validators(super().get(request, *args, **kwargs))
+
+    def on_shard(self, queryset):
+        """
+        Return queryset reading from shard of announcement.
+        """
+        return on_shard(queryset, shard_for_id(self.kwargs['pk']))
+
+    def get_queryset(self):
+        return self.on_shard(related(Announcement.objects.all(),
+                                     'user_who_added', 'category'))
+
+    def get_object(self, queryset=None):
+        """
+        Return announcement, look for it in archive if it was moved.
+        """
+        try:
+            return super().get_object(queryset)
+        except Http404:
+            return super().get_object(self.on_shard(
+                related(ArchivedAnnouncement.objects.all(),
+                        'user_who_added', 'category')
+            ))
+
+    def get_validator_rows(self):
+        return self.on_shard(Announcement.objects.filter(
+            pk=self.kwargs['pk']
+        )).values_list('id', 'updated_at').union(
+            ArchivedAnnouncement.objects.filter(pk=self.kwargs['pk']).
+            values_list('id', 'updated_at')
+        )
 
 
 class LogoutView(View):
@@ -222,10 +737,12 @@ class RegisterUserView(FormView):
         """
         username = form.cleaned_data['username']
         password = form.cleaned_data['password']
-        AppUser.objects.create_user(
-            username=username,
-            password=password
-        )
+        # Profile is created by post_save signal in the same transaction.
+        with transaction.atomic():
+            AppUser.objects.create_user(
+                username=username,
+                password=password
+            )
         redirect_site = super().form_valid(form)
         messages.add_message(self.request, messages.SUCCESS,
                              _('Zostałeś zarejestrowany! '
@@ -244,7 +761,7 @@ class UserProfileView(LoginRequiredMixin, View):
         Handle GET requests: to display user profile.
         """
         user_form = UserForm(instance=request.user)
-        profile_form = ProfileForm(instance=request.user.profile)
+        profile_form = ProfileForm(instance=Profile.of(request.user))
         return render(request, 'profile.html', {
             'user_form': user_form,
             'profile_form': profile_form
@@ -255,7 +772,8 @@ class UserProfileView(LoginRequiredMixin, View):
         Handle POST requests: to update user profile.
         """
         user_form = UserForm(request.POST, instance=request.user)
-        profile_form = ProfileForm(request.POST, instance=request.user.profile)
+        profile_form = ProfileForm(request.POST,
+                                   instance=Profile.of(request.user))
         if user_form.is_valid() and profile_form.is_valid():
             user_form.save()
             profile_form.save()
@@ -265,7 +783,7 @@ class UserProfileView(LoginRequiredMixin, View):
         else:
             messages.add_message(request, messages.WARNING,
                                  _('Popraw błędy w formularzu'))
-        profile_form = ProfileForm(instance=request.user.profile)
+        profile_form = ProfileForm(instance=Profile.of(request.user))
         return render(request, 'profile.html', {
             'user_form': user_form,
             'profile_form': profile_form
@@ -282,16 +800,16 @@ class ReservationCreateView(LoginRequiredMixin, View):
         """
         Handle POST requests: to create new reservation object.
         """
-        announcement_id = request.POST['announcement_id']
-
-        announcement = Announcement.objects.get(pk=announcement_id)
-        announcement.status = 4
-        announcement.save()
-
-        Reservation.objects.create(
-            announcement=announcement,
-            reserved_by_user=self.request.user,
-        )
+        announcement_id = request.POST.get('announcement_id', '')
+        reservation = None
+        if announcement_id.isdigit():
+            reservation = Announcement.objects.reserve(announcement_id,
+                                                       request.user)
+        if reservation is None:
+            messages.add_message(request, messages.WARNING,
+                                 _('Przedmiot nie jest już dostępny '
+                                   'do rezerwacji'))
+            return redirect('index')
 
         messages.add_message(request, messages.SUCCESS,
                              _('Przedmiot zarezerwowany u sprzedającego! '
@@ -306,18 +824,33 @@ class UserReservationsView(LoginRequiredMixin, View):
     Display list all announcements filter by reserved_by_user.
     """
     login_url = reverse_lazy('login')
+    template_name = "user_reservations.html"
 
     def get(self, request):
         """
         Handle GET requests: to display user reservations list.
         """
-        user = request.user
-        reservations = Reservation.objects.filter(reserved_by_user=user)
         return render(request=request,
-                      template_name="user_reservations.html",
-                      context={
-                          "reservations": reservations
-                      })
+                      template_name=self.template_name,
+                      context=self.get_context(request.user))
+
+    def get_context(self, user):
+        """
+        Return reservations of user with announcement and seller data,
+        archived ones after current ones.
+        """
+        reservations = related(
+            Reservation.objects.filter(reserved_by_user=user),
+            'announcement__user_who_added__profile',
+        )
+        archived = related(
+            ArchivedReservation.objects.filter(reserved_by_user=user),
+            'announcement__user_who_added__profile',
+        )
+        return {
+            "reservations": itertools.chain(*scatter(reservations),
+                                            *scatter(archived))
+        }
 
 
 class TransactionCreateView(LoginRequiredMixin, View):
@@ -330,17 +863,91 @@ class TransactionCreateView(LoginRequiredMixin, View):
         """
         Handle POST requests: to create new transaction object.
         """
-        announcement_id = request.POST['announcement_id']
-        announcement = Announcement.objects.get(pk=announcement_id)
-        announcement.status = 5
-        announcement.save()
-
-        Transaction.objects.create(
-            seller=announcement.user_who_added,
-            buyer=self.request.user,
-        )
+        announcement_id = request.POST.get('announcement_id', '')
+        purchase = None
+        if announcement_id.isdigit():
+            purchase = Announcement.objects.confirm_purchase(
+                announcement_id, request.user
+            )
+        if purchase is None:
+            messages.add_message(request, messages.WARNING,
+                                 _('Nie możesz potwierdzić otrzymania '
+                                   'tego przedmiotu'))
+            return redirect('my-reservations')
 
         messages.add_message(request, messages.SUCCESS,
                              _('Potwierdziłeś otrzymanie przedmiotu. '
                                'Dziękujemy za skorzystanie z serwisu'))
         return redirect('index')
+
+
+class ModerationQueueView(LoginRequiredMixin, UserPassesTestMixin, View):
+    """
+    Hand staff member a batch of new announcements to accept or reject.
+    Every moderator gets different announcements, claimed for lease
+    time, so moderators working at once do not review the same ones.
+    """
+    login_url = reverse_lazy('login')
+    template_name = "moderation_queue.html"
+    batch_size = 10
+    lease_seconds = 10 * 60
+    decisions = {'accept': 2, 'reject': 3}
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request):
+        """
+        Handle GET requests: claim and display batch of announcements.
+        """
+        claimed = Announcement.objects.claim_for_moderation(
+            request.user, self.batch_size, self.lease_seconds
+        )
+        announcements = sorted(
+            itertools.chain.from_iterable(
+                on_shard(related(Announcement.objects.filter(pk__in=ids),
+                                 'category', 'user_who_added'), shard)
+                for shard, ids in shards_of_ids(claimed).items()
+            ),
+            key=lambda announcement: (announcement.created_at,
+                                      announcement.id),
+        )
+        return render(request=request,
+                      template_name=self.template_name,
+                      context={"announcements": announcements})
+
+    def post(self, request):
+        """
+        Handle POST requests: accept or reject claimed announcement.
+        """
+        announcement_id = request.POST.get('announcement_id', '')
+        to_status = self.decisions.get(request.POST.get('decision'))
+        moderated = False
+        if announcement_id.isdigit() and to_status is not None:
+            moderated = Announcement.objects.moderate(
+                announcement_id, request.user, to_status
+            )
+        if moderated:
+            messages.add_message(request, messages.SUCCESS,
+                                 _('Zmieniono status ogłoszenia na "{}"').
+                                 format(dict(STATUS)[to_status]))
+        else:
+            messages.add_message(request, messages.WARNING,
+                                 _('Ogłoszenie zostało już ocenione '
+                                   'lub przydzielone innemu moderatorowi'))
+        return redirect('moderation-queue')
+
+
+class MetricsView(View):
+    """
+    Expose application metrics in Prometheus text format to scraper
+    from allowed address or with metrics token.
+    """
+    def get(self, request):
+        """
+        Handle GET requests: to return metrics of all workers.
+        """
+        if not is_allowed(request):
+            raise Http404
+        content, content_type = export()
+        return HttpResponse(content, content_type=content_type)
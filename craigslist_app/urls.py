@@ -23,7 +23,19 @@ from craigslist.views import AnnouncementListView, \
     AddAnnouncementView, CategoryAnnouncementView, LoginView, LogoutView,\
     RegisterUserView, UserAnnouncementView, AnnouncementUpdateView, \
     AnnouncementDeleteView, UserProfileView, AnnouncementDetailView, \
-    ReservationCreateView, UserReservationsView, TransactionCreateView
+    ReservationCreateView, UserReservationsView, TransactionCreateView, \
+    ModerationQueueView, MetricsView, SearchView, AutocompleteView, \
+    RegionAnnouncementView
+from craigslist.async_views import AsyncAnnouncementListView, \
+    AsyncCategoryAnnouncementView, AsyncAnnouncementDetailView, \
+    AsyncUserReservationsView
+
+# Read-heavy views have async versions used when served by ASGI.
+if settings.ASYNC_VIEWS:
+    AnnouncementListView = AsyncAnnouncementListView  # noqa: F811
+    CategoryAnnouncementView = AsyncCategoryAnnouncementView  # noqa: F811
+    AnnouncementDetailView = AsyncAnnouncementDetailView  # noqa: F811
+    UserReservationsView = AsyncUserReservationsView  # noqa: F811
 
 urlpatterns = [
     path('admin/', admin.site.urls),
@@ -40,6 +52,11 @@ urlpatterns = [
          name="delete-announcement"),
     path('category/<int:category_id>', CategoryAnnouncementView.as_view(),
          name="category-announcement"),
+    path('region/<int:region>', RegionAnnouncementView.as_view(),
+         name="region-announcement"),
+    path('search/', SearchView.as_view(), name="search"),
+    path('search/autocomplete', AutocompleteView.as_view(),
+         name="autocomplete"),
     path('my-announcements', UserAnnouncementView.as_view(),
          name="my-announcements"),
     path('login/', LoginView.as_view(), name="login"),
@@ -51,4 +68,7 @@ urlpatterns = [
     path('my-reservations/', UserReservationsView.as_view(),
          name="my-reservations"),
     path('confirm/', TransactionCreateView.as_view(), name="confirm"),
+    path('moderation/', ModerationQueueView.as_view(),
+         name="moderation-queue"),
+    path('metrics', MetricsView.as_view(), name="metrics"),
 ] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
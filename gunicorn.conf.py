@@ -0,0 +1,28 @@
+import os
+import shutil
+
+# Workers write metrics to files in this directory, /metrics endpoint
+# aggregates them. Must be set before prometheus_client is imported.
+os.environ.setdefault('PROMETHEUS_MULTIPROC_DIR', '/tmp/prometheus')
+
+# Web requests are cancelled after this many milliseconds in database,
+# migrations and management commands run without the limit.
+os.environ.setdefault('DATABASE_STATEMENT_TIMEOUT_MS', '5000')
+
+
+def on_starting(server):
+    """
+    Remove metrics files left by previous run of the server.
+    """
+    directory = os.environ['PROMETHEUS_MULTIPROC_DIR']
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    """
+    Drop live metrics of worker which exited.
+    """
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid)